@@ -1,15 +1,16 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status, Request
+from typing import AsyncGenerator, Generator, Optional
+from fastapi import Depends, HTTPException, status, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from slowapi import Limiter
-from slowapi.util import get_remote_address
+from app.core.metrics import StageTimer
 from app.core.config import settings
+from app.core.database import get_async_session_factory, get_session_factory
+from app.services.api_key_cache import CachedAPIKey, Principal
 from app.services.auth_service import AuthService
-from app.models.database import User, APIKey
-
-# Rate limiter
-limiter = Limiter(key_func=get_remote_address)
+from app.services.quota_service import QuotaExceeded, QuotaPlan, quota_service
+from app.services.rate_limiter import rate_limiter
+from app.models.database import User
 
 # Security
 security = HTTPBearer()
@@ -18,10 +19,31 @@ security = HTTPBearer()
 auth_service = AuthService()
 
 
-def get_db() -> Generator:
-    """Database dependency - this would be implemented with actual DB session"""
-    # Placeholder - in real implementation, this would create a DB session
-    yield None
+def get_db() -> Generator[Session, None, None]:
+    """Database session dependency, one pooled session per request"""
+    db = get_session_factory()()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Async database session dependency for the request hot path"""
+    async with get_async_session_factory()() as db:
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+
+
+def get_stage_timer() -> StageTimer:
+    """Per-request stage timer, shared by the auth, rate limit and quota dependencies and the endpoint"""
+    return StageTimer()
 
 
 def get_current_user(
@@ -54,11 +76,12 @@ def get_current_user(
     return user
 
 
-def get_api_key_user(
+async def get_api_key_user(
     request: Request,
-    db: Session = Depends(get_db)
-) -> tuple[User, APIKey]:
-    """Get user from API key"""
+    db: AsyncSession = Depends(get_async_db),
+    timer: StageTimer = Depends(get_stage_timer)
+) -> Principal:
+    """Get a (user, key) snapshot from the API key"""
     api_key = request.headers.get("X-API-Key")
     if not api_key:
         raise HTTPException(
@@ -67,16 +90,17 @@ def get_api_key_user(
             headers={"WWW-Authenticate": "API-Key"},
         )
     
-    db_key = auth_service.verify_api_key(api_key, db)
-    if not db_key:
+    with timer.stage("auth"):
+        principal = await auth_service.authenticate_api_key_async(api_key, db)
+    if not principal:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key",
             headers={"WWW-Authenticate": "API-Key"},
         )
     
-    user = auth_service.get_user_by_id(db, db_key.user_id)
-    if not user or not user.is_active:
+    user, db_key = principal
+    if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User account is inactive",
@@ -86,11 +110,49 @@ def get_api_key_user(
     return user, db_key
 
 
-def check_rate_limit(
-    request: Request,
-    user: User = Depends(get_api_key_user)
+async def charge_rate_limit(response: Response, api_key: CachedAPIKey, timer: StageTimer, cost: int = 1) -> None:
+    """Take `cost` requests from the key's minute and hour limits, or refuse them all with a 429"""
+    with timer.stage("rate_limit"):
+        result = await rate_limiter.hit(str(api_key.id), cost)
+    if not result.allowed:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers=result.headers(),
+        )
+    response.headers.update(result.headers())
+
+
+async def check_rate_limit(
+    response: Response,
+    user_and_key: Principal = Depends(get_api_key_user),
+    timer: StageTimer = Depends(get_stage_timer)
 ) -> None:
-    """Check rate limits for API usage"""
-    # This would implement actual rate limiting logic
-    # For now, just a placeholder
-    pass 
\ No newline at end of file
+    """Enforce per-API-key minute and hour limits"""
+    _, api_key = user_and_key
+    await charge_rate_limit(response, api_key, timer)
+
+
+async def check_quota(
+    response: Response,
+    user_and_key: Principal = Depends(get_api_key_user),
+    timer: StageTimer = Depends(get_stage_timer)
+) -> AsyncGenerator[QuotaPlan, None]:
+    """Reserve one solve from the user's subscription quota, giving it back if the request fails"""
+    user, _ = user_and_key
+    try:
+        with timer.stage("quota"):
+            plan, used = await quota_service.reserve(user.id)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e),
+        )
+    response.headers["X-Quota-Limit"] = str(plan.solves_limit)
+    response.headers["X-Quota-Remaining"] = str(max(plan.solves_limit - used, 0))
+    try:
+        yield plan
+    except Exception:
+        # Also reached by 422s, which FastAPI raises after dependencies have run
+        await quota_service.release(plan)
+        raise
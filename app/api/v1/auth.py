@@ -4,6 +4,7 @@ from app.models.schemas import CreateUserRequest, CreateAPIKeyRequest, APIKeyRes
 from app.services.auth_service import AuthService
 from app.api.deps import get_db, get_current_user
 from app.models.database import User
+from app.services.api_key_cache import api_key_cache
 
 router = APIRouter(prefix="/auth", tags=["authentication"])
 
@@ -27,8 +28,7 @@ async def register_user(
     # Create user
     user = auth_service.create_user(db, user_data.email, user_data.password)
     
-    # Create free subscription
-    # This would be implemented with actual subscription logic
+    # The free subscription is created on first use by the quota service
     
     return {
         "message": "User created successfully",
@@ -94,4 +94,22 @@ async def list_api_keys(
     """List all API keys for the current user"""
     # This would fetch API keys from database
     # For now, return empty list
-    return [] 
\ No newline at end of file
+    return []
+
+
+@router.delete("/keys/{key_id}")
+async def revoke_api_key(
+    key_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Revoke one of the current user's API keys"""
+    db_key = auth_service.revoke_api_key(db, current_user.id, key_id)
+    if not db_key:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="API key not found"
+        )
+
+    await api_key_cache.invalidate_everywhere(db_key.key_hash)
+    return {"message": "API key revoked", "id": db_key.id}
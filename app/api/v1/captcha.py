@@ -1,14 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request
-from fastapi.responses import JSONResponse
-from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import ValidationError
+from fastapi.encoders import jsonable_encoder
+from datetime import datetime
+from typing import Callable, List, Optional, Set
+import asyncio
 import base64
 import io
-from app.models.schemas import SolveCaptchaRequest, SolveCaptchaResponse, CaptchaType
-from app.services.gemini_service import GeminiService
-from app.api.deps import get_api_key_user, check_rate_limit
-from app.models.database import User, APIKey, UsageRecord
-from sqlalchemy.orm import Session
-from app.api.deps import get_db
+from app.models.schemas import (
+    SolveCaptchaRequest, SolveCaptchaResponse, CaptchaType,
+    SolveBatchRequest, SolveBatchItemResponse, SolveBatchResponse,
+    SolveMode, SolveTaskResponse
+)
+from app.core.config import settings
+from app.core.metrics import StageTimer
+from app.services.gemini_service import GeminiService, SolveResult
+from app.services.image_validation import ImageRejected, read_upload
+from app.api.deps import get_api_key_user, get_stage_timer, charge_rate_limit, check_rate_limit, check_quota
+from app.services.batch_solver import BatchItem, BatchOutcome, run_batch
+from app.services.quota_service import QuotaExceeded, QuotaPlan, quota_service
+from app.services.task_events import TaskEventBroker
+from app.services.task_queue import QueueFull, TaskQueue
+from app.services.api_key_cache import CachedAPIKey, CachedUser, Principal
+from app.services.usage_recorder import usage_recorder
 
 router = APIRouter(prefix="/solve", tags=["captcha"])
 
@@ -16,11 +31,135 @@ router = APIRouter(prefix="/solve", tags=["captcha"])
 gemini_service = GeminiService()
 
 
-@router.post("/", response_model=SolveCaptchaResponse)
+async def _finish_solve(
+    result: SolveResult,
+    quota_plan: QuotaPlan,
+    user_id: int,
+    api_key_id: int,
+    captcha_type: str
+) -> SolveCaptchaResponse:
+    """Refund failed solves, record usage and build the response"""
+    # Failed solves don't count against the quota
+    if not result.success:
+        await quota_service.release(quota_plan)
+
+    # Record usage (flushed in the background)
+    usage_recorder.record(
+        user_id=user_id,
+        api_key_id=api_key_id,
+        captcha_type=captcha_type,
+        success=result.success,
+        response_time_ms=result.processing_time_ms
+    )
+
+    if result.success:
+        return SolveCaptchaResponse(
+            success=True,
+            solved_text=result.solved_text,
+            confidence=result.confidence,
+            processing_time_ms=result.processing_time_ms,
+            cached=result.cached,
+            timings=result.timings
+        )
+    return SolveCaptchaResponse(
+        success=False,
+        error_message=result.error or "Failed to solve CAPTCHA",
+        processing_time_ms=result.processing_time_ms,
+        timings=result.timings
+    )
+
+
+async def _run_solve_task(payload: dict, blob: Optional[bytes]) -> dict:
+    """Worker side of mode=async: solve, settle quota and usage, return the response body"""
+    plan = payload["quota_plan"]
+    quota_plan = QuotaPlan(**{
+        **plan,
+        "period_start": datetime.fromisoformat(plan["period_start"]),
+        "period_end": datetime.fromisoformat(plan["period_end"]),
+    })
+    try:
+        result = await gemini_service.solve_captcha(
+            image_data=blob,
+            image_url=payload.get("image_url"),
+            image_base64=payload.get("image_base64"),
+            captcha_type=payload["captcha_type"],
+            timeout_ms=payload.get("timeout_ms")
+        )
+    except ImageRejected:
+        await quota_service.release(quota_plan)
+        raise
+    response = await _finish_solve(result, quota_plan, payload["user_id"], payload["api_key_id"], payload["captcha_type"])
+    return response.model_dump()
+
+
+solve_task_events = TaskEventBroker("solve", max_pending=settings.task_stream_max_pending)
+solve_tasks = TaskQueue(
+    "solve",
+    handler=_run_solve_task,
+    max_queue=settings.task_queue_max_size,
+    result_ttl_seconds=settings.task_result_ttl_seconds,
+    events=solve_task_events,
+    max_queue_bytes=settings.task_queue_max_bytes,
+    running_timeout_seconds=settings.solve_max_timeout_ms / 1000,
+)
+
+
+def task_response(task: dict) -> SolveTaskResponse:
+    """API view of a stored task"""
+    def timestamp(value: Optional[float]) -> Optional[datetime]:
+        return datetime.utcfromtimestamp(value) if value is not None else None
+
+    return SolveTaskResponse(
+        task_id=task["id"],
+        status=task["status"],
+        created_at=timestamp(task["created_at"]),
+        started_at=timestamp(task["started_at"]),
+        finished_at=timestamp(task["finished_at"]),
+        result=task["result"],
+        error_message=task["error"]
+    )
+
+
+async def _enqueue_solve(
+    quota_plan: QuotaPlan,
+    user: CachedUser,
+    api_key: CachedAPIKey,
+    captcha_type: str,
+    image_data: Optional[bytes] = None,
+    image_url: Optional[str] = None,
+    image_base64: Optional[str] = None,
+    timeout_ms: Optional[int] = None,
+    headers: Optional[dict] = None
+) -> JSONResponse:
+    """Queue a solve for mode=async and answer 202 with the task id; timeout_ms counts from when a worker starts it"""
+    payload = {
+        "user_id": user.id,
+        "api_key_id": api_key.id,
+        "captcha_type": captcha_type,
+        "image_url": image_url,
+        "image_base64": image_base64,
+        "timeout_ms": timeout_ms,
+        "quota_plan": jsonable_encoder(quota_plan._asdict()),
+    }
+    try:
+        task = await solve_tasks.submit(payload, blob=image_data, owner=user.id)
+    except QueueFull:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Task queue is full, retry later")
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=jsonable_encoder(task_response(task)),
+        headers={**(headers or {}), "Location": f"/api/v1{router.prefix}/tasks/{task['id']}"}
+    )
+
+
+@router.post("/", response_model=SolveCaptchaResponse, dependencies=[Depends(check_rate_limit)])
 async def solve_captcha(
     request: Request,
-    db: Session = Depends(get_db),
-    user_and_key: tuple[User, APIKey] = Depends(get_api_key_user)
+    response: Response,
+    mode: SolveMode = Query(SolveMode.SYNC, description="async returns a task id immediately"),
+    user_and_key: Principal = Depends(get_api_key_user),
+    quota_plan: QuotaPlan = Depends(check_quota),
+    timer: StageTimer = Depends(get_stage_timer)
 ):
     """
     Solve a CAPTCHA using AI
@@ -30,30 +169,37 @@ async def solve_captcha(
     - image_base64: Base64 encoded image data
     - file: Uploaded image file
     - captcha_type: Type of CAPTCHA (text, math, image, puzzle)
+    - timeout_ms: Give up on the solve after this many milliseconds
+
+    With ?mode=async the solve is queued and 202 is returned with a task id
+    to poll at /solve/tasks/{task_id}.
     """
     user, api_key = user_and_key
     
-    # Check rate limits
-    check_rate_limit(request, user)
-    
-    # Get request data
-    form_data = await request.form()
+    # Get request data; the multipart parser spools files to disk past 1MB.
+    # check_quota gives the reserved solve back if any of this raises.
+    form_data = await request.form(
+        max_files=1,
+        max_fields=10,
+        max_part_size=settings.max_request_body_size
+    )
     
     image_data = None
     image_url = None
     image_base64 = None
     captcha_type = "text"
+    timeout_ms = None
     
     # Handle different input methods
     if "file" in form_data:
         file = form_data["file"]
         if hasattr(file, 'file'):
-            image_data = file.file.read()
+            try:
+                image_data = await read_upload(file)
+            except ImageRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=str(e))
         else:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid file upload"
-            )
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid file upload")
     elif "image_url" in form_data:
         image_url = form_data["image_url"]
     elif "image_base64" in form_data:
@@ -67,6 +213,14 @@ async def solve_captcha(
     if "captcha_type" in form_data:
         captcha_type = form_data["captcha_type"]
     
+    if "timeout_ms" in form_data:
+        try:
+            timeout_ms = int(form_data["timeout_ms"])
+            if timeout_ms <= 0:
+                raise ValueError()
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="timeout_ms must be a positive integer")
+
     # Validate captcha type
     try:
         CaptchaType(captcha_type)
@@ -76,55 +230,44 @@ async def solve_captcha(
             detail=f"Invalid captcha_type. Must be one of: {[t.value for t in CaptchaType]}"
         )
     
-    # Solve CAPTCHA
-    success, solved_text, confidence, processing_time = await gemini_service.solve_captcha(
-        image_data=image_data,
-        image_url=image_url,
-        image_base64=image_base64,
-        captcha_type=captcha_type
-    )
-    
-    # Record usage
-    usage_record = UsageRecord(
-        user_id=user.id,
-        api_key_id=api_key.id,
-        captcha_type=captcha_type,
-        success=success,
-        response_time_ms=processing_time
-    )
-    db.add(usage_record)
-    db.commit()
-    
-    # Return response
-    if success:
-        return SolveCaptchaResponse(
-            success=True,
-            solved_text=solved_text,
-            confidence=confidence,
-            processing_time_ms=processing_time
+    if mode == SolveMode.ASYNC:
+        return await _enqueue_solve(
+            quota_plan, user, api_key, captcha_type,
+            image_data=image_data, image_url=image_url, image_base64=image_base64,
+            timeout_ms=timeout_ms, headers=dict(response.headers)
         )
-    else:
-        return SolveCaptchaResponse(
-            success=False,
-            error_message="Failed to solve CAPTCHA",
-            processing_time_ms=processing_time
+
+    # Solve CAPTCHA
+    try:
+        result = await gemini_service.solve_captcha(
+            image_data=image_data,
+            image_url=image_url,
+            image_base64=image_base64,
+            captcha_type=captcha_type,
+            timer=timer,
+            timeout_ms=timeout_ms
         )
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    response.headers["Server-Timing"] = timer.server_timing()
+    return await _finish_solve(result, quota_plan, user.id, api_key.id, captcha_type)
 
 
-@router.post("/url", response_model=SolveCaptchaResponse)
+@router.post("/url", response_model=SolveCaptchaResponse, dependencies=[Depends(check_rate_limit)])
 async def solve_captcha_url(
     request: SolveCaptchaRequest,
-    db: Session = Depends(get_db),
-    user_and_key: tuple[User, APIKey] = Depends(get_api_key_user)
+    response: Response,
+    mode: SolveMode = Query(SolveMode.SYNC, description="async returns a task id immediately"),
+    user_and_key: Principal = Depends(get_api_key_user),
+    quota_plan: QuotaPlan = Depends(check_quota),
+    timer: StageTimer = Depends(get_stage_timer)
 ):
     """
     Solve CAPTCHA from URL or base64 data (JSON endpoint)
     """
     user, api_key = user_and_key
     
-    # Check rate limits
-    check_rate_limit(request, user)
-    
     # Validate input
     if not request.image_url and not request.image_base64:
         raise HTTPException(
@@ -132,35 +275,211 @@ async def solve_captcha_url(
             detail="Either image_url or image_base64 must be provided"
         )
     
+    if mode == SolveMode.ASYNC:
+        return await _enqueue_solve(
+            quota_plan, user, api_key, request.captcha_type.value,
+            image_url=request.image_url, image_base64=request.image_base64,
+            timeout_ms=request.timeout_ms, headers=dict(response.headers)
+        )
+
     # Solve CAPTCHA
-    success, solved_text, confidence, processing_time = await gemini_service.solve_captcha(
-        image_url=request.image_url,
-        image_base64=request.image_base64,
-        captcha_type=request.captcha_type.value
-    )
+    try:
+        result = await gemini_service.solve_captcha(
+            image_url=request.image_url,
+            image_base64=request.image_base64,
+            captcha_type=request.captcha_type.value,
+            timer=timer,
+            timeout_ms=request.timeout_ms
+        )
+    except ImageRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     
-    # Record usage
-    usage_record = UsageRecord(
-        user_id=user.id,
-        api_key_id=api_key.id,
-        captcha_type=request.captcha_type.value,
-        success=success,
-        response_time_ms=processing_time
-    )
-    db.add(usage_record)
-    db.commit()
+    response.headers["Server-Timing"] = timer.server_timing()
+    return await _finish_solve(result, quota_plan, user.id, api_key.id, request.captcha_type.value)
+
+
+@router.get("/tasks/{task_id}", response_model=SolveTaskResponse)
+async def get_solve_task(
+    task_id: str,
+    wait: float = Query(0, ge=0, description="Seconds to long-poll for the task to finish"),
+    user_and_key: Principal = Depends(get_api_key_user)
+):
+    """
+    Status and result of a mode=async solve
     
-    # Return response
-    if success:
-        return SolveCaptchaResponse(
+    With wait > 0 the request is held until the task finishes or the wait
+    (capped at TASK_MAX_WAIT_SECONDS) runs out.
+    """
+    user, _ = user_and_key
+    wait = min(wait, settings.task_max_wait_seconds)
+    task = await solve_tasks.wait(task_id, wait) if wait else await solve_tasks.get(task_id)
+    if task is None or task["owner"] != user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Task not found")
+    return task_response(task)
+
+
+# Running batches, kept referenced so a client disconnect can't drop their accounting
+_batches: Set[asyncio.Task] = set()
+
+
+def _batch_item_response(outcome: BatchOutcome) -> SolveBatchItemResponse:
+    result = outcome.result
+    if result.success:
+        return SolveBatchItemResponse(
+            index=outcome.index,
             success=True,
-            solved_text=solved_text,
-            confidence=confidence,
-            processing_time_ms=processing_time
+            solved_text=result.solved_text,
+            confidence=result.confidence,
+            processing_time_ms=result.processing_time_ms,
+            cached=result.cached,
+            timings=result.timings
         )
-    else:
-        return SolveCaptchaResponse(
-            success=False,
-            error_message="Failed to solve CAPTCHA",
-            processing_time_ms=processing_time
-        ) 
\ No newline at end of file
+    return SolveBatchItemResponse(
+        index=outcome.index,
+        success=False,
+        error_message=outcome.error or result.error or "Failed to solve CAPTCHA",
+        processing_time_ms=result.processing_time_ms,
+        timings=result.timings
+    )
+
+
+async def _parse_batch(request: Request) -> List[BatchItem]:
+    """Batch items from a JSON body or from multipart file parts"""
+    content_type = request.headers.get("content-type", "")
+    if not content_type.startswith("multipart/form-data"):
+        try:
+            batch = SolveBatchRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        return [
+            BatchItem(
+                captcha_type=item.captcha_type.value,
+                image_url=item.image_url,
+                image_base64=item.image_base64,
+                timeout_ms=item.timeout_ms,
+                error=None if item.image_url or item.image_base64
+                else "Either image_url or image_base64 must be provided"
+            )
+            for item in batch.items
+        ]
+
+    # Multipart: repeated `file` parts, with one captcha_type per file or one for all,
+    # and an optional timeout_ms applied to each item
+    form_data = await request.form(
+        max_files=settings.batch_max_items + 1,
+        max_fields=settings.batch_max_items + 2,
+        max_part_size=settings.max_request_body_size
+    )
+    files = [part for part in form_data.getlist("file") if hasattr(part, "file")]
+    captcha_types = form_data.getlist("captcha_type") or ["text"]
+    if len(captcha_types) == 1:
+        captcha_types = captcha_types * len(files)
+    if len(captcha_types) != len(files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide one captcha_type per file, or a single captcha_type for all files"
+        )
+    timeout_ms = form_data.get("timeout_ms")
+    if timeout_ms is not None:
+        if not isinstance(timeout_ms, str) or not timeout_ms.isdigit() or int(timeout_ms) <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="timeout_ms must be a positive integer")
+        timeout_ms = int(timeout_ms)
+
+    items = []
+    for file, captcha_type in zip(files, captcha_types):
+        try:
+            CaptchaType(captcha_type)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid captcha_type. Must be one of: {[t.value for t in CaptchaType]}"
+            )
+        try:
+            items.append(BatchItem(
+                captcha_type=captcha_type,
+                image_data=await read_upload(file),
+                timeout_ms=timeout_ms
+            ))
+        except ImageRejected as e:
+            items.append(BatchItem(captcha_type=captcha_type, error=str(e)))
+    return items
+
+
+async def _run_and_settle(
+    items: List[BatchItem],
+    quota_plan: QuotaPlan,
+    user: CachedUser,
+    api_key: CachedAPIKey,
+    on_outcome: Optional[Callable[[BatchOutcome], None]] = None
+) -> List[BatchOutcome]:
+    """Solve a batch, then settle quota and usage for the whole batch at once"""
+    outcomes = await run_batch(gemini_service, items, settings.batch_max_concurrency, on_outcome)
+
+    # Only successful solves are billed; rejected items aren't recorded either
+    succeeded = sum(1 for outcome in outcomes if outcome.result.success)
+    await quota_service.release(quota_plan, len(items) - succeeded)
+    usage_recorder.record_many(user.id, api_key.id, [
+        (outcome.captcha_type, outcome.result.success, outcome.result.processing_time_ms)
+        for outcome in outcomes
+        if outcome.error is None
+    ])
+    return outcomes
+
+
+@router.post("/batch", response_model=SolveBatchResponse)
+async def solve_captcha_batch(
+    request: Request,
+    response: Response,
+    stream: bool = Query(False, description="Stream results as NDJSON in completion order"),
+    user_and_key: Principal = Depends(get_api_key_user),
+    timer: StageTimer = Depends(get_stage_timer)
+):
+    """
+    Solve many CAPTCHAs in one request
+
+    Accepts a JSON body of {"items": [{image_url | image_base64, captcha_type}, ...]}
+    or multipart form data with repeated `file` parts and `captcha_type` fields.
+    Every item counts against the rate limit and reserves quota, all or nothing.
+    """
+    user, api_key = user_and_key
+    items = await _parse_batch(request)
+    if not items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Batch is empty")
+    if len(items) > settings.batch_max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds maximum of {settings.batch_max_items} items"
+        )
+
+    await charge_rate_limit(response, api_key, timer, len(items))
+    try:
+        with timer.stage("quota"):
+            quota_plan, used = await quota_service.reserve(user.id, len(items))
+    except QuotaExceeded as e:
+        raise HTTPException(status_code=status.HTTP_402_PAYMENT_REQUIRED, detail=str(e))
+    response.headers["X-Quota-Limit"] = str(quota_plan.solves_limit)
+    response.headers["X-Quota-Remaining"] = str(max(quota_plan.solves_limit - used, 0))
+
+    outcomes: "asyncio.Queue[BatchOutcome]" = asyncio.Queue()
+    task = asyncio.create_task(
+        _run_and_settle(items, quota_plan, user, api_key, outcomes.put_nowait if stream else None)
+    )
+    _batches.add(task)
+    task.add_done_callback(_batches.discard)
+
+    if stream:
+        async def lines():
+            for _ in range(len(items)):
+                outcome = await outcomes.get()
+                yield _batch_item_response(outcome).model_dump_json() + "\n"
+
+        # Per-item stage timings are in each line; the header covers the request up to here
+        response.headers["Server-Timing"] = timer.server_timing()
+        streaming = StreamingResponse(lines(), media_type="application/x-ndjson")
+        streaming.headers.update(response.headers)
+        return streaming
+
+    results = [_batch_item_response(outcome) for outcome in await asyncio.shield(task)]
+    response.headers["Server-Timing"] = timer.server_timing()
+    succeeded = sum(1 for result in results if result.success)
+    return SolveBatchResponse(results=results, succeeded=succeeded, failed=len(results) - succeeded)
@@ -0,0 +1,68 @@
+import asyncio
+import json
+from typing import Optional
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.api.deps import get_api_key_user, get_async_db
+from app.api.v1.captcha import solve_task_events, task_response
+from app.services.api_key_cache import Principal
+
+router = APIRouter(prefix="/solve", tags=["captcha"])
+
+
+def _sse(event: str, data: str, event_id: Optional[str] = None) -> str:
+    """Format one Server-Sent Events message"""
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {data}")
+    return "\n".join(lines) + "\n\n"
+
+
+@router.get("/events")
+async def stream_task_events(
+    user_and_key: Principal = Depends(get_api_key_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Stream results of the caller's ?mode=async solves as Server-Sent Events
+
+    Each finished task is sent as a `task` event with the same body as
+    GET /solve/tasks/{task_id}. A connection that reads too slowly loses
+    events instead of stalling the workers; it then receives a `lagged`
+    event listing the task ids it missed. The subscription starts with the
+    `retry:` line that opens the body; wait for it before submitting tasks
+    so no result finishes unseen.
+    """
+    user, _ = user_and_key
+    # Don't hold a pooled connection for the lifetime of the stream
+    await db.close()
+
+    async def events():
+        # Subscribed only once the body is being sent, so a response that is never iterated can't leak it
+        subscription = solve_task_events.subscribe(user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                dropped = subscription.take_dropped()
+                if dropped:
+                    yield _sse("lagged", json.dumps({"task_ids": dropped}))
+                try:
+                    task = await asyncio.wait_for(
+                        subscription.queue.get(),
+                        settings.task_stream_heartbeat_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("task", task_response(task).model_dump_json(), event_id=task["id"])
+        finally:
+            solve_task_events.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from app.models.schemas import UsageStatsResponse
-from app.api.deps import get_db, get_current_user
-from app.models.database import User
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models.schemas import CaptchaType, UsageHistoryResponse, UsageRecordResponse, UsageStatsResponse
+from app.api.deps import get_async_db, get_current_user
+from app.models.database import User, UsageRollup
+from app.services.quota_service import quota_service
+from app.services.usage_history import HistoryFilters, export_history, fetch_page
 
 router = APIRouter(prefix="/usage", tags=["usage"])
 
@@ -10,34 +16,84 @@ router = APIRouter(prefix="/usage", tags=["usage"])
 @router.get("/stats", response_model=UsageStatsResponse)
 async def get_usage_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get usage statistics for the current user"""
-    # This would calculate actual usage from database
-    # For now, return mock data
+    # Daily rollups keep this to one row per day, key and CAPTCHA type
+    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    result = await db.execute(
+        select(
+            func.coalesce(func.sum(UsageRollup.total_count), 0),
+            func.coalesce(func.sum(UsageRollup.success_count), 0),
+            func.coalesce(func.sum(UsageRollup.latency_sum_ms), 0),
+            func.coalesce(func.sum(
+                case((UsageRollup.bucket_start >= month_start, UsageRollup.total_count), else_=0)
+            ), 0),
+        ).where(
+            UsageRollup.user_id == current_user.id,
+            UsageRollup.granularity == "day"
+        )
+    )
+    total, successful, latency_sum, this_month = result.one()
+
+    plan = await quota_service.get_plan(current_user.id)
+    solves_used = await quota_service.current_usage(plan)
+
     return UsageStatsResponse(
-        total_solves=0,
-        successful_solves=0,
-        failed_solves=0,
-        average_response_time_ms=0.0,
-        solves_this_month=0,
-        solves_remaining=100
+        total_solves=total,
+        successful_solves=successful,
+        failed_solves=total - successful,
+        average_response_time_ms=round(latency_sum / total, 2) if total else 0.0,
+        solves_this_month=this_month,
+        solves_remaining=max(plan.solves_limit - solves_used, 0)
     )
 
 
-@router.get("/history")
+@router.get("/history", response_model=UsageHistoryResponse)
 async def get_usage_history(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    limit: int = 50,
-    offset: int = 0
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    captcha_type: Optional[CaptchaType] = None,
+    success: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
 ):
-    """Get usage history for the current user"""
-    # This would fetch actual usage records from database
-    # For now, return empty list
-    return {
-        "records": [],
-        "total": 0,
-        "limit": limit,
-        "offset": offset
-    } 
\ No newline at end of file
+    """Get usage history for the current user, newest first
+
+    Pass `next_cursor` from the previous page as `cursor` to continue.
+    """
+    filters = HistoryFilters(captcha_type.value if captcha_type else None, success, start, end)
+    try:
+        records, next_cursor = await fetch_page(db, current_user.id, filters, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return UsageHistoryResponse(
+        records=[UsageRecordResponse.model_validate(record, from_attributes=True) for record in records],
+        next_cursor=next_cursor,
+        limit=limit
+    )
+
+
+@router.get("/history/export")
+async def export_usage_history(
+    current_user: User = Depends(get_current_user),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    captcha_type: Optional[CaptchaType] = None,
+    success: Optional[bool] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+):
+    """Stream the full usage history as NDJSON or CSV"""
+    filters = HistoryFilters(captcha_type.value if captcha_type else None, success, start, end)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_history(current_user.id, filters, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="usage-history.{format}"'}
+    )
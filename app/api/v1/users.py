@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.models.schemas import UserResponse, SubscriptionResponse
 from app.api.deps import get_db, get_current_user
 from app.models.database import User
+from app.services.quota_service import quota_service
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -28,15 +29,13 @@ async def get_user_subscription(
     db: Session = Depends(get_db)
 ):
     """Get current user's subscription details"""
-    # This would fetch subscription from database
-    # For now, return a mock free subscription
-    from datetime import datetime, timedelta
+    plan = await quota_service.get_plan(current_user.id)
     
     return SubscriptionResponse(
-        id=1,
-        plan_type="free",
-        status="active",
-        solves_used=0,
-        solves_limit=100,
-        current_period_end=datetime.utcnow() + timedelta(days=30)
-    ) 
\ No newline at end of file
+        id=plan.subscription_id,
+        plan_type=plan.plan_type,
+        status=plan.status,
+        solves_used=await quota_service.current_usage(plan),
+        solves_limit=plan.solves_limit,
+        current_period_end=plan.period_end
+    )
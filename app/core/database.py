@@ -0,0 +1,126 @@
+from functools import lru_cache
+from typing import Dict, Optional
+import structlog
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+# Unique indexes that existing rows may violate, and the one-off command that fixes the rows
+INDEX_MIGRATIONS = {
+    "uq_subscriptions_user_active": "python -m app.services.quota_service dedupe-subscriptions",
+}
+
+# Async drivers used for the request hot path
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _pool_options(database_url: str) -> dict:
+    """Pool keyword arguments shared by the sync and async engines"""
+    if database_url.startswith("sqlite"):
+        # SQLite connections are cheap and file-local; pool sizing doesn't apply
+        return {"pool_pre_ping": settings.db_pool_pre_ping}
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+
+def create_db_engine(database_url: str) -> Engine:
+    """Create an engine with connection pool settings for the given database"""
+    options = _pool_options(database_url)
+    if database_url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    return create_engine(database_url, **options)
+
+
+def to_async_url(database_url: str) -> str:
+    """Swap the sync driver in a database URL for its asyncio counterpart"""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(database_url: str) -> AsyncEngine:
+    """Create an asyncio engine with the same pool settings as the sync one"""
+    return create_async_engine(to_async_url(database_url), **_pool_options(database_url))
+
+
+@lru_cache
+def get_engine() -> Engine:
+    """Process-wide engine built from settings.database_url"""
+    return create_db_engine(settings.database_url)
+
+
+@lru_cache
+def get_session_factory() -> sessionmaker:
+    """Session factory bound to the shared engine"""
+    return sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+
+
+@lru_cache
+def get_async_engine() -> AsyncEngine:
+    """Process-wide asyncio engine for the solve and auth hot paths"""
+    return create_async_db_engine(settings.database_url)
+
+
+@lru_cache
+def get_async_session_factory() -> async_sessionmaker:
+    """AsyncSession factory bound to the shared asyncio engine"""
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+def init_db() -> None:
+    """Create tables and indexes that don't exist yet"""
+    from app.models.database import Base
+    engine = get_engine()
+    if engine.dialect.name == "postgresql" and settings.usage_partitioning_enabled:
+        from app.services.usage_partitions import create_partitioned_table
+        create_partitioned_table(engine)
+    Base.metadata.create_all(bind=engine)
+    # create_all skips existing tables, so add indexes introduced since they were created
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(bind=engine, checkfirst=True)
+            except IntegrityError as e:
+                # Startup never rewrites data to make room; the operator runs the migration
+                logger.error(
+                    "Existing rows violate a unique index; it was not created",
+                    index=index.name,
+                    fix=INDEX_MIGRATIONS.get(index.name),
+                    error=str(e.orig),
+                )
+
+
+async def dispose_engines() -> None:
+    """Close pooled connections for both engines"""
+    get_engine().dispose()
+    await get_async_engine().dispose()
+
+
+def pool_status(engine: Optional[Engine] = None) -> Dict[str, float]:
+    """Connection pool utilization for an engine (the shared one by default)"""
+    pool = (engine or get_engine()).pool
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if method is not None:
+            stats[name] = method()
+    if "size" in stats and "checkedout" in stats:
+        capacity = stats["size"] + max(settings.db_max_overflow, 0)
+        stats["utilization"] = round(stats["checkedout"] / capacity, 3) if capacity else 0.0
+    return stats
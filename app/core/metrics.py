@@ -0,0 +1,137 @@
+"""
+Prometheus metrics for the solve pipeline
+
+With several uvicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty,
+writable directory before the processes start (and clear it on every
+deploy); each process then writes its samples there and /metrics
+aggregates all of them, whichever process answers the scrape.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess
+)
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+# Stages run from ~1ms (cache and auth lookups) to tens of seconds (slow model calls)
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stages that run before the captcha type is known, or across many solves, carry captcha_type=""
+STAGE_SECONDS = Histogram(
+    "captcha_stage_duration_seconds",
+    "Time spent in each stage of a solve request",
+    ["stage", "captcha_type"],
+    buckets=_BUCKETS,
+)
+SOLVE_SECONDS = Histogram(
+    "captcha_solve_duration_seconds",
+    "End-to-end solve time, from image input to answer",
+    ["captcha_type"],
+    buckets=_BUCKETS,
+)
+SOLVES = Counter(
+    "captcha_solves_total",
+    "Finished solves by outcome (success, failure, timeout or rejected)",
+    ["captcha_type", "outcome"],
+)
+CACHE_HITS = Counter(
+    "captcha_solve_cache_hits_total",
+    "Solves answered from the result cache",
+    ["captcha_type"],
+)
+BACKEND_SECONDS = Histogram(
+    "captcha_backend_duration_seconds",
+    "Time of each call to a solver backend, including failed ones",
+    ["backend", "captcha_type"],
+    buckets=_BUCKETS,
+)
+BACKEND_CALLS = Counter(
+    "captcha_backend_calls_total",
+    "Calls to each solver backend by outcome (success, failure or timeout)",
+    ["backend", "captcha_type", "outcome"],
+)
+CIRCUIT_OPENS = Counter(
+    "captcha_backend_circuit_opens_total",
+    "Times a backend's circuit breaker opened",
+    ["backend", "captcha_type"],
+)
+HEDGES = Counter(
+    "captcha_backend_hedges_total",
+    "Hedged backend calls by which call answered first (primary or hedge)",
+    ["captcha_type", "winner"],
+)
+IN_FLIGHT = Gauge(
+    "captcha_solves_in_flight",
+    "Solves currently in progress",
+    ["captcha_type"],
+    multiprocess_mode="livesum",
+)
+
+
+@contextmanager
+def stage(name: str, captcha_type: str = "") -> Iterator[None]:
+    """Observe the duration of the enclosed block as one pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name, captcha_type).observe(time.perf_counter() - started)
+
+
+class StageTimer:
+    """
+    Stage durations of one request on a monotonic clock
+
+    Each timed stage is also observed in captcha_stage_duration_seconds under
+    the timer's captcha_type, which callers set once the type is known.
+    """
+
+    def __init__(self, captcha_type: str = ""):
+        self.captcha_type = captcha_type
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as stage `name`"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name: str, seconds: float, observe: bool = True) -> None:
+        """Add time to a stage; observe=False for time already observed elsewhere"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if observe:
+            STAGE_SECONDS.labels(name, self.captcha_type).observe(seconds)
+
+    def as_ms(self) -> Dict[str, float]:
+        """Stage durations in milliseconds, in the order they ran"""
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: every stage plus the total so far"""
+        entries = [f"{name};dur={duration}" for name, duration in self.as_ms().items()]
+        entries.append(f"total;dur={round((time.perf_counter() - self.started) * 1000, 1)}")
+        return ", ".join(entries)
+
+
+def render() -> Tuple[bytes, str]:
+    """Current metrics in the Prometheus text format, summed across processes in multiprocess mode"""
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    """Drop this process's live gauges from the shared directory on shutdown"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,27 @@
+from typing import Optional
+from app.core.config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Redis is optional; features fall back to in-process state
+    aioredis = None
+
+_client: Optional["aioredis.Redis"] = None
+
+
+def get_redis() -> Optional["aioredis.Redis"]:
+    """Return the shared async Redis client, or None when Redis is disabled"""
+    global _client
+    if not settings.redis_enabled or aioredis is None:
+        return None
+    if _client is None:
+        _client = aioredis.from_url(settings.redis_url)
+    return _client
+
+
+async def close_redis() -> None:
+    """Close the shared Redis connection pool"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
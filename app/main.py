@@ -0,0 +1,95 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from fastapi.middleware.cors import CORSMiddleware
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import dispose_engines, get_async_engine, get_engine, init_db, pool_status
+from app.core.middleware import MaxBodySizeMiddleware
+from app.core.redis import close_redis
+from app.api.v1 import auth, captcha, events, usage, users
+from app.api.v1.captcha import gemini_service, solve_task_events, solve_tasks
+from app.services.api_key_cache import api_key_cache
+from app.services.capsolver_client import capsolver_client
+from app.services.image_downloader import image_downloader
+from app.services.last_used_tracker import last_used_tracker
+from app.services.quota_service import quota_service
+from app.services.solve_cache import solve_cache
+from app.services.usage_partitions import maintenance_loop
+from app.services.usage_recorder import usage_recorder
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop shared resources"""
+    init_db()
+    await api_key_cache.start()
+    await usage_recorder.start()
+    await last_used_tracker.start()
+    await quota_service.start()
+    await solve_task_events.start()
+    await solve_tasks.start(settings.task_workers if settings.task_workers_in_api else 0)
+    maintenance = asyncio.create_task(
+        maintenance_loop(get_engine(), settings.usage_maintenance_interval_hours)
+    )
+    yield
+    maintenance.cancel()
+    await solve_tasks.stop()
+    await solve_task_events.stop()
+    await quota_service.stop()
+    await last_used_tracker.stop()
+    await usage_recorder.stop()
+    await api_key_cache.stop()
+    await image_downloader.aclose()
+    await capsolver_client.aclose()
+    await close_redis()
+    await dispose_engines()
+    metrics.mark_process_dead()
+
+
+app = FastAPI(title=settings.app_name, debug=settings.debug, lifespan=lifespan)
+
+# Oversized bodies are refused while streaming, before any handler buffers them
+app.add_middleware(MaxBodySizeMiddleware, max_bytes=settings.max_request_body_size)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.allowed_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# API v1 routes
+app.include_router(auth.router, prefix="/api/v1")
+app.include_router(captcha.router, prefix="/api/v1")
+app.include_router(events.router, prefix="/api/v1")
+app.include_router(users.router, prefix="/api/v1")
+app.include_router(usage.router, prefix="/api/v1")
+
+
+@app.get("/health", tags=["health"])
+async def health():
+    """Liveness check with pool and cache counters"""
+    return {
+        "status": "ok",
+        "db_pool": pool_status(),
+        "async_db_pool": pool_status(get_async_engine().sync_engine),
+        "api_key_cache": api_key_cache.stats(),
+        "api_key_last_used": last_used_tracker.stats(),
+        "usage_recorder": usage_recorder.stats(),
+        "quota": quota_service.stats(),
+        "solve_cache": solve_cache.stats(),
+        "coalescing": gemini_service.coalescing_stats(),
+        "solvers": gemini_service.router.stats(),
+        "tasks": solve_tasks.stats(),
+        "task_events": solve_task_events.stats(),
+    }
+
+
+if settings.metrics_enabled:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus scrape endpoint"""
+        body, content_type = metrics.render()
+        return Response(content=body, media_type=content_type)
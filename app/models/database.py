@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, Float
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Boolean, Text, ForeignKey, Float, UniqueConstraint, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -42,8 +42,13 @@ class APIKey(Base):
 
 class UsageRecord(Base):
     __tablename__ = "usage_records"
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        Index("ix_usage_records_user_created_id", "user_id", "created_at", "id"),
+    )
     
-    id = Column(Integer, primary_key=True, index=True)
+    # BIGSERIAL to match the partitioned table; SQLite only autoincrements INTEGER keys
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     api_key_id = Column(Integer, ForeignKey("api_keys.id"))
     captcha_type = Column(String)  # text, math, image, etc.
@@ -56,8 +61,46 @@ class UsageRecord(Base):
     api_key = relationship("APIKey", back_populates="usage_records")
 
 
+class UsageRollup(Base):
+    """Pre-aggregated usage per user, key, CAPTCHA type and hour/day bucket"""
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id", "api_key_id", "captcha_type", "granularity", "bucket_start",
+            name="uq_usage_rollups_bucket"
+        ),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    api_key_id = Column(Integer, ForeignKey("api_keys.id"))
+    captcha_type = Column(String)
+    granularity = Column(String)  # hour, day
+    bucket_start = Column(DateTime)
+    total_count = Column(Integer, default=0)
+    success_count = Column(Integer, default=0)
+    latency_sum_ms = Column(BigInteger, default=0)
+    # Latency histogram; each column counts solves that fall in its own range
+    latency_le_100 = Column(Integer, default=0)
+    latency_le_250 = Column(Integer, default=0)
+    latency_le_500 = Column(Integer, default=0)
+    latency_le_1000 = Column(Integer, default=0)
+    latency_le_2500 = Column(Integer, default=0)
+    latency_le_5000 = Column(Integer, default=0)
+    latency_gt_5000 = Column(Integer, default=0)
+
+
 class Subscription(Base):
     __tablename__ = "subscriptions"
+    __table_args__ = (
+        # At most one active subscription per user, so concurrent first requests can't each create one
+        Index(
+            "uq_subscriptions_user_active", "user_id",
+            unique=True,
+            postgresql_where=text("status = 'active'"),
+            sqlite_where=text("status = 'active'")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Dict, Optional, List
 from datetime import datetime
 from enum import Enum
 
@@ -11,6 +11,18 @@ class CaptchaType(str, Enum):
     PUZZLE = "puzzle"
 
 
+class SolveMode(str, Enum):
+    SYNC = "sync"
+    ASYNC = "async"
+
+
+class TaskStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
 class PlanType(str, Enum):
     FREE = "free"
     BASIC = "basic"
@@ -28,7 +40,12 @@ class SubscriptionStatus(str, Enum):
 class SolveCaptchaRequest(BaseModel):
     image_url: Optional[str] = Field(None, description="URL of the CAPTCHA image")
     image_base64: Optional[str] = Field(None, description="Base64 encoded image data")
-    captcha_type: Optional[CaptchaType] = Field(CaptchaType.TEXT, description="Type of CAPTCHA")
+    captcha_type: CaptchaType = Field(CaptchaType.TEXT, description="Type of CAPTCHA")
+    timeout_ms: Optional[int] = Field(None, gt=0, description="Give up on the solve after this many milliseconds")
+
+
+class SolveBatchRequest(BaseModel):
+    items: List[SolveCaptchaRequest] = Field(..., min_length=1, description="CAPTCHAs to solve")
 
 
 class CreateAPIKeyRequest(BaseModel):
@@ -51,6 +68,28 @@ class SolveCaptchaResponse(BaseModel):
     solved_text: Optional[str] = None
     confidence: Optional[float] = None
     processing_time_ms: int
+    cached: bool = False
+    error_message: Optional[str] = None
+    timings: Optional[Dict[str, float]] = Field(None, description="Duration of each solve stage in milliseconds")
+
+
+class SolveBatchItemResponse(SolveCaptchaResponse):
+    index: int
+
+
+class SolveBatchResponse(BaseModel):
+    results: List[SolveBatchItemResponse]
+    succeeded: int
+    failed: int
+
+
+class SolveTaskResponse(BaseModel):
+    task_id: str
+    status: TaskStatus
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[SolveCaptchaResponse] = None
     error_message: Optional[str] = None
 
 
@@ -89,6 +128,21 @@ class UsageStatsResponse(BaseModel):
     solves_remaining: int
 
 
+class UsageRecordResponse(BaseModel):
+    id: int
+    api_key_id: Optional[int] = None
+    captcha_type: str
+    success: bool
+    response_time_ms: int
+    created_at: datetime
+
+
+class UsageHistoryResponse(BaseModel):
+    records: List[UsageRecordResponse]
+    next_cursor: Optional[str] = None
+    limit: int
+
+
 class PaymentResponse(BaseModel):
     id: int
     amount: float
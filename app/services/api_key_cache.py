@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+import structlog
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.database import APIKey, User
+
+logger = structlog.get_logger()
+
+
+class CachedUser(NamedTuple):
+    """The User fields request handlers read, copied out of the session"""
+    id: int
+    email: str
+    is_active: bool
+
+
+class CachedAPIKey(NamedTuple):
+    """The APIKey fields request handlers read, copied out of the session"""
+    id: int
+    user_id: int
+    name: str
+
+
+Principal = Tuple[CachedUser, CachedAPIKey]
+
+
+def snapshot(user: User, api_key: APIKey) -> Principal:
+    """Copy a loaded (User, APIKey) pair into plain tuples that outlive the session"""
+    return (
+        CachedUser(id=user.id, email=user.email, is_active=user.is_active),
+        CachedAPIKey(id=api_key.id, user_id=api_key.user_id, name=api_key.name),
+    )
+
+
+class APIKeyCache:
+    """
+    Short-TTL cache of key_hash -> (CachedUser, CachedAPIKey)
+
+    Entries are plain snapshots, never ORM instances, so a request whose
+    session is rolled back or closed can't break later lookups. Unknown keys
+    are cached as negative entries with a shorter TTL so invalid-key floods
+    don't reach the database either. With Redis enabled, revocations are
+    broadcast on a pub/sub channel and every process drops the key at once;
+    without Redis, or for a process whose listener was reconnecting, a
+    revoked key keeps working until its entry expires, at most
+    `ttl_seconds` later.
+    """
+
+    channel = "api_keys:invalidate"
+
+    def __init__(self, ttl_seconds: int, negative_ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Principal]]]" = OrderedDict()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._listener: Optional[asyncio.Task] = None
+
+    def lookup(self, key_hash: str) -> Tuple[bool, Optional[Principal]]:
+        """Return (found, principal); principal is None for a cached invalid key"""
+        entry = self._entries.get(key_hash)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key_hash]
+            self.misses += 1
+            return False, None
+
+        principal = entry[1]
+        if principal is None:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return True, principal
+
+    def store(self, key_hash: str, principal: Optional[Principal]) -> None:
+        """Cache a verified principal, or None to remember an invalid key"""
+        ttl = self.ttl_seconds if principal is not None else self.negative_ttl_seconds
+        self._entries[key_hash] = (time.monotonic() + ttl, principal)
+        self._entries.move_to_end(key_hash)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate_key(self, key_hash: str) -> None:
+        """Drop a single key, e.g. after it is revoked"""
+        if self._entries.pop(key_hash, None) is not None:
+            self.invalidations += 1
+
+    async def invalidate_everywhere(self, key_hash: str) -> None:
+        """Drop a key here and, with Redis enabled, in every other process"""
+        self.invalidate_key(key_hash)
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.publish(self.channel, key_hash)
+            except Exception as e:
+                logger.warning("API key invalidation publish failed", error=str(e))
+
+    async def _listen(self, redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # Revocations sent while we were not subscribed are lost
+                    self._entries.clear()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            data = message["data"]
+                            self.invalidate_key(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("API key invalidation listener failed, reconnecting", error=str(e))
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        """Listen for revocations from other processes when Redis is enabled"""
+        redis = get_redis()
+        if redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters and hit rate"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round((self.hits + self.negative_hits) / lookups, 3) if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+api_key_cache = APIKeyCache(
+    ttl_seconds=settings.api_key_cache_ttl_seconds,
+    negative_ttl_seconds=settings.api_key_cache_negative_ttl_seconds,
+    max_entries=settings.api_key_cache_max_entries,
+)
@@ -4,9 +4,13 @@ import jwt
 from datetime import datetime, timedelta
 from typing import Optional
 from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from app.core.config import settings
 from app.models.database import User, APIKey
+from app.services.api_key_cache import Principal, api_key_cache, snapshot
+from app.services.last_used_tracker import last_used_tracker
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -63,13 +67,63 @@ class AuthService:
         ).first()
         
         if db_key:
-            # Update last used timestamp
-            db_key.last_used_at = datetime.utcnow()
-            db.commit()
+            # last_used_at is written in batches by the tracker
+            last_used_tracker.touch(db_key.id)
             return db_key
         
         return None
     
+    async def verify_api_key_async(self, api_key: str, db: AsyncSession) -> Optional[APIKey]:
+        """Verify API key and return the key object (async session, read-only)"""
+        if not api_key.startswith("cap_"):
+            return None
+
+        key_hash = self.hash_api_key(api_key)
+        result = await db.execute(
+            select(APIKey).where(
+                APIKey.key_hash == key_hash,
+                APIKey.is_active == True
+            )
+        )
+        return result.scalars().first()
+
+    async def authenticate_api_key_async(
+        self, api_key: str, db: AsyncSession
+    ) -> Optional[Principal]:
+        """Resolve an API key to a (user, key) snapshot, serving hot keys from the cache"""
+        if not api_key.startswith("cap_"):
+            return None
+
+        key_hash = self.hash_api_key(api_key)
+        found, principal = api_key_cache.lookup(key_hash)
+        if not found:
+            principal = None
+            db_key = await self.verify_api_key_async(api_key, db)
+            if db_key:
+                user = await self.get_user_by_id_async(db, db_key.user_id)
+                if user:
+                    principal = snapshot(user, db_key)
+            api_key_cache.store(key_hash, principal)
+
+        if principal:
+            # last_used_at is written in batches by the tracker
+            last_used_tracker.touch(principal[1].id)
+        return principal
+
+    def revoke_api_key(self, db: Session, user_id: int, key_id: int) -> Optional[APIKey]:
+        """Deactivate one of a user's API keys"""
+        db_key = db.query(APIKey).filter(
+            APIKey.id == key_id,
+            APIKey.user_id == user_id
+        ).first()
+        if not db_key:
+            return None
+
+        db_key.is_active = False
+        db.commit()
+        api_key_cache.invalidate_key(db_key.key_hash)
+        return db_key
+
     def create_user(self, db: Session, email: str, password: str) -> User:
         """Create a new user"""
         hashed_password = self.get_password_hash(password)
@@ -111,6 +165,11 @@ class AuthService:
         """Get user by ID"""
         return db.query(User).filter(User.id == user_id).first()
     
+    async def get_user_by_id_async(self, db: AsyncSession, user_id: int) -> Optional[User]:
+        """Get user by ID (async session)"""
+        result = await db.execute(select(User).where(User.id == user_id))
+        return result.scalars().first()
+
     def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
         """Get user by email"""
         return db.query(User).filter(User.email == email).first() 
\ No newline at end of file
@@ -0,0 +1,52 @@
+import asyncio
+from typing import Callable, List, NamedTuple, Optional, Sequence
+from app.services.gemini_service import GeminiService, SolveResult
+from app.services.image_validation import ImageRejected
+
+
+class BatchItem(NamedTuple):
+    captcha_type: str
+    image_data: Optional[bytes] = None
+    image_url: Optional[str] = None
+    image_base64: Optional[str] = None
+    timeout_ms: Optional[int] = None
+    error: Optional[str] = None  # Rejected while parsing the request
+
+
+class BatchOutcome(NamedTuple):
+    index: int
+    captcha_type: str
+    result: SolveResult
+    error: Optional[str] = None  # Rejected before solving; not billed or recorded
+
+
+async def run_batch(
+    solver: GeminiService,
+    items: Sequence[BatchItem],
+    concurrency: int,
+    on_outcome: Optional[Callable[[BatchOutcome], None]] = None
+) -> List[BatchOutcome]:
+    """Solve items with at most `concurrency` in flight; outcomes come back in item order"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def solve_one(index: int, item: BatchItem) -> BatchOutcome:
+        if item.error is not None:
+            outcome = BatchOutcome(index, item.captcha_type, SolveResult(False, None, None, 0), item.error)
+        else:
+            async with semaphore:
+                try:
+                    result = await solver.solve_captcha(
+                        image_data=item.image_data,
+                        image_url=item.image_url,
+                        image_base64=item.image_base64,
+                        captcha_type=item.captcha_type,
+                        timeout_ms=item.timeout_ms
+                    )
+                    outcome = BatchOutcome(index, item.captcha_type, result)
+                except ImageRejected as e:
+                    outcome = BatchOutcome(index, item.captcha_type, SolveResult(False, None, None, 0), str(e))
+        if on_outcome is not None:
+            on_outcome(outcome)
+        return outcome
+
+    return await asyncio.gather(*(solve_one(index, item) for index, item in enumerate(items)))
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import Optional
+import httpx
+import structlog
+from app.core.config import settings
+
+logger = structlog.get_logger()
+
+
+class CapSolverError(Exception):
+    """CapSolver refused or failed a task"""
+
+    def __init__(self, message: str, code: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+
+
+class CapSolverClient:
+    """
+    Non-blocking CapSolver client over one pooled HTTP connection set
+
+    solve() creates a task and polls getTaskResult every poll_interval
+    seconds until it is ready, yielding to the event loop between polls.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        poll_interval: float,
+        timeout: float,
+        max_connections: int
+    ):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled client on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(10.0, connect=3.0),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def _call(self, method: str, body: dict) -> dict:
+        response = await self._get_client().post(f"/{method}", json={"clientKey": self.api_key, **body})
+        try:
+            data = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise CapSolverError(f"CapSolver {method} returned a non-JSON response")
+        # Errors come back as JSON with errorId set, sometimes with a 4xx status
+        if data.get("errorId"):
+            raise CapSolverError(
+                data.get("errorDescription") or f"CapSolver {method} failed",
+                data.get("errorCode")
+            )
+        response.raise_for_status()
+        return data
+
+    async def create_task(self, task: dict) -> dict:
+        """Submit a task; some task types come back already solved"""
+        return await self._call("createTask", {"task": task})
+
+    async def get_task_result(self, task_id: str) -> dict:
+        return await self._call("getTaskResult", {"taskId": task_id})
+
+    async def solve(self, task: dict, timeout: Optional[float] = None) -> dict:
+        """Create a task and wait for its solution"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        result = await self.create_task(task)
+        task_id = result.get("taskId")
+        while result.get("status") != "ready":
+            if result.get("status") == "failed":
+                raise CapSolverError(result.get("errorDescription") or "CapSolver task failed", result.get("errorCode"))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError(f"CapSolver task {task_id} not ready in time")
+            await asyncio.sleep(min(self.poll_interval, remaining))
+            result = await self.get_task_result(task_id)
+        return result["solution"]
+
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+capsolver_client = CapSolverClient(
+    api_key=settings.capsolver_api_key,
+    base_url=settings.capsolver_api_url,
+    poll_interval=settings.capsolver_poll_interval_seconds,
+    timeout=settings.capsolver_timeout_seconds,
+    max_connections=settings.capsolver_max_connections,
+)
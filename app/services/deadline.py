@@ -0,0 +1,46 @@
+import asyncio
+import time
+from typing import Awaitable, Optional, TypeVar
+from app.core.config import settings
+
+T = TypeVar("T")
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before the solve finished"""
+
+
+class Deadline:
+    """Absolute end time of one request on the perf_counter clock, passed down to every awaited stage"""
+
+    def __init__(self, timeout_ms: int, started: Optional[float] = None):
+        self.timeout_ms = timeout_ms
+        self.expires_at = (time.perf_counter() if started is None else started) + timeout_ms / 1000
+
+    @classmethod
+    def from_request(cls, timeout_ms: Optional[int], started: Optional[float] = None) -> "Deadline":
+        """The client's timeout_ms, or the server default, capped at SOLVE_MAX_TIMEOUT_MS, counted from `started`"""
+        return cls(min(timeout_ms or settings.solve_default_timeout_ms, settings.solve_max_timeout_ms), started)
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(self.expires_at - time.perf_counter(), 0.0)
+
+    @property
+    def expired(self) -> bool:
+        return time.perf_counter() >= self.expires_at
+
+    def check(self) -> None:
+        """Raise DeadlineExceeded if no time is left"""
+        if self.expired:
+            raise DeadlineExceeded(f"Deadline of {self.timeout_ms} ms exceeded")
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Await within the time left, cancelling on expiry"""
+        try:
+            return await asyncio.wait_for(awaitable, self.remaining())
+        except asyncio.TimeoutError:
+            # A timeout raised by the awaitable itself is not ours to rename
+            if not self.expired:
+                raise
+            raise DeadlineExceeded(f"Deadline of {self.timeout_ms} ms exceeded")
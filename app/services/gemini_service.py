@@ -1,141 +1,255 @@
-import google.generativeai as genai
-import base64
-import requests
-from PIL import Image
-import io
+import asyncio
+import hashlib
 import time
-from typing import Optional, Tuple
+from typing import Dict, NamedTuple, Optional, Tuple
 import structlog
+from app.core import metrics
+from app.core.metrics import StageTimer
 from app.core.config import settings
+from app.services.deadline import Deadline, DeadlineExceeded
+from app.services.image_downloader import image_downloader
+from app.services.image_preprocessor import PreparedImage, image_preprocessor
+from app.services.image_buffer import Buffer, decode_base64, decoded_size, payload_offset
+from app.services.image_validation import ImageRejected, check_size, validate_image
+from app.services.singleflight import SingleFlight
+from app.services.solve_cache import solve_cache
+from app.services.solver_backends import PROMPT_VERSION, GeminiBackend, create_backends
+from app.services.solver_router import SolverRouter
 
 logger = structlog.get_logger()
 
 
+class SolveResult(NamedTuple):
+    success: bool
+    solved_text: Optional[str]
+    confidence: Optional[float]
+    processing_time_ms: int
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = None  # Stage durations in ms
+    error: Optional[str] = None  # Client-facing reason, when there is one beyond "failed"
+
+
 class GeminiService:
+    """Solve pipeline: image input, validation, cache and coalescing in front of the routed solver backends"""
+
     def __init__(self):
-        genai.configure(api_key=settings.google_api_key)
-        self.model = genai.GenerativeModel(settings.gemini_model)
+        self.router = SolverRouter(
+            create_backends(settings.solver_backends),
+            alpha=settings.solver_ewma_alpha,
+            failure_threshold=settings.solver_breaker_failures,
+            error_rate_threshold=settings.solver_breaker_error_rate,
+            min_samples=settings.solver_breaker_min_samples,
+            cooldown=settings.solver_breaker_cooldown_seconds,
+            probe_interval=settings.solver_probe_interval_seconds,
+            hedge_budget=settings.solver_hedge_budget,
+        )
+        # Concurrent identical requests share one download and one model call
+        self._download_flights = SingleFlight()
+        self._solve_flights = SingleFlight()
+        # Answers depend on both the prompts and what the model was shown
+        self._cache_version = hashlib.sha256(
+            f"{PROMPT_VERSION}|{image_preprocessor.fingerprint()}".encode()
+        ).hexdigest()[:12]
+
+    @property
+    def _gemini(self) -> GeminiBackend:
+        for backend in self.router.backends:
+            if isinstance(backend, GeminiBackend):
+                return backend
+        raise AttributeError("The gemini solver backend is not enabled")
+
+    @property
+    def model(self):
+        """The Gemini model behind the gemini backend"""
+        return self._gemini.model
+
+    @model.setter
+    def model(self, model) -> None:
+        self._gemini.model = model
         
-    def _download_image_from_url(self, url: str) -> bytes:
+    async def _download_image_from_url(self, url: str) -> bytes:
         """Download image from URL and return bytes"""
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return response.content
+            return await image_downloader.download(url)
+        except ImageRejected:
+            raise
         except Exception as e:
             logger.error("Failed to download image from URL", url=url, error=str(e))
             raise ValueError(f"Failed to download image from URL: {str(e)}")
     
-    def _decode_base64_image(self, base64_data: str) -> bytes:
-        """Decode base64 image data"""
+    def _decode_base64_image(self, base64_data: str) -> memoryview:
+        """Decode base64 image data, refusing oversized payloads before decoding"""
         try:
-            # Remove data URL prefix if present
-            if base64_data.startswith('data:image'):
-                base64_data = base64_data.split(',')[1]
-            
-            return base64.b64decode(base64_data)
+            start = payload_offset(base64_data)
+            check_size(decoded_size(base64_data, start))
+            return decode_base64(base64_data, start)
+        except ImageRejected:
+            raise
         except Exception as e:
             logger.error("Failed to decode base64 image", error=str(e))
             raise ValueError(f"Invalid base64 image data: {str(e)}")
     
-    def _prepare_image(self, image_bytes: bytes) -> Image.Image:
-        """Prepare image for Gemini API"""
+    async def _prepare_image(self, image_bytes: Buffer, captcha_type: str) -> PreparedImage:
+        """Preprocess image for Gemini API off the event loop"""
         try:
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            return image
+            return await asyncio.to_thread(image_preprocessor.process, image_bytes, captcha_type)
         except Exception as e:
             logger.error("Failed to prepare image", error=str(e))
-            raise ValueError(f"Invalid image format: {str(e)}")
+            raise
     
-    def _create_captcha_prompt(self, captcha_type: str) -> str:
-        """Create optimized prompt for CAPTCHA solving"""
-        prompts = {
-            "text": """This is a CAPTCHA image containing distorted text. 
-            Carefully read and return ONLY the exact alphanumeric characters visible in the image. 
-            Do not explain anything. Output only the CAPTCHA text. 
-            If the text is unclear or ambiguous, make your best guess based on the most likely characters.""",
-            
-            "math": """This is a mathematical CAPTCHA image. 
-            Read the mathematical expression or equation shown in the image and solve it. 
-            Return ONLY the numerical result as a number. 
-            Do not explain anything. Output only the answer.""",
-            
-            "image": """This is an image-based CAPTCHA. 
-            Look at the image and identify what is being asked (e.g., "select all images with cars"). 
-            If it's a selection task, respond with "SELECT" if the image matches the criteria, or "SKIP" if it doesn't. 
-            If it's an identification task, describe what you see in the image in simple terms.""",
-            
-            "puzzle": """This is a puzzle CAPTCHA image. 
-            Analyze the image and provide the solution to the puzzle shown. 
-            Return ONLY the answer or solution. Do not explain anything."""
-        }
+    async def _solve_uncached(
+        self,
+        cache_key: str,
+        image_bytes: Buffer,
+        captcha_type: str,
+        deadline: Deadline
+    ) -> Tuple[str, str, Dict[str, float]]:
+        """Run the best available backend on an image and cache the answer; returns (answer, backend, stage times)"""
+        timer = StageTimer(captcha_type)
+        with timer.stage("preprocess"):
+            image = await self._prepare_image(image_bytes, captcha_type)
+        deadline.check()
+        with timer.stage("model"):
+            solved_text, backend = await self.router.solve(image, captcha_type, deadline)
         
-        return prompts.get(captcha_type, prompts["text"])
+        await solve_cache.set(cache_key, {"solved_text": solved_text, "confidence": None})
+        return solved_text, backend, timer.stages
     
     async def solve_captcha(
         self, 
         image_data: Optional[bytes] = None,
         image_url: Optional[str] = None,
         image_base64: Optional[str] = None,
-        captcha_type: str = "text"
-    ) -> Tuple[bool, Optional[str], Optional[float], int]:
+        captcha_type: str = "text",
+        timer: Optional[StageTimer] = None,
+        timeout_ms: Optional[int] = None
+    ) -> SolveResult:
         """
-        Solve CAPTCHA using Gemini Vision API
+        Solve CAPTCHA using the routed solver backends (Gemini by default)
+
+        Stage times are added to `timer` (the request's, when given) and
+        returned in SolveResult.timings. The download and the backend calls
+        share one deadline of timeout_ms (SOLVE_DEFAULT_TIMEOUT_MS if unset)
+        from the timer's start.
+        Shared (coalesced) downloads and solves run on SOLVE_MAX_TIMEOUT_MS,
+        so a short deadline on the request that started one can't fail the
+        callers that joined it; each caller still waits at most its own
+        deadline.
         
         Returns:
-            Tuple of (success, solved_text, confidence, processing_time_ms)
+            SolveResult of (success, solved_text, confidence, processing_time_ms, cached, timings)
+
+        Raises:
+            ImageRejected: the image is too large or not an allowed format
         """
-        start_time = time.time()
+        start_time = time.perf_counter()
+        timer = timer or StageTimer()
+        # Counted from when the request arrived, so auth and quota time is part of the budget
+        deadline = Deadline.from_request(timeout_ms, started=timer.started)
+        # Budget for work shared with coalesced requests, which may have longer deadlines than this one
+        shared_deadline = Deadline(settings.solve_max_timeout_ms, started=timer.started)
+        timer.captcha_type = captcha_type
+        in_flight = metrics.IN_FLIGHT.labels(captcha_type)
+        in_flight.inc()
         
         try:
             # Get image bytes from various sources
             if image_data:
                 image_bytes = image_data
             elif image_url:
-                image_bytes = self._download_image_from_url(image_url)
+                with timer.stage("fetch"):
+                    image_bytes = await deadline.run(self._download_flights.do(
+                        image_url, lambda: shared_deadline.run(self._download_image_from_url(image_url))
+                    ))
             elif image_base64:
-                image_bytes = self._decode_base64_image(image_base64)
+                with timer.stage("decode"):
+                    image_bytes = self._decode_base64_image(image_base64)
             else:
                 raise ValueError("No image data provided")
+            with timer.stage("validate"):
+                validate_image(image_bytes)
             
-            # Prepare image
-            image = self._prepare_image(image_bytes)
-            
-            # Create prompt
-            prompt = self._create_captcha_prompt(captcha_type)
-            
-            # Call Gemini API
-            response = self.model.generate_content([prompt, image])
-            
-            if response.text:
-                solved_text = response.text.strip()
-                processing_time = int((time.time() - start_time) * 1000)
-                
+            # Serve repeated images from the result cache
+            cache_key = solve_cache.make_key(image_bytes, captcha_type, self._cache_version)
+            with timer.stage("cache"):
+                cached = await solve_cache.get(cache_key)
+            if cached is not None:
+                elapsed = time.perf_counter() - start_time
+                metrics.CACHE_HITS.labels(captcha_type).inc()
+                metrics.SOLVES.labels(captcha_type, "success").inc()
+                metrics.SOLVE_SECONDS.labels(captcha_type).observe(elapsed)
+                processing_time = int(elapsed * 1000)
                 logger.info(
-                    "CAPTCHA solved successfully",
+                    "CAPTCHA served from cache",
                     captcha_type=captcha_type,
-                    processing_time_ms=processing_time,
-                    solved_text_length=len(solved_text)
+                    processing_time_ms=processing_time
                 )
-                
-                return True, solved_text, None, processing_time
-            else:
-                raise ValueError("No response from Gemini API")
-                
+                return SolveResult(
+                    True, cached["solved_text"], cached["confidence"], processing_time,
+                    cached=True, timings=timer.as_ms()
+                )
+
+            # Call Gemini API, coalescing identical in-flight images
+            solved_text, backend, stages = await deadline.run(self._solve_flights.do(
+                cache_key, lambda: self._solve_uncached(cache_key, image_bytes, captcha_type, shared_deadline)
+            ))
+            # Stage times are shared with coalesced callers but observed once, by whichever ran the model
+            for name, seconds in stages.items():
+                timer.add(name, seconds, observe=False)
+            elapsed = time.perf_counter() - start_time
+            metrics.SOLVES.labels(captcha_type, "success").inc()
+            metrics.SOLVE_SECONDS.labels(captcha_type).observe(elapsed)
+            processing_time = int(elapsed * 1000)
+
+            logger.info(
+                "CAPTCHA solved successfully",
+                captcha_type=captcha_type,
+                backend=backend,
+                processing_time_ms=processing_time,
+                solved_text_length=len(solved_text),
+                timings=timer.as_ms()
+            )
+
+            return SolveResult(True, solved_text, None, processing_time, timings=timer.as_ms())
+
+        except ImageRejected:
+            metrics.SOLVES.labels(captcha_type, "rejected").inc()
+            raise
+        except DeadlineExceeded as e:
+            elapsed = time.perf_counter() - start_time
+            metrics.SOLVES.labels(captcha_type, "timeout").inc()
+            metrics.SOLVE_SECONDS.labels(captcha_type).observe(elapsed)
+            processing_time = int(elapsed * 1000)
+            logger.warning(
+                "CAPTCHA solve timed out",
+                captcha_type=captcha_type,
+                timeout_ms=deadline.timeout_ms,
+                processing_time_ms=processing_time,
+                timings=timer.as_ms()
+            )
+            return SolveResult(False, None, None, processing_time, timings=timer.as_ms(), error=str(e))
         except Exception as e:
-            processing_time = int((time.time() - start_time) * 1000)
+            elapsed = time.perf_counter() - start_time
+            metrics.SOLVES.labels(captcha_type, "failure").inc()
+            metrics.SOLVE_SECONDS.labels(captcha_type).observe(elapsed)
+            processing_time = int(elapsed * 1000)
             logger.error(
                 "Failed to solve CAPTCHA",
                 captcha_type=captcha_type,
                 error=str(e),
-                processing_time_ms=processing_time
+                processing_time_ms=processing_time,
+                timings=timer.as_ms()
             )
-            return False, None, None, processing_time
+            return SolveResult(False, None, None, processing_time, timings=timer.as_ms())
+        finally:
+            in_flight.dec()
+
+    def coalescing_stats(self) -> dict:
+        """Single-flight counters for downloads and model calls"""
+        return {
+            "downloads": self._download_flights.stats(),
+            "solves": self._solve_flights.stats(),
+        }
     
     def validate_api_key(self) -> bool:
         """Validate that the Gemini API key is working"""
@@ -0,0 +1,107 @@
+import binascii
+import io
+from typing import Optional, Union
+from PIL import Image
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# Base64 characters decoded per step; a multiple of 4 keeps chunks aligned to whole quanta
+DECODE_CHUNK_CHARS = 64 * 1024
+# Data URL headers ("data:image/png;base64,") are short; don't scan megabytes for the comma
+MAX_DATA_URL_HEADER = 256
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only file over a buffer, so Pillow can read it without a bytes copy"""
+
+    def __init__(self, data: Buffer):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = min(len(target), len(self._view) - self._pos)
+        if size <= 0:
+            return 0
+        target[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        chunk = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return chunk
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(self._pos, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+
+def open_image(data: Buffer) -> Image.Image:
+    """Image.open over a buffer without copying it"""
+    return Image.open(BufferReader(data))
+
+
+def payload_offset(data: str) -> int:
+    """Index where the base64 payload starts, skipping a data URL header if present"""
+    if data.startswith("data:"):
+        comma = data.find(",", 0, MAX_DATA_URL_HEADER)
+        if comma < 0:
+            raise ValueError("Malformed data URL")
+        return comma + 1
+    return 0
+
+
+def decoded_size(data: str, start: int = 0) -> int:
+    """Decoded length implied by the encoded length (line breaks count, so it's an upper bound)"""
+    length = len(data) - start
+    padding = 0
+    if length and data[-1] == "=":
+        padding = 2 if length > 1 and data[-2] == "=" else 1
+    return max(length * 3 // 4 - padding, 0)
+
+
+def decode_base64(data: str, start: Optional[int] = None) -> memoryview:
+    """
+    Decode base64 or a base64 data URL into a preallocated buffer
+
+    The payload is decoded in aligned chunks straight into one bytearray, so
+    the only full-size allocation is the output. Callers check
+    decoded_size() against their limit first.
+    """
+    if start is None:
+        start = payload_offset(data)
+    size = decoded_size(data, start)
+
+    output = bytearray(size)
+    written = 0
+    try:
+        for position in range(start, len(data), DECODE_CHUNK_CHARS):
+            chunk = binascii.a2b_base64(data[position:position + DECODE_CHUNK_CHARS])
+            output[written:written + len(chunk)] = chunk
+            written += len(chunk)
+    except binascii.Error:
+        # Embedded whitespace can split a 4-character quantum across chunks; decode in one go
+        chunk = binascii.a2b_base64(data[start:])
+        output[:len(chunk)] = chunk
+        written = len(chunk)
+
+    if written > size:
+        raise ValueError("Invalid base64 length")
+    del output[written:]
+    return memoryview(output)
@@ -0,0 +1,96 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional
+from urllib.parse import urlsplit
+import httpx
+import structlog
+from app.core.config import settings
+from app.services.image_validation import ImageTooLarge
+
+logger = structlog.get_logger()
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ImageDownloader:
+    """Shared, connection-pooled async downloader for CAPTCHA image URLs"""
+
+    def __init__(self):
+        self.max_bytes = settings.max_file_size
+        self._client: Optional[httpx.AsyncClient] = None
+        # Only hosts with downloads running or waiting have an entry, so the map can't grow without bound
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._host_users: Dict[str, int] = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled client on first use"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                follow_redirects=True,
+                timeout=httpx.Timeout(
+                    connect=settings.download_connect_timeout,
+                    read=settings.download_read_timeout,
+                    write=settings.download_read_timeout,
+                    pool=settings.download_connect_timeout,
+                ),
+                limits=httpx.Limits(
+                    max_connections=settings.download_max_connections,
+                    max_keepalive_connections=settings.download_max_keepalive_connections,
+                    keepalive_expiry=settings.download_keepalive_expiry,
+                ),
+            )
+        return self._client
+
+    @asynccontextmanager
+    async def _host_slot(self, url: str) -> AsyncIterator[None]:
+        """Per-host limiter so one slow origin can't take the whole pool; dropped once the host is idle"""
+        host = urlsplit(url).netloc.lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(settings.download_max_connections_per_host)
+            self._host_semaphores[host] = semaphore
+        self._host_users[host] = self._host_users.get(host, 0) + 1
+        try:
+            async with semaphore:
+                yield
+        finally:
+            self._host_users[host] -= 1
+            if not self._host_users[host]:
+                del self._host_users[host]
+                del self._host_semaphores[host]
+
+    async def download(self, url: str, max_bytes: Optional[int] = None) -> bytes:
+        """Stream an image into memory, aborting once it exceeds max_bytes"""
+        limit = max_bytes or self.max_bytes
+        if urlsplit(url).scheme not in ("http", "https"):
+            raise ValueError("Only http and https image URLs are supported")
+
+        async with self._host_slot(url):
+            async with self._get_client().stream("GET", url) as response:
+                response.raise_for_status()
+
+                content_length = response.headers.get("content-length")
+                if content_length and content_length.isdigit() and int(content_length) > limit:
+                    raise ImageTooLarge(f"Image exceeds maximum size of {limit} bytes")
+
+                buffer = bytearray()
+                async for chunk in response.aiter_bytes():
+                    buffer += chunk
+                    if len(buffer) > limit:
+                        raise ImageTooLarge(f"Image exceeds maximum size of {limit} bytes")
+
+                return bytes(buffer)
+
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+image_downloader = ImageDownloader()
@@ -0,0 +1,123 @@
+import io
+from typing import Dict, Iterable, NamedTuple
+from PIL import Image, ImageOps
+from app.core.config import settings
+from app.services.image_buffer import Buffer, open_image
+from app.services.image_validation import ImageRejected, ImageTooLarge, check_dimensions
+
+# Bump when process() output changes for the same settings, so cached answers are not reused
+PIPELINE_VERSION = 2
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+
+    def as_blob(self) -> dict:
+        """Inline blob part for a Gemini request"""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class ImagePreprocessor:
+    """
+    Shrink CAPTCHA images before they are sent upstream
+
+    Images are downscaled to a per-type maximum dimension, converted to
+    normalised grayscale for text-like CAPTCHAs and re-encoded without
+    metadata. JPEG sources are decoded at reduced scale with draft() and
+    large images are shrunk with reduce() before the final resample, so the
+    expensive full-resolution decode is skipped where possible.
+    """
+
+    def __init__(
+        self,
+        max_dimensions: Dict[str, int],
+        grayscale_types: Iterable[str],
+        jpeg_quality: int,
+        enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.max_dimensions = max_dimensions
+        self.grayscale_types = set(grayscale_types)
+        self.jpeg_quality = jpeg_quality
+
+    def fingerprint(self) -> str:
+        """Identifies the preprocessing settings, for use in cache keys"""
+        if not self.enabled:
+            return "raw"
+        dimensions = ",".join(f"{k}={v}" for k, v in sorted(self.max_dimensions.items()))
+        grayscale = ",".join(sorted(self.grayscale_types))
+        return f"v{PIPELINE_VERSION};{dimensions};{grayscale};q{self.jpeg_quality}"
+
+    @staticmethod
+    def _flatten(image: Image.Image) -> Image.Image:
+        """Composite transparent images onto white so alpha doesn't turn black"""
+        if image.mode == "P" and "transparency" in image.info:
+            image = image.convert("RGBA")
+        if image.mode in ("RGBA", "LA"):
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            return background
+        return image
+
+    @staticmethod
+    def _downscale(image: Image.Image, max_dimension: int) -> Image.Image:
+        longest = max(image.size)
+        if longest <= max_dimension:
+            return image
+        factor = longest // max_dimension
+        if factor >= 2:
+            # Cheap box reduction by an integer factor first; the resample below finishes the job
+            image = image.reduce(factor)
+        if max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        return image
+
+    def process(self, image_bytes: Buffer, captcha_type: str) -> PreparedImage:
+        """Decode, normalise and re-encode an image; raises ValueError if it can't be read or is too large"""
+        try:
+            image = open_image(image_bytes)
+            check_dimensions(image)
+            if not self.enabled:
+                image.load()
+                mime_type = Image.MIME.get(image.format, "image/png")
+                return PreparedImage(bytes(image_bytes), mime_type, image.width, image.height)
+
+            grayscale = captcha_type in self.grayscale_types
+            max_dimension = self.max_dimensions.get(captcha_type, max(self.max_dimensions.values()))
+            if image.format == "JPEG":
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when the target is small enough
+                image.draft("L" if grayscale else "RGB", (max_dimension, max_dimension))
+
+            image = self._flatten(image)
+            image = image.convert("L" if grayscale else "RGB")
+            image = self._downscale(image, max_dimension)
+            if grayscale:
+                image = ImageOps.autocontrast(image, cutoff=1)
+
+            # Always send the re-encoded image: saving from pixel data drops EXIF, ICC
+            # profiles and other metadata, even when it comes out larger than the source
+            buffer = io.BytesIO()
+            if grayscale:
+                image.save(buffer, format="PNG")
+                mime_type = "image/png"
+            else:
+                image.save(buffer, format="JPEG", quality=self.jpeg_quality)
+                mime_type = "image/jpeg"
+            return PreparedImage(buffer.getvalue(), mime_type, image.width, image.height)
+        except ImageRejected:
+            raise
+        except Image.DecompressionBombError as e:
+            raise ImageTooLarge(str(e))
+        except Exception as e:
+            raise ValueError(f"Invalid image format: {str(e)}")
+
+
+image_preprocessor = ImagePreprocessor(
+    max_dimensions=settings.image_max_dimensions,
+    grayscale_types=settings.image_grayscale_types,
+    jpeg_quality=settings.image_jpeg_quality,
+    enabled=settings.image_preprocessing_enabled,
+)
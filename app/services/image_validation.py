@@ -0,0 +1,103 @@
+from typing import Optional, Tuple
+from PIL import Image
+from app.core.config import settings
+from app.services.image_buffer import Buffer, open_image
+
+# Pillow warns above this many pixels and refuses to decode past twice as many
+Image.MAX_IMAGE_PIXELS = settings.max_image_pixels
+
+# Leading bytes needed to recognise every supported format
+SNIFF_BYTES = 12
+
+_EXTENSION_FORMATS = {
+    "jpg": "jpeg",
+    "jpeg": "jpeg",
+    "png": "png",
+    "gif": "gif",
+    "bmp": "bmp",
+    "webp": "webp",
+}
+
+
+class ImageRejected(ValueError):
+    """Input that must be refused before decoding; status_code maps to the HTTP response"""
+    status_code = 400
+
+
+class ImageTooLarge(ImageRejected):
+    status_code = 413
+
+
+class UnsupportedImageType(ImageRejected):
+    status_code = 415
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Identify an image format from its magic bytes"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def allowed_formats() -> set:
+    return {_EXTENSION_FORMATS[ext.lower()] for ext in settings.allowed_extensions if ext.lower() in _EXTENSION_FORMATS}
+
+
+def check_format(head: bytes) -> str:
+    """Reject data whose magic bytes aren't an allowed image format"""
+    image_format = sniff_format(head[:SNIFF_BYTES])
+    if image_format is None or image_format not in allowed_formats():
+        allowed = ", ".join(sorted(allowed_formats()))
+        raise UnsupportedImageType(f"Unsupported image type. Allowed formats: {allowed}")
+    return image_format
+
+
+def check_size(size: int) -> None:
+    if size > settings.max_file_size:
+        raise ImageTooLarge(f"Image exceeds maximum size of {settings.max_file_size} bytes")
+
+
+def check_dimensions(image: Image.Image) -> Tuple[int, int]:
+    """Reject decompression bombs using the header dimensions, before any pixels are decoded"""
+    width, height = image.size
+    if width * height > settings.max_image_pixels:
+        raise ImageTooLarge(f"Image exceeds maximum of {settings.max_image_pixels} pixels")
+    return width, height
+
+
+def validate_image(image_bytes: Buffer) -> str:
+    """Size, format and pixel-count checks for a complete image; returns the sniffed format"""
+    check_size(len(image_bytes))
+    image_format = check_format(bytes(image_bytes[:SNIFF_BYTES]))
+    try:
+        # Image.open only parses the header, so this stays cheap for huge images
+        image = open_image(image_bytes)
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    except Exception as e:
+        raise UnsupportedImageType(f"Invalid image data: {str(e)}")
+    check_dimensions(image)
+    return image_format
+
+
+async def read_upload(upload, max_bytes: Optional[int] = None) -> bytes:
+    """Read an UploadFile, checking magic bytes first and never reading past max_bytes"""
+    limit = max_bytes or settings.max_file_size
+    if upload.size is not None and upload.size > limit:
+        raise ImageTooLarge(f"Image exceeds maximum size of {limit} bytes")
+
+    head = await upload.read(SNIFF_BYTES)
+    check_format(head)
+    data = bytearray(head)
+    data += await upload.read(limit + 1 - len(head))
+    if len(data) > limit:
+        raise ImageTooLarge(f"Image exceeds maximum size of {limit} bytes")
+    return bytes(data)
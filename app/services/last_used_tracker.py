@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, Optional
+import structlog
+from sqlalchemy import update
+from app.core.config import settings
+from app.core.database import get_async_session_factory
+from app.models.database import APIKey
+
+logger = structlog.get_logger()
+
+
+class LastUsedTracker:
+    """
+    Coalesces API key last_used_at writes
+
+    Authentication only records the latest use per key in memory; a
+    background task writes one batched UPDATE per key every
+    `flush_interval_seconds`, so busy keys no longer take a row lock per
+    request. last_used_at in the database lags by at most one interval.
+    """
+
+    def __init__(self, flush_interval_seconds: int):
+        self.flush_interval = flush_interval_seconds
+        self._pending: Dict[int, datetime] = {}
+        self._stopped = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.flushed = 0
+
+    def touch(self, api_key_id: int) -> None:
+        """Note that a key was just used"""
+        self._pending[api_key_id] = datetime.utcnow()
+        self.touches += 1
+
+    async def flush(self) -> None:
+        """Write the latest use of every touched key in one statement"""
+        if not self._pending:
+            return
+
+        pending, self._pending = self._pending, {}
+        rows = [{"id": key_id, "last_used_at": used_at} for key_id, used_at in pending.items()]
+        try:
+            async with get_async_session_factory()() as db:
+                await db.execute(update(APIKey), rows)
+                await db.commit()
+            self.flushed += len(rows)
+        except Exception as e:
+            # Keep the newest timestamps for the next attempt
+            for key_id, used_at in pending.items():
+                if key_id not in self._pending:
+                    self._pending[key_id] = used_at
+            logger.error("Failed to flush API key last_used_at", count=len(rows), error=str(e))
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def start(self) -> None:
+        """Start the periodic flush task"""
+        if self._task is None:
+            self._stopped.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush task and write out pending timestamps"""
+        self._stopped.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Pending keys and write counters"""
+        return {
+            "pending_keys": len(self._pending),
+            "touches": self.touches,
+            "flushed": self.flushed,
+        }
+
+
+last_used_tracker = LastUsedTracker(
+    flush_interval_seconds=settings.api_key_last_used_flush_seconds,
+)
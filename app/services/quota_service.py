@@ -0,0 +1,468 @@
+import argparse
+import asyncio
+import calendar
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import structlog
+from sqlalchemy import case, func, inspect, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.database import get_async_session_factory
+from app.core.redis import get_redis
+from app.models.database import Subscription
+
+logger = structlog.get_logger()
+
+# Seed the period counter from the database if Redis lost it, then take
+# ARGV[4] solves unless that would exceed the limit. Returns the new count, or -1.
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('SET', KEYS[1], ARGV[3], 'EXAT', ARGV[2])
+end
+local used = redis.call('INCRBY', KEYS[1], ARGV[4])
+if used > tonumber(ARGV[1]) then
+    redis.call('DECRBY', KEYS[1], ARGV[4])
+    return -1
+end
+return used
+"""
+
+RELEASE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used > 0 then
+    return redis.call('DECRBY', KEYS[1], math.min(used, tonumber(ARGV[1])))
+end
+return used
+"""
+
+
+class QuotaPlan(NamedTuple):
+    subscription_id: int
+    plan_type: str
+    status: str
+    solves_limit: int
+    solves_used: int  # As of the last load; the live count is in Redis or the row
+    period_start: datetime
+    period_end: datetime
+
+
+class _Lease(NamedTuple):
+    """Solves a worker has taken from a subscriptions row but not handed out yet"""
+    period_start: datetime
+    used_through: int  # solves_used on the row after the last lease
+    free: int
+
+
+class QuotaExceeded(Exception):
+    """Raised when a user has no solves left in the current period"""
+
+
+def _month_bounds(now: datetime) -> Tuple[datetime, datetime]:
+    start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        return start, start.replace(year=start.year + 1, month=1)
+    return start, start.replace(month=start.month + 1)
+
+
+def _epoch(value: datetime) -> int:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return calendar.timegm(value.utctimetuple())
+
+
+class QuotaService:
+    """
+    Atomic per-period solve quota enforcement
+
+    With Redis enabled, each subscription period has its own counter key and
+    a solve costs one Lua round trip; a background task reconciles the
+    counters into subscriptions.solves_used.
+
+    Without Redis the counter is the subscriptions row itself. Each worker
+    leases `lease_size` solves at a time with a conditional UPDATE, so
+    workers can never overshoot the limit together, and hands them out from
+    memory. Reconciliation gives unused leases back. The cost is that a user
+    close to their limit can be refused while other workers hold leased
+    solves, until the next reconcile; a worker that dies loses its lease.
+    """
+
+    def __init__(self, plan_ttl_seconds: int, reconcile_interval_seconds: int, lease_size: int = 1):
+        self.plan_ttl_seconds = plan_ttl_seconds
+        self.reconcile_interval = reconcile_interval_seconds
+        self.lease_size = max(lease_size, 1)
+        self._plans: Dict[int, Tuple[float, QuotaPlan]] = {}
+        self._touched: Dict[int, str] = {}  # subscription_id -> Redis counter key
+        self._leases: Dict[int, _Lease] = {}  # subscription_id -> lease, without Redis
+        self._reserve_script = None
+        self._release_script = None
+        self._stopped = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.reserved = 0
+        self.denied = 0
+        self.released = 0
+        self.leases_taken = 0
+
+    @staticmethod
+    def _counter_key(plan: QuotaPlan) -> str:
+        return f"quota:{plan.subscription_id}:{_epoch(plan.period_start)}"
+
+    def _scripts(self, redis):
+        if self._reserve_script is None:
+            self._reserve_script = redis.register_script(RESERVE_SCRIPT)
+            self._release_script = redis.register_script(RELEASE_SCRIPT)
+        return self._reserve_script, self._release_script
+
+    @staticmethod
+    async def _active_subscription(db: AsyncSession, user_id: int) -> Optional[Subscription]:
+        result = await db.execute(
+            select(Subscription)
+            .where(Subscription.user_id == user_id, Subscription.status == "active")
+        )
+        return result.scalars().first()
+
+    async def _load_plan(self, user_id: int) -> QuotaPlan:
+        """Fetch the user's active subscription, creating or renewing a free one"""
+        now = datetime.utcnow()
+        async with get_async_session_factory()() as db:
+            subscription = await self._active_subscription(db, user_id)
+
+            if subscription is not None and subscription.current_period_end is not None \
+                    and subscription.current_period_end <= now:
+                if subscription.plan_type == "free":
+                    # Free plans renew every calendar month
+                    subscription.current_period_start, subscription.current_period_end = _month_bounds(now)
+                    subscription.solves_used = 0
+                else:
+                    # Lapsed paid plans fall back to a new free subscription
+                    subscription.status = "expired"
+                    subscription = None
+                await db.commit()
+
+            if subscription is None:
+                period_start, period_end = _month_bounds(now)
+                subscription = Subscription(
+                    user_id=user_id,
+                    plan_type="free",
+                    status="active",
+                    current_period_start=period_start,
+                    current_period_end=period_end,
+                    solves_used=0,
+                    solves_limit=settings.free_tier_limit,
+                )
+                db.add(subscription)
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # A concurrent request created it first (uq_subscriptions_user_active); use theirs
+                    await db.rollback()
+                    subscription = await self._active_subscription(db, user_id)
+            elif subscription.current_period_start is None or subscription.current_period_end is None:
+                subscription.current_period_start, subscription.current_period_end = _month_bounds(now)
+                await db.commit()
+
+            return QuotaPlan(
+                subscription_id=subscription.id,
+                plan_type=subscription.plan_type,
+                status=subscription.status,
+                solves_limit=subscription.solves_limit or 0,
+                solves_used=subscription.solves_used or 0,
+                period_start=subscription.current_period_start,
+                period_end=subscription.current_period_end,
+            )
+
+    async def get_plan(self, user_id: int) -> QuotaPlan:
+        """Return the user's plan, cached for plan_ttl_seconds"""
+        entry = self._plans.get(user_id)
+        if entry is not None and entry[0] > time.monotonic() and entry[1].period_end > datetime.utcnow():
+            return entry[1]
+
+        plan = await self._load_plan(user_id)
+        self._plans[user_id] = (time.monotonic() + self.plan_ttl_seconds, plan)
+        return plan
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a cached plan, e.g. after an upgrade"""
+        self._plans.pop(user_id, None)
+
+    async def reserve(self, user_id: int, count: int = 1) -> Tuple[QuotaPlan, int]:
+        """Take `count` solves from the current period, all or nothing; returns (plan, solves used)"""
+        plan = await self.get_plan(user_id)
+        if plan.status != "active":
+            self.denied += 1
+            raise QuotaExceeded("Subscription is not active")
+
+        redis = get_redis()
+        if redis is not None:
+            reserve_script, _ = self._scripts(redis)
+            key = self._counter_key(plan)
+            expire_at = _epoch(plan.period_end) + 86400
+            used = await reserve_script(keys=[key], args=[plan.solves_limit, expire_at, plan.solves_used, count])
+            self._touched[plan.subscription_id] = key
+        else:
+            used = await self._reserve_leased(plan, count)
+
+        if used < 0:
+            self.denied += 1
+            raise QuotaExceeded("Monthly solve quota exceeded")
+
+        self.reserved += count
+        return plan, used
+
+    async def _take_lease(self, plan: QuotaPlan, count: int) -> Optional[int]:
+        """Move `count` solves from the row into a lease; returns the row's new solves_used, or None"""
+        async with get_async_session_factory()() as db:
+            result = await db.execute(
+                update(Subscription)
+                .where(
+                    Subscription.id == plan.subscription_id,
+                    Subscription.solves_used + count <= Subscription.solves_limit
+                )
+                .values(solves_used=Subscription.solves_used + count)
+                .returning(Subscription.solves_used)
+            )
+            used_through = result.scalar()
+            await db.commit()
+        return used_through
+
+    async def _reserve_leased(self, plan: QuotaPlan, count: int) -> int:
+        """Take solves from this worker's lease, leasing more when it runs short; returns solves used, or -1"""
+        lease = self._leases.get(plan.subscription_id)
+        if lease is None or lease.period_start != plan.period_start or lease.free < count:
+            # A full block if it fits, else exactly what is needed, so the last solves stay exact
+            granted = max(count, self.lease_size)
+            used_through = await self._take_lease(plan, granted)
+            if used_through is None and granted > count:
+                granted = count
+                used_through = await self._take_lease(plan, granted)
+            if used_through is None:
+                return -1
+            self.leases_taken += 1
+
+            # Re-read: other requests may have changed the lease while we waited
+            lease = self._leases.get(plan.subscription_id)
+            if lease is None or lease.period_start != plan.period_start:
+                # A lease from a period that has ended has nothing left to give back
+                lease = _Lease(plan.period_start, used_through, 0)
+            lease = lease._replace(used_through=max(lease.used_through, used_through), free=lease.free + granted)
+
+        lease = lease._replace(free=lease.free - count)
+        self._leases[plan.subscription_id] = lease
+        return lease.used_through - lease.free
+
+    async def release(self, plan: QuotaPlan, count: int = 1) -> None:
+        """Give back reserved solves, e.g. when solving failed"""
+        if count <= 0:
+            return
+        redis = get_redis()
+        try:
+            lease = self._leases.get(plan.subscription_id)
+            if redis is not None:
+                _, release_script = self._scripts(redis)
+                key = self._counter_key(plan)
+                await release_script(keys=[key], args=[count])
+                self._touched[plan.subscription_id] = key
+            elif lease is not None and lease.period_start == plan.period_start:
+                self._leases[plan.subscription_id] = lease._replace(free=lease.free + count)
+            else:
+                async with get_async_session_factory()() as db:
+                    await db.execute(
+                        update(Subscription)
+                        .where(Subscription.id == plan.subscription_id, Subscription.solves_used > 0)
+                        .values(solves_used=case(
+                            (Subscription.solves_used > count, Subscription.solves_used - count),
+                            else_=0
+                        ))
+                    )
+                    await db.commit()
+            self.released += count
+        except Exception as e:
+            logger.warning("Failed to release quota reservation", subscription_id=plan.subscription_id, error=str(e))
+
+    async def current_usage(self, plan: QuotaPlan) -> int:
+        """Live solves used in the plan's current period"""
+        redis = get_redis()
+        if redis is not None:
+            value = await redis.get(self._counter_key(plan))
+            if value is not None:
+                return int(value)
+            return plan.solves_used
+
+        async with get_async_session_factory()() as db:
+            result = await db.execute(
+                select(Subscription.solves_used).where(Subscription.id == plan.subscription_id)
+            )
+            used = result.scalar() or 0
+        lease = self._leases.get(plan.subscription_id)
+        if lease is not None and lease.period_start == plan.period_start:
+            used -= lease.free
+        return max(used, 0)
+
+    async def _return_leases(self) -> None:
+        """Give unused leased solves back to their subscriptions rows"""
+        if not self._leases:
+            return
+        leases, self._leases = self._leases, {}
+        unused = {subscription_id: lease for subscription_id, lease in leases.items() if lease.free > 0}
+        try:
+            if unused:
+                async with get_async_session_factory()() as db:
+                    for subscription_id, lease in unused.items():
+                        # A renewed period has already reset the row, so only the leased period is credited
+                        await db.execute(
+                            update(Subscription)
+                            .where(
+                                Subscription.id == subscription_id,
+                                Subscription.current_period_start == lease.period_start
+                            )
+                            .values(solves_used=case(
+                                (Subscription.solves_used > lease.free, Subscription.solves_used - lease.free),
+                                else_=0
+                            ))
+                        )
+                    await db.commit()
+        except Exception as e:
+            for subscription_id, lease in unused.items():
+                current = self._leases.get(subscription_id)
+                if current is None or current.period_start != lease.period_start:
+                    self._leases[subscription_id] = lease
+                else:
+                    self._leases[subscription_id] = current._replace(free=current.free + lease.free)
+            logger.error("Failed to return quota leases", count=len(unused), error=str(e))
+
+    async def reconcile(self) -> None:
+        """Copy Redis counters touched by this worker back into subscriptions, and return unused leases"""
+        await self._return_leases()
+        redis = get_redis()
+        if redis is None or not self._touched:
+            return
+
+        touched, self._touched = self._touched, {}
+        try:
+            values = await redis.mget(list(touched.values()))
+            rows = [
+                {"id": subscription_id, "solves_used": int(value)}
+                for subscription_id, value in zip(touched.keys(), values)
+                if value is not None
+            ]
+            if rows:
+                async with get_async_session_factory()() as db:
+                    await db.execute(update(Subscription), rows)
+                    await db.commit()
+        except Exception as e:
+            for subscription_id, key in touched.items():
+                self._touched.setdefault(subscription_id, key)
+            logger.error("Failed to reconcile quota counters", count=len(touched), error=str(e))
+
+    async def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.reconcile_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.reconcile()
+
+    async def start(self) -> None:
+        """Start periodic reconciliation"""
+        if self._task is None:
+            self._stopped.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop reconciliation after a final pass"""
+        self._stopped.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.reconcile()
+
+    def stats(self) -> Dict[str, int]:
+        """Reservation counters"""
+        return {
+            "reserved": self.reserved,
+            "denied": self.denied,
+            "released": self.released,
+            "pending_reconcile": len(self._touched),
+            "leases_taken": self.leases_taken,
+            "leased_free": sum(lease.free for lease in self._leases.values()),
+        }
+
+
+quota_service = QuotaService(
+    plan_ttl_seconds=settings.quota_plan_cache_seconds,
+    reconcile_interval_seconds=settings.quota_reconcile_interval_seconds,
+    lease_size=settings.quota_lease_size,
+)
+
+
+def dedupe_subscriptions(engine: Engine, dry_run: bool = False) -> Tuple[List[int], List[int]]:
+    """
+    Expire surplus active subscriptions so uq_subscriptions_user_active can be built
+
+    A user with an active paid plan loses their active free ones; a user with
+    only free ones keeps the newest. Paid subscriptions are never expired:
+    users with more than one active paid plan are returned for manual review.
+    Returns (expired subscription ids, user ids to review).
+    """
+    with engine.begin() as conn:
+        duplicated = (
+            select(Subscription.user_id)
+            .where(Subscription.status == "active")
+            .group_by(Subscription.user_id)
+            .having(func.count() > 1)
+        )
+        rows = conn.execute(
+            select(Subscription.id, Subscription.user_id, Subscription.plan_type)
+            .where(Subscription.status == "active", Subscription.user_id.in_(duplicated))
+            .order_by(Subscription.user_id, Subscription.id)
+        ).all()
+
+        by_user = defaultdict(list)
+        for row in rows:
+            by_user[row.user_id].append(row)
+        expired, review = [], []
+        for user_id, subscriptions in by_user.items():
+            free = [row.id for row in subscriptions if row.plan_type == "free"]
+            paid = len(subscriptions) - len(free)
+            expired.extend(free if paid else free[:-1])
+            if paid > 1:
+                review.append(user_id)
+
+        if expired and not dry_run:
+            conn.execute(update(Subscription).where(Subscription.id.in_(expired)).values(status="expired"))
+    for subscription_id in expired:
+        logger.info("Expired duplicate free subscription", subscription_id=subscription_id, dry_run=dry_run)
+    return expired, review
+
+
+def main() -> None:
+    from app.core.database import get_engine, init_db
+
+    parser = argparse.ArgumentParser(description="Subscription quota maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    dedupe_parser = subcommands.add_parser(
+        "dedupe-subscriptions",
+        help="expire duplicate active free subscriptions, then build uq_subscriptions_user_active"
+    )
+    dedupe_parser.add_argument("--dry-run", action="store_true", help="report without changing anything")
+    args = parser.parse_args()
+
+    engine = get_engine()
+    if not inspect(engine).has_table(Subscription.__tablename__):
+        init_db()
+        return
+    expired, review = dedupe_subscriptions(engine, dry_run=args.dry_run)
+    print(f"{'Would expire' if args.dry_run else 'Expired'} {len(expired)} duplicate free subscriptions")
+    if review:
+        print(f"Users with several active paid subscriptions, resolve by hand: {review}")
+    elif not args.dry_run:
+        init_db()
+        indexes = {index["name"] for index in inspect(engine).get_indexes(Subscription.__tablename__)}
+        built = "uq_subscriptions_user_active" in indexes
+        print(f"uq_subscriptions_user_active {'is in place' if built else 'could not be built; see the log'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import math
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+import structlog
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+# (limit, period_seconds) pairs, all of which must allow a request
+Limits = Sequence[Tuple[int, int]]
+
+# GCRA over several windows at once. A request is admitted only if every window
+# allows it, and state is written only when admitted, so a denied request never
+# burns quota. A request of cost n takes n emission intervals. Uses the Redis
+# server clock so workers agree on "now".
+# Returns flat (remaining, reset_after, retry_after) triples as strings because
+# Redis truncates Lua numbers to integers.
+GCRA_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local allowed = 1
+local new_tats = {}
+local out = {}
+local cost = tonumber(ARGV[#ARGV])
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[2 * i - 1])
+    local period = tonumber(ARGV[2 * i])
+    local interval = period / limit
+    local tat = tonumber(redis.call('GET', key)) or now
+    if tat < now then tat = now end
+    local new_tat = tat + interval * cost
+    local allow_at = new_tat - period
+    local remaining, reset_after, retry_after
+    if now < allow_at then
+        allowed = 0
+        remaining = 0
+        reset_after = tat - now
+        retry_after = allow_at - now
+    else
+        remaining = math.floor((now - allow_at) / interval)
+        reset_after = new_tat - now
+        retry_after = 0
+    end
+    new_tats[i] = new_tat
+    out[#out + 1] = tostring(remaining)
+    out[#out + 1] = tostring(reset_after)
+    out[#out + 1] = tostring(retry_after)
+end
+if allowed == 1 then
+    for i, key in ipairs(KEYS) do
+        redis.call('SET', key, tostring(new_tats[i]), 'PX', math.ceil((new_tats[i] - now) * 1000) + 1)
+    end
+end
+table.insert(out, 1, tostring(allowed))
+return out
+"""
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after: float  # Seconds until the window is fully replenished
+    retry_after: float  # Seconds until the next request would be admitted
+
+    def headers(self) -> Dict[str, str]:
+        """X-RateLimit-* and Retry-After response headers"""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(max(self.remaining, 0)),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(math.ceil(self.retry_after), 1))
+        return headers
+
+
+def _binding_result(allowed: bool, limits: Limits, states: List[Tuple[float, float, float]]) -> RateLimitResult:
+    """Report the window that constrains the caller the most"""
+    if allowed:
+        index = min(range(len(limits)), key=lambda i: states[i][0])
+    else:
+        index = max(range(len(limits)), key=lambda i: states[i][2])
+    remaining, reset_after, retry_after = states[index]
+    return RateLimitResult(allowed, limits[index][0], int(remaining), reset_after, retry_after)
+
+
+class TokenBucketLimiter:
+    """In-process token buckets for single-node deployments"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        # key -> (tokens, last refill time) per window
+        self._buckets: Dict[str, List[Tuple[float, float]]] = {}
+
+    def hit(self, key: str, limits: Limits, cost: int = 1) -> RateLimitResult:
+        """Take `cost` tokens from every window if all of them have enough"""
+        now = time.monotonic()
+        buckets = self._buckets.get(key)
+        if buckets is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            buckets = [(float(limit), now) for limit, _ in limits]
+
+        refilled = []
+        for (limit, period), (tokens, updated) in zip(limits, buckets):
+            refilled.append(min(float(limit), tokens + (now - updated) * limit / period))
+
+        allowed = all(tokens >= cost for tokens in refilled)
+        if allowed:
+            refilled = [tokens - cost for tokens in refilled]
+
+        states = []
+        for (limit, period), tokens in zip(limits, refilled):
+            rate = limit / period
+            retry_after = 0.0 if tokens >= cost or allowed else (cost - tokens) / rate
+            states.append((math.floor(tokens), (limit - tokens) / rate, retry_after))
+
+        self._buckets[key] = [(tokens, now) for tokens in refilled]
+        return _binding_result(allowed, limits, states)
+
+
+class RedisRateLimiter:
+    """GCRA limiter shared by all workers through one atomic Lua script"""
+
+    def __init__(self, redis, prefix: str = "ratelimit"):
+        self.prefix = prefix
+        self._script = redis.register_script(GCRA_SCRIPT)
+
+    async def hit(self, key: str, limits: Limits, cost: int = 1) -> RateLimitResult:
+        """Admit or reject a request of `cost` units against every window in one round trip"""
+        keys = [f"{self.prefix}:{key}:{period}" for _, period in limits]
+        args = [value for pair in limits for value in pair] + [cost]
+        raw = await self._script(keys=keys, args=args)
+
+        allowed = raw[0] in (b"1", "1")
+        values = [float(value) for value in raw[1:]]
+        states = [tuple(values[i:i + 3]) for i in range(0, len(values), 3)]
+        return _binding_result(allowed, limits, states)
+
+
+class RateLimiter:
+    """Per-API-key limiter; uses Redis when enabled, otherwise in-process buckets"""
+
+    def __init__(self, per_minute: int, per_hour: int):
+        self.limits: Limits = [(per_minute, 60), (per_hour, 3600)]
+        self.local = TokenBucketLimiter()
+        self._redis_limiter: Optional[RedisRateLimiter] = None
+
+    def _get_redis_limiter(self) -> Optional[RedisRateLimiter]:
+        redis = get_redis()
+        if redis is None:
+            return None
+        if self._redis_limiter is None:
+            self._redis_limiter = RedisRateLimiter(redis)
+        return self._redis_limiter
+
+    async def hit(self, key: str, cost: int = 1) -> RateLimitResult:
+        """Count `cost` requests for a key against the minute and hour limits, all or nothing"""
+        redis_limiter = self._get_redis_limiter()
+        if redis_limiter is not None:
+            try:
+                return await redis_limiter.hit(key, self.limits, cost)
+            except Exception as e:
+                # Degrade to per-worker limits rather than failing the request
+                logger.warning("Redis rate limiter unavailable, using local buckets", error=str(e))
+        return self.local.hit(key, self.limits, cost)
+
+
+rate_limiter = RateLimiter(
+    per_minute=settings.rate_limit_per_minute,
+    per_hour=settings.rate_limit_per_hour,
+)
@@ -0,0 +1,47 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one in-flight task
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task and receive its result (or exception).
+    Waiters are shielded, so one client disconnecting does not cancel the
+    work for everybody else.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Run func once per key at a time and share the outcome"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        """Started vs coalesced call counters"""
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
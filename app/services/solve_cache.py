@@ -0,0 +1,111 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import structlog
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+
+class SolveCache:
+    """
+    Content-addressed cache of solve results
+
+    Tier 1 is an in-process LRU with TTL; tier 2 is Redis (when enabled) so
+    results are shared across workers. Only successful solves are stored.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int, enabled: bool = True):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(image_bytes: bytes, captcha_type: str, prompt_version: str) -> str:
+        """Build a cache key from the image content, CAPTCHA type and prompt version"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f"solve:{prompt_version}:{captcha_type}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: dict) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        """Look up a cached result, checking the local tier before Redis"""
+        if not self.enabled:
+            return None
+
+        value = self._get_local(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                raw = await redis.get(key)
+            except Exception as e:
+                logger.warning("Solve cache Redis lookup failed", error=str(e))
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self._set_local(key, value)
+                self.hits += 1
+                self.redis_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: dict) -> None:
+        """Store a result in both tiers"""
+        if not self.enabled:
+            return
+
+        self._set_local(key, value)
+
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.set(key, json.dumps(value), ex=self.ttl_seconds)
+            except Exception as e:
+                logger.warning("Solve cache Redis write failed", error=str(e))
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size"""
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+        }
+
+
+solve_cache = SolveCache(
+    max_entries=settings.solve_cache_max_entries,
+    ttl_seconds=settings.solve_cache_ttl_seconds,
+    enabled=settings.solve_cache_enabled,
+)
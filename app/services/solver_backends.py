@@ -0,0 +1,118 @@
+import asyncio
+import base64
+import hashlib
+from abc import ABC, abstractmethod
+from typing import FrozenSet, List
+import google.generativeai as genai
+from app.core.config import settings
+from app.services.capsolver_client import capsolver_client
+from app.services.image_preprocessor import PreparedImage
+
+# Bump whenever the prompts change so cached answers from old prompts are not reused
+PROMPT_VERSION = "1"
+
+ALL_CAPTCHA_TYPES = frozenset({"text", "math", "image", "puzzle"})
+
+
+class SolverBackend(ABC):
+    """A provider that turns a prepared CAPTCHA image into its answer"""
+
+    name = ""
+    captcha_types: FrozenSet[str] = ALL_CAPTCHA_TYPES
+
+    @abstractmethod
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        """Return the answer; raise on any failure so the router can fail over"""
+
+
+class GeminiBackend(SolverBackend):
+    """Gemini Vision with a per-type prompt"""
+
+    name = "gemini"
+
+    def __init__(self):
+        genai.configure(api_key=settings.google_api_key)
+        self.model = genai.GenerativeModel(settings.gemini_model)
+        # Bounds in-flight model calls so a burst can't exhaust upstream quota
+        self._inference_semaphore = asyncio.Semaphore(settings.gemini_max_concurrency)
+
+    def _create_captcha_prompt(self, captcha_type: str) -> str:
+        """Create optimized prompt for CAPTCHA solving"""
+        prompts = {
+            "text": """This is a CAPTCHA image containing distorted text.
+            Carefully read and return ONLY the exact alphanumeric characters visible in the image.
+            Do not explain anything. Output only the CAPTCHA text.
+            If the text is unclear or ambiguous, make your best guess based on the most likely characters.""",
+
+            "math": """This is a mathematical CAPTCHA image.
+            Read the mathematical expression or equation shown in the image and solve it.
+            Return ONLY the numerical result as a number.
+            Do not explain anything. Output only the answer.""",
+
+            "image": """This is an image-based CAPTCHA.
+            Look at the image and identify what is being asked (e.g., "select all images with cars").
+            If it's a selection task, respond with "SELECT" if the image matches the criteria, or "SKIP" if it doesn't.
+            If it's an identification task, describe what you see in the image in simple terms.""",
+
+            "puzzle": """This is a puzzle CAPTCHA image.
+            Analyze the image and provide the solution to the puzzle shown.
+            Return ONLY the answer or solution. Do not explain anything."""
+        }
+
+        return prompts.get(captcha_type, prompts["text"])
+
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        """Call Gemini without blocking the event loop"""
+        prompt = self._create_captcha_prompt(captcha_type)
+        async with self._inference_semaphore:
+            response = await self.model.generate_content_async([prompt, image.as_blob()])
+        if not response.text:
+            raise ValueError("No response from Gemini API")
+        return response.text.strip()
+
+
+class CapSolverBackend(SolverBackend):
+    """CapSolver ImageToTextTask; reads text but does not solve math or visual puzzles"""
+
+    name = "capsolver"
+    captcha_types = frozenset({"text"})
+
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        solution = await capsolver_client.solve({
+            "type": "ImageToTextTask",
+            "body": base64.b64encode(image.data).decode("ascii"),
+        })
+        text = (solution.get("text") or "").strip()
+        if not text:
+            raise ValueError("No response from CapSolver")
+        return text
+
+
+class StubBackend(SolverBackend):
+    """Local deterministic answers for tests and load runs; never calls out"""
+
+    name = "stub"
+
+    def __init__(self, latency_ms: int = 0):
+        self.latency = latency_ms / 1000
+
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        digest = hashlib.sha256(image.data).hexdigest()
+        if captcha_type == "math":
+            return str(int(digest[:8], 16) % 100)
+        return digest[:5].upper()
+
+
+def create_backends(names: List[str]) -> List[SolverBackend]:
+    """Instantiate the configured backends, in preference order"""
+    factories = {
+        GeminiBackend.name: GeminiBackend,
+        CapSolverBackend.name: CapSolverBackend,
+        StubBackend.name: lambda: StubBackend(settings.stub_solver_latency_ms),
+    }
+    unknown = [name for name in names if name not in factories]
+    if unknown:
+        raise ValueError(f"Unknown solver backends {unknown}; choose from {sorted(factories)}")
+    return [factories[name]() for name in names]
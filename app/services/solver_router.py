@@ -0,0 +1,295 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+import structlog
+from app.core import metrics
+from app.services.deadline import Deadline, DeadlineExceeded
+from app.services.image_preprocessor import PreparedImage
+from app.services.solver_backends import SolverBackend
+
+logger = structlog.get_logger()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Successful calls needed before a backend's p95 is trusted as a hedge delay
+HEDGE_MIN_SAMPLES = 20
+# Unused hedge budget that can pile up, so a quiet spell can't fund a burst of hedges
+HEDGE_BURST = 5.0
+
+
+class NoBackendAvailable(Exception):
+    """Every backend for a captcha type is circuit-broken or none supports it"""
+
+
+class BackendHealth:
+    """Live latency, error rate and circuit state of one backend for one captcha type"""
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None  # EWMA seconds of successful calls
+        self.error_rate = 0.0  # EWMA of failures (1) and successes (0)
+        self.samples = 0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_started: Optional[float] = None  # Half-open probe in flight since
+        self.last_used = time.monotonic()
+        self._recent: Deque[float] = deque(maxlen=200)  # Latest successful call times
+
+    def state(self, now: float, cooldown: float) -> str:
+        if self.opened_at is None:
+            return CLOSED
+        return OPEN if now - self.opened_at < cooldown else HALF_OPEN
+
+    def expected_seconds(self) -> float:
+        """Expected time to a successful answer; untried backends rank last until probed"""
+        if self.latency is None:
+            return float("inf")
+        return self.latency / max(1.0 - self.error_rate, 0.05)
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.samples += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency = seconds if self.latency is None else self.latency + self.alpha * (seconds - self.latency)
+            self._recent.append(seconds)
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+
+    def p95(self) -> Optional[float]:
+        """95th percentile of recent successful calls, once there are enough of them"""
+        if len(self._recent) < HEDGE_MIN_SAMPLES:
+            return None
+        recent = sorted(self._recent)
+        return recent[int(len(recent) * 0.95)]
+
+
+class SolverRouter:
+    """
+    Picks a solver backend per captcha_type by live latency and error rate
+
+    Candidates are ordered by EWMA latency inflated by EWMA error rate,
+    with configuration order breaking ties. A failed call falls through to
+    the next candidate. A backend whose calls keep failing is circuit-broken
+    for `cooldown` seconds, then gets a single half-open probe request that
+    either closes the circuit again or re-opens it. Backends that lost on
+    latency are re-measured with one request every `probe_interval` seconds
+    so a recovered provider wins its traffic back.
+
+    With a hedge_budget above zero, a call still running after the backend's
+    observed p95 gets a second, hedged call to the next candidate (or the
+    same backend when it is the only one), and the first answer wins. Each
+    solve earns hedge_budget tokens and each hedge spends one, so at most
+    that fraction of solves is hedged over time.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[SolverBackend],
+        alpha: float,
+        failure_threshold: int,
+        error_rate_threshold: float,
+        min_samples: int,
+        cooldown: float,
+        probe_interval: float,
+        hedge_budget: float = 0.0
+    ):
+        self.backends = list(backends)
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.probe_interval = probe_interval
+        self.hedge_budget = hedge_budget
+        self._health: Dict[Tuple[str, str], BackendHealth] = {}
+        self._hedge_tokens = 0.0
+        self.failovers = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _get_health(self, backend: SolverBackend, captcha_type: str) -> BackendHealth:
+        key = (backend.name, captcha_type)
+        health = self._health.get(key)
+        if health is None:
+            health = self._health[key] = BackendHealth(self.alpha)
+        return health
+
+    def _candidates(self, captcha_type: str) -> List[SolverBackend]:
+        """Backends to try for this request, best first"""
+        now = time.monotonic()
+        ranked = []
+        probe = None
+        for priority, backend in enumerate(self.backends):
+            if captcha_type not in backend.captcha_types:
+                continue
+            health = self._get_health(backend, captcha_type)
+            state = health.state(now, self.cooldown)
+            if state == HALF_OPEN:
+                # One request probes; others skip the backend until it reports back or the probe goes stale
+                if health.probe_started is not None and now - health.probe_started < self.cooldown:
+                    continue
+                health.probe_started = now
+                probe = probe or backend
+            elif state == OPEN:
+                continue
+            ranked.append((health.expected_seconds(), priority, backend))
+        ranked.sort(key=lambda item: item[:2])
+        candidates = [backend for _, _, backend in ranked]
+
+        if probe is None:
+            # Re-measure one backend that has been losing on latency (or never tried) for a while
+            for backend in candidates[1:]:
+                health = self._get_health(backend, captcha_type)
+                if now - health.last_used >= self.probe_interval:
+                    health.last_used = now
+                    probe = backend
+                    break
+        if probe is not None:
+            candidates.remove(probe)
+            candidates.insert(0, probe)
+        return candidates
+
+    def _record(self, backend: SolverBackend, captcha_type: str, seconds: float, ok: bool) -> None:
+        health = self._get_health(backend, captcha_type)
+        health.record(seconds, ok)
+        health.last_used = time.monotonic()
+        metrics.BACKEND_SECONDS.labels(backend.name, captcha_type).observe(seconds)
+        metrics.BACKEND_CALLS.labels(backend.name, captcha_type, "success" if ok else "failure").inc()
+
+        if ok:
+            if health.opened_at is not None:
+                logger.info("Solver backend recovered", backend=backend.name, captcha_type=captcha_type)
+            health.opened_at = None
+            health.probe_started = None
+            return
+        tripped = health.consecutive_failures >= self.failure_threshold or (
+            health.samples >= self.min_samples and health.error_rate >= self.error_rate_threshold
+        )
+        if health.opened_at is not None or tripped:
+            # A failed half-open probe re-opens the circuit for another cooldown
+            if health.opened_at is None:
+                metrics.CIRCUIT_OPENS.labels(backend.name, captcha_type).inc()
+                logger.warning(
+                    "Solver backend circuit opened",
+                    backend=backend.name,
+                    captcha_type=captcha_type,
+                    error_rate=round(health.error_rate, 3),
+                    consecutive_failures=health.consecutive_failures
+                )
+            health.opened_at = time.monotonic()
+            health.probe_started = None
+
+    async def _attempt(
+        self,
+        backend: SolverBackend,
+        image: PreparedImage,
+        captcha_type: str,
+        deadline: Optional[Deadline]
+    ) -> str:
+        """One backend call within the deadline; a cancelled (hedge losing) call is not recorded"""
+        started = time.perf_counter()
+        try:
+            if deadline is None:
+                answer = await backend.solve(image, captcha_type)
+            else:
+                answer = await deadline.run(backend.solve(image, captcha_type))
+        except DeadlineExceeded:
+            # The caller's budget ran out; that says nothing about the backend's health
+            metrics.BACKEND_CALLS.labels(backend.name, captcha_type, "timeout").inc()
+            raise
+        except Exception as e:
+            self._record(backend, captcha_type, time.perf_counter() - started, ok=False)
+            logger.warning("Solver backend failed", backend=backend.name, captcha_type=captcha_type, error=str(e))
+            raise
+        self._record(backend, captcha_type, time.perf_counter() - started, ok=True)
+        return answer
+
+    async def _hedged(
+        self,
+        primary: SolverBackend,
+        candidates: List[SolverBackend],
+        image: PreparedImage,
+        captcha_type: str,
+        deadline: Optional[Deadline]
+    ) -> Tuple[str, str]:
+        """Call primary, hedging to the next candidate once it runs past its p95"""
+        delay = self._get_health(primary, captcha_type).p95()
+        if delay is None:
+            return await self._attempt(primary, image, captcha_type, deadline), primary.name
+
+        primary_call = asyncio.ensure_future(self._attempt(primary, image, captcha_type, deadline))
+        calls = {primary_call: primary}
+        try:
+            done, _ = await asyncio.wait(calls, timeout=delay)
+            if not done and self._hedge_tokens >= 1 and (deadline is None or deadline.remaining() > 0):
+                self._hedge_tokens -= 1
+                self.hedged += 1
+                # A backend tried here is not retried by the failover loop
+                hedge = candidates.pop(0) if candidates else primary
+                calls[asyncio.ensure_future(self._attempt(hedge, image, captcha_type, deadline))] = hedge
+            pending = set(calls)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for call in done:
+                    if not call.cancelled() and call.exception() is None:
+                        if len(calls) > 1:
+                            metrics.HEDGES.labels(captcha_type, "primary" if call is primary_call else "hedge").inc()
+                            if call is not primary_call:
+                                self.hedge_wins += 1
+                        return call.result(), calls[call].name
+            # Every call failed; surface the primary's error
+            raise primary_call.exception()
+        finally:
+            for call in calls:
+                call.cancel()
+
+    async def solve(
+        self,
+        image: PreparedImage,
+        captcha_type: str,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[str, str]:
+        """Answer from the best healthy backend, failing over on errors; returns (answer, backend name)"""
+        candidates = self._candidates(captcha_type)
+        if not candidates:
+            raise NoBackendAvailable(f"No healthy solver backend for captcha_type {captcha_type}")
+        self._hedge_tokens = min(self._hedge_tokens + self.hedge_budget, HEDGE_BURST)
+
+        last_error: Optional[Exception] = None
+        attempt = 0
+        while candidates:
+            backend = candidates.pop(0)
+            if attempt:
+                self.failovers += 1
+            attempt += 1
+            try:
+                if attempt == 1 and self.hedge_budget > 0:
+                    return await self._hedged(backend, candidates, image, captcha_type, deadline)
+                return await self._attempt(backend, image, captcha_type, deadline), backend.name
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+        raise last_error
+
+    def stats(self) -> Dict[str, object]:
+        """Per backend and captcha type latency, error rate and circuit state"""
+        now = time.monotonic()
+        return {
+            "failovers": self.failovers,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "backends": {
+                f"{name}:{captcha_type}": {
+                    "state": health.state(now, self.cooldown),
+                    "latency_ms": round(health.latency * 1000, 1) if health.latency is not None else None,
+                    "error_rate": round(health.error_rate, 3),
+                    "samples": health.samples,
+                }
+                for (name, captcha_type), health in self._health.items()
+            },
+        }
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Set
+import structlog
+from app.core.redis import get_redis
+
+logger = structlog.get_logger()
+
+
+class Subscription:
+    """One streaming client's bounded inbox of finished tasks"""
+
+    def __init__(self, owner: int, max_pending: int):
+        self.owner = owner
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=max_pending)
+        self._dropped: Deque[str] = deque(maxlen=max_pending * 10)
+        self.dropped = 0
+
+    def offer(self, task: dict) -> bool:
+        """Enqueue without blocking; a full inbox drops the event and remembers its task id"""
+        try:
+            self.queue.put_nowait(task)
+            return True
+        except asyncio.QueueFull:
+            self._dropped.append(task["id"])
+            self.dropped += 1
+            return False
+
+    def take_dropped(self) -> List[str]:
+        """Task ids dropped since the last call, so the client can fetch them"""
+        dropped = list(self._dropped)
+        self._dropped.clear()
+        return dropped
+
+
+class TaskEventBroker:
+    """
+    Fan-out of finished tasks to their owners' streaming connections
+
+    Every connection gets a bounded inbox. A consumer that falls behind
+    loses events rather than growing memory or slowing the workers; it is
+    told which task ids it missed so it can fetch them from the task
+    endpoint. With Redis enabled, events go through a pub/sub channel so
+    tasks finished by any process reach subscribers on every API process.
+    """
+
+    def __init__(self, name: str, max_pending: int):
+        self.channel = f"tasks:{name}:events"
+        self.max_pending = max_pending
+        self._subscribers: Dict[int, Set[Subscription]] = defaultdict(set)
+        self._listener: Optional[asyncio.Task] = None
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, owner: int) -> Subscription:
+        subscription = Subscription(owner, self.max_pending)
+        self._subscribers[owner].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.owner)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.owner]
+
+    def _dispatch(self, task: dict) -> None:
+        for subscription in self._subscribers.get(task.get("owner"), ()):
+            if subscription.offer(task):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+
+    async def publish(self, task: dict) -> None:
+        """Deliver a finished task to its owner's subscribers on every process"""
+        self.published += 1
+        redis = get_redis()
+        if redis is not None:
+            try:
+                await redis.publish(self.channel, json.dumps(task))
+                return
+            except Exception as e:
+                logger.warning("Task event publish failed, delivering locally", error=str(e))
+        self._dispatch(task)
+
+    async def _listen(self, redis) -> None:
+        while True:
+            try:
+                async with redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Task event listener failed, reconnecting", error=str(e))
+                await asyncio.sleep(1)
+
+    async def start(self) -> None:
+        """Listen for events from other processes when Redis is enabled"""
+        redis = get_redis()
+        if redis is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen(redis))
+
+    async def stop(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    def stats(self) -> Dict[str, int]:
+        """Subscriber and delivery counters"""
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Union
+import structlog
+from app.core.redis import get_redis
+from app.services.task_events import TaskEventBroker
+
+logger = structlog.get_logger()
+
+# handler(payload, blob) -> result; raising marks the task failed with the error message
+TaskHandler = Callable[[dict, Optional[bytes]], Awaitable[dict]]
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+FINISHED = (COMPLETED, FAILED)
+
+
+class QueueFull(Exception):
+    """Raised when a task is submitted to a queue that is at capacity"""
+
+
+def _payload_size(payload: dict, blob: Optional[bytes]) -> int:
+    """Approximate bytes held for a queued task: the blob plus string payload fields"""
+    size = len(blob) if blob is not None else 0
+    return size + sum(len(value) for value in payload.values() if isinstance(value, (str, bytes)))
+
+
+def _new_task(owner: Optional[Union[int, str]]) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "owner": owner,
+        "status": QUEUED,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "result": None,
+        "error": None,
+    }
+
+
+class MemoryTaskBackend:
+    """
+    Tasks and queue held in this process; lost on restart
+
+    The queue is bounded by task count and by the bytes of the payloads
+    waiting in it. Tasks stuck "running" for longer than
+    running_timeout_seconds are marked failed, then expire like any other.
+    """
+
+    def __init__(
+        self,
+        max_queue: int,
+        result_ttl_seconds: int,
+        max_queue_bytes: Optional[int] = None,
+        running_timeout_seconds: Optional[float] = None
+    ):
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_queue_bytes = max_queue_bytes
+        self.running_timeout = running_timeout_seconds
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self._tasks: "OrderedDict[str, dict]" = OrderedDict()
+        self._payloads: Dict[str, Tuple[dict, Optional[bytes], int]] = {}
+        self._queued_bytes = 0
+        self._expired_at = 0.0
+
+    def _expire(self) -> None:
+        """Drop finished tasks past their TTL and fail stuck running ones; scans at most once a second"""
+        now = time.time()
+        if now - self._expired_at < 1:
+            return
+        self._expired_at = now
+        cutoff = now - self.result_ttl_seconds
+        stuck_before = now - self.running_timeout if self.running_timeout else None
+        for task_id, task in list(self._tasks.items()):
+            if task["status"] in FINISHED:
+                if task["finished_at"] <= cutoff:
+                    del self._tasks[task_id]
+            elif task["status"] == RUNNING and stuck_before is not None and task["started_at"] < stuck_before:
+                task["status"] = FAILED
+                task["error"] = "Task timed out"
+                task["finished_at"] = now
+                logger.warning("Failing stuck task", task_id=task_id)
+
+    async def push(self, task: dict, payload: dict, blob: Optional[bytes]) -> int:
+        self._expire()
+        size = _payload_size(payload, blob)
+        if self.max_queue_bytes is not None and self._queued_bytes + size > self.max_queue_bytes:
+            raise QueueFull()
+        try:
+            self._queue.put_nowait(task["id"])
+        except asyncio.QueueFull:
+            raise QueueFull()
+        self._tasks[task["id"]] = task
+        self._payloads[task["id"]] = (payload, blob, size)
+        self._queued_bytes += size
+        return self._queue.qsize()
+
+    async def pop(self) -> Optional[Tuple[dict, dict, Optional[bytes]]]:
+        try:
+            # Time out now and then so workers notice shutdown
+            task_id = await asyncio.wait_for(self._queue.get(), 1)
+        except asyncio.TimeoutError:
+            return None
+        payload, blob, size = self._payloads.pop(task_id)
+        self._queued_bytes -= size
+        return self._tasks[task_id], payload, blob
+
+    async def save(self, task: dict) -> None:
+        self._tasks[task["id"]] = task
+
+    async def get(self, task_id: str) -> Optional[dict]:
+        return self._tasks.get(task_id)
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def queued_bytes(self) -> int:
+        return self._queued_bytes
+
+
+class RedisTaskBackend:
+    """Tasks shared by every API and worker process through Redis"""
+
+    def __init__(self, redis, name: str, max_queue: int, result_ttl_seconds: int):
+        self.redis = redis
+        self.prefix = f"tasks:{name}"
+        self.max_queue = max_queue
+        self.result_ttl_seconds = result_ttl_seconds
+        self._depth = 0  # As of the last push or pop by this process
+
+    def _key(self, kind: str, task_id: str) -> str:
+        return f"{self.prefix}:{kind}:{task_id}"
+
+    async def push(self, task: dict, payload: dict, blob: Optional[bytes]) -> int:
+        if await self.redis.llen(f"{self.prefix}:queue") >= self.max_queue:
+            raise QueueFull()
+        ttl = self.result_ttl_seconds
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._key("task", task["id"]), json.dumps(task), ex=ttl)
+            pipe.set(self._key("payload", task["id"]), json.dumps(payload), ex=ttl)
+            if blob is not None:
+                pipe.set(self._key("blob", task["id"]), bytes(blob), ex=ttl)
+            pipe.rpush(f"{self.prefix}:queue", task["id"])
+            results = await pipe.execute()
+        self._depth = results[-1]
+        return self._depth
+
+    async def pop(self) -> Optional[Tuple[dict, dict, Optional[bytes]]]:
+        item = await self.redis.blpop([f"{self.prefix}:queue"], timeout=1)
+        if item is None:
+            return None
+        task_id = item[1].decode()
+        self._depth = max(self._depth - 1, 0)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.get(self._key("task", task_id))
+            pipe.get(self._key("payload", task_id))
+            pipe.get(self._key("blob", task_id))
+            pipe.delete(self._key("payload", task_id), self._key("blob", task_id))
+            task, payload, blob, _ = await pipe.execute()
+        if task is None or payload is None:
+            logger.warning("Dropping expired task", task_id=task_id)
+            return None
+        return json.loads(task), json.loads(payload), blob
+
+    async def save(self, task: dict) -> None:
+        await self.redis.set(self._key("task", task["id"]), json.dumps(task), ex=self.result_ttl_seconds)
+
+    async def get(self, task_id: str) -> Optional[dict]:
+        value = await self.redis.get(self._key("task", task_id))
+        return json.loads(value) if value is not None else None
+
+    def depth(self) -> int:
+        return self._depth
+
+
+class TaskQueue:
+    """
+    Background solve tasks with an in-process worker pool
+
+    submit() stores the task and returns immediately; workers run the
+    handler and store the result for result_ttl_seconds. With Redis enabled
+    the queue and results are shared, so any API or standalone worker
+    process can run a task and any API process can report on it. Without
+    Redis everything lives in this process, bounded by max_queue tasks and
+    max_queue_bytes of queued payloads. Delivery is at most once: a task
+    whose worker dies mid-solve stays "running" until it expires, or in
+    memory until running_timeout_seconds marks it failed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: TaskHandler,
+        max_queue: int,
+        result_ttl_seconds: int,
+        poll_interval_seconds: float = 0.25,
+        events: Optional[TaskEventBroker] = None,
+        max_queue_bytes: Optional[int] = None,
+        running_timeout_seconds: Optional[float] = None
+    ):
+        self.name = name
+        self.handler = handler
+        self.max_queue = max_queue
+        self.max_queue_bytes = max_queue_bytes
+        self.running_timeout_seconds = running_timeout_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.poll_interval = poll_interval_seconds
+        self.events = events
+        self._backend = None
+        self._workers: List[asyncio.Task] = []
+        self._stopping = False
+        self._finished: Dict[str, asyncio.Event] = {}
+        self._wait_samples: Deque[float] = deque(maxlen=1000)
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at: Optional[float] = None
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _get_backend(self):
+        if self._backend is None:
+            redis = get_redis()
+            if redis is not None:
+                self._backend = RedisTaskBackend(redis, self.name, self.max_queue, self.result_ttl_seconds)
+            else:
+                self._backend = MemoryTaskBackend(
+                    self.max_queue,
+                    self.result_ttl_seconds,
+                    max_queue_bytes=self.max_queue_bytes,
+                    running_timeout_seconds=self.running_timeout_seconds,
+                )
+        return self._backend
+
+    async def submit(
+        self,
+        payload: dict,
+        blob: Optional[bytes] = None,
+        owner: Optional[Union[int, str]] = None
+    ) -> dict:
+        """Queue a task for `owner` (a user id, or any token the caller checks on read); raises QueueFull when full"""
+        task = _new_task(owner)
+        try:
+            await self._get_backend().push(task, payload, blob)
+        except QueueFull:
+            self.rejected += 1
+            raise
+        self.submitted += 1
+        return task
+
+    async def get(self, task_id: str) -> Optional[dict]:
+        return await self._get_backend().get(task_id)
+
+    async def wait(self, task_id: str, timeout: float) -> Optional[dict]:
+        """Long-poll until the task finishes or timeout passes; returns its latest state"""
+        deadline = time.monotonic() + timeout
+        event = self._finished.setdefault(task_id, asyncio.Event())
+        try:
+            while True:
+                task = await self.get(task_id)
+                remaining = deadline - time.monotonic()
+                if task is None or task["status"] in FINISHED or remaining <= 0:
+                    return task
+                # Local completions wake us at once; other processes are seen on the next poll
+                try:
+                    await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if not event.is_set():
+                self._finished.pop(task_id, None)
+
+    async def _execute(self, task: dict, payload: dict, blob: Optional[bytes]) -> None:
+        task["status"] = RUNNING
+        task["started_at"] = time.time()
+        self._wait_samples.append(task["started_at"] - task["created_at"])
+        await self._get_backend().save(task)
+
+        try:
+            task["result"] = await self.handler(payload, blob)
+            task["status"] = COMPLETED
+            self.completed += 1
+        except Exception as e:
+            task["status"] = FAILED
+            task["error"] = str(e)
+            self.failed += 1
+            logger.warning("Task failed", queue=self.name, task_id=task["id"], error=str(e))
+        task["finished_at"] = time.time()
+        await self._get_backend().save(task)
+
+        event = self._finished.pop(task["id"], None)
+        if event is not None:
+            event.set()
+        if self.events is not None:
+            await self.events.publish(task)
+
+    async def _worker(self) -> None:
+        backend = self._get_backend()
+        while not self._stopping:
+            try:
+                item = await backend.pop()
+            except Exception as e:
+                logger.error("Task queue unavailable", queue=self.name, error=str(e))
+                await asyncio.sleep(1)
+                continue
+            if item is None:
+                continue
+
+            self._busy += 1
+            started = time.monotonic()
+            try:
+                await self._execute(*item)
+            except Exception as e:
+                logger.error("Failed to store task state", queue=self.name, error=str(e))
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started
+
+    async def start(self, workers: int) -> None:
+        """Start `workers` worker tasks in this process (0 only serves submit and status)"""
+        if self._workers:
+            return
+        if not workers and isinstance(self._get_backend(), MemoryTaskBackend):
+            logger.warning("No task workers and no Redis queue; async tasks will never run", queue=self.name)
+        self._stopping = False
+        self._started_at = time.monotonic()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+
+    async def stop(self) -> None:
+        """Let running tasks finish, then stop the workers"""
+        self._stopping = True
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth, wait time and worker utilization"""
+        waits = sorted(self._wait_samples)
+        workers = len(self._workers)
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        return {
+            "backend": "redis" if isinstance(self._backend, RedisTaskBackend) else "memory",
+            "queue_depth": self._backend.depth() if self._backend is not None else 0,
+            "queued_bytes": self._backend.queued_bytes() if isinstance(self._backend, MemoryTaskBackend) else None,
+            "workers": workers,
+            "busy_workers": self._busy,
+            "utilization": round(self._busy_seconds / (workers * uptime), 3) if workers and uptime else 0.0,
+            "wait_ms_p50": round(waits[len(waits) // 2] * 1000, 1) if waits else 0.0,
+            "wait_ms_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0.0,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,111 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.database import get_async_session_factory
+from app.models.database import UsageRecord
+
+EXPORT_FIELDS = ["id", "api_key_id", "captcha_type", "success", "response_time_ms", "created_at"]
+
+
+class HistoryFilters(NamedTuple):
+    captcha_type: Optional[str] = None
+    success: Optional[bool] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+
+def encode_cursor(created_at: datetime, record_id: int) -> str:
+    """Opaque cursor for the last record of a page"""
+    raw = f"{created_at.isoformat()}|{record_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, record_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        return datetime.fromisoformat(created_at), int(record_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _history_query(user_id: int, filters: HistoryFilters, after: Optional[Tuple[datetime, int]], limit: int):
+    """Newest-first page served by ix_usage_records_user_created_id"""
+    query = select(UsageRecord).where(UsageRecord.user_id == user_id)
+    if filters.captcha_type is not None:
+        query = query.where(UsageRecord.captcha_type == filters.captcha_type)
+    if filters.success is not None:
+        query = query.where(UsageRecord.success == filters.success)
+    if filters.start is not None:
+        query = query.where(UsageRecord.created_at >= filters.start)
+    if filters.end is not None:
+        query = query.where(UsageRecord.created_at < filters.end)
+    if after is not None:
+        query = query.where(tuple_(UsageRecord.created_at, UsageRecord.id) < tuple_(*after))
+    return query.order_by(UsageRecord.created_at.desc(), UsageRecord.id.desc()).limit(limit)
+
+
+async def fetch_page(
+    db: AsyncSession,
+    user_id: int,
+    filters: HistoryFilters,
+    cursor: Optional[str],
+    limit: int
+) -> Tuple[List[UsageRecord], Optional[str]]:
+    """One page of history plus the cursor for the next page (None at the end)"""
+    after = decode_cursor(cursor) if cursor else None
+    result = await db.execute(_history_query(user_id, filters, after, limit + 1))
+    records = list(result.scalars())
+
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        next_cursor = encode_cursor(records[-1].created_at, records[-1].id)
+    return records, next_cursor
+
+
+def _export_row(record: UsageRecord) -> dict:
+    row = {field: getattr(record, field) for field in EXPORT_FIELDS}
+    row["created_at"] = record.created_at.isoformat() if record.created_at else None
+    return row
+
+
+async def export_history(
+    user_id: int,
+    filters: HistoryFilters,
+    export_format: str,
+    chunk_size: int = 1000
+) -> AsyncIterator[str]:
+    """Stream a user's full history as NDJSON or CSV, one keyset chunk at a time"""
+    if export_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        yield buffer.getvalue()
+
+    after = None
+    while True:
+        # A short-lived session per chunk keeps no connection pinned for slow downloads
+        async with get_async_session_factory()() as db:
+            result = await db.execute(_history_query(user_id, filters, after, chunk_size))
+            records = list(result.scalars())
+        if not records:
+            return
+
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writerows(_export_row(record) for record in records)
+            yield buffer.getvalue()
+        else:
+            yield "".join(json.dumps(_export_row(record)) + "\n" for record in records)
+
+        if len(records) < chunk_size:
+            return
+        after = (records[-1].created_at, records[-1].id)
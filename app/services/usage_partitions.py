@@ -0,0 +1,336 @@
+"""
+Time partitioning, retention and archival for usage_records
+
+On Postgres, usage_records is created as a table partitioned by month on
+created_at, with partitions created `usage_partition_months_ahead` months
+in advance. The retention job copies partitions older than
+`usage_retention_months` to gzip-compressed CSV files under
+`usage_archive_dir`, then detaches and drops them. Rows that landed in the
+DEFAULT partition before their month's partition existed are moved into it
+when it is created, or archived row by row once they expire. Aggregates
+survive in usage_rollups.
+
+On SQLite (or a Postgres table created before partitioning) the same job
+archives and deletes old rows in id-ordered chunks instead.
+
+Run maintenance by hand with:
+    python -m app.services.usage_partitions maintain
+"""
+import argparse
+import asyncio
+import csv
+import fcntl
+import gzip
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+import structlog
+from sqlalchemy import delete, inspect, select, text
+from sqlalchemy.engine import Engine
+from app.core.config import settings
+from app.models.database import APIKey, Base, UsageRecord, User
+
+logger = structlog.get_logger()
+
+PARENT_TABLE = "usage_records"
+PARTITION_NAME = re.compile(r"^usage_records_p(\d{4})_(\d{2})$")
+# Arbitrary constant so only one worker runs maintenance at a time
+MAINTENANCE_LOCK_ID = 72_190_411
+# Serializes partition creation, which also runs from init_db in every worker
+PARTITION_LOCK_ID = 72_190_412
+
+PARTITIONED_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS usage_records (
+    id BIGSERIAL,
+    user_id INTEGER REFERENCES users (id),
+    api_key_id INTEGER REFERENCES api_keys (id),
+    captcha_type VARCHAR,
+    success BOOLEAN,
+    response_time_ms INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)
+"""
+
+
+def _add_months(year: int, month: int, months: int) -> Tuple[int, int]:
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def partition_name(year: int, month: int) -> str:
+    return f"{PARENT_TABLE}_p{year:04d}_{month:02d}"
+
+
+def create_partitioned_table(engine: Engine) -> None:
+    """Create usage_records as a partitioned table with its upcoming partitions (Postgres)"""
+    Base.metadata.create_all(bind=engine, tables=[User.__table__, APIKey.__table__])
+    with engine.begin() as conn:
+        conn.execute(text(PARTITIONED_TABLE_DDL))
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {PARENT_TABLE}_default PARTITION OF {PARENT_TABLE} DEFAULT"
+        ))
+    ensure_partitions(engine, settings.usage_partition_months_ahead)
+
+
+def is_partitioned(engine: Engine) -> bool:
+    if engine.dialect.name != "postgresql":
+        return False
+    with engine.connect() as conn:
+        return bool(conn.execute(text(
+            "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+            "WHERE c.relname = :name"
+        ), {"name": PARENT_TABLE}).scalar())
+
+
+def list_partitions(engine: Engine) -> List[Tuple[str, int, int]]:
+    """Monthly partitions as (name, year, month), oldest first"""
+    with engine.connect() as conn:
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = :name"
+        ), {"name": PARENT_TABLE}).scalars()
+        partitions = []
+        for name in names:
+            match = PARTITION_NAME.match(name)
+            if match:
+                partitions.append((name, int(match.group(1)), int(match.group(2))))
+    return sorted(partitions, key=lambda partition: (partition[1], partition[2]))
+
+
+def ensure_partitions(engine: Engine, months_ahead: int, now: Optional[datetime] = None) -> List[str]:
+    """Create missing monthly partitions from the current month through months_ahead
+
+    Each month is created in its own transaction, so one failure doesn't
+    undo the rest. Returns the names of the partitions created.
+    """
+    now = now or datetime.utcnow()
+    created = []
+    for offset in range(months_ahead + 1):
+        year, month = _add_months(now.year, now.month, offset)
+        next_year, next_month = _add_months(year, month, 1)
+        name = partition_name(year, month)
+        with engine.begin() as conn:
+            conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": PARTITION_LOCK_ID})
+            if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar() is not None:
+                continue
+            _create_partition(conn, name, f"{year:04d}-{month:02d}-01", f"{next_year:04d}-{next_month:02d}-01")
+        created.append(name)
+    return created
+
+
+def _create_partition(conn, name: str, start: str, end: str) -> None:
+    """Create a partition for [start, end), moving in rows the DEFAULT partition holds for that range
+
+    Postgres refuses `PARTITION OF` while the default partition has rows
+    in the new range, so build the table, move the rows, then attach it.
+    """
+    default = f"{PARENT_TABLE}_default"
+    conn.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :start AND created_at < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), {"start": start, "end": end}).rowcount
+    conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    if moved:
+        logger.info("Moved usage records out of the default partition", partition=name, count=moved)
+
+
+def _archive_path(archive_dir: str, name: str) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    return os.path.join(archive_dir, f"{name}.csv.gz")
+
+
+def _fsync(path: str) -> None:
+    """Flush a closed file to disk before it is renamed into place"""
+    with open(path, "rb") as written:
+        os.fsync(written.fileno())
+
+
+def archive_partition(engine: Engine, name: str, archive_dir: str) -> str:
+    """COPY a partition to a gzip CSV file, then detach and drop it"""
+    path = _archive_path(archive_dir, name)
+    raw = engine.raw_connection()
+    try:
+        with gzip.open(path + ".tmp", "wt", newline="") as archive:
+            cursor = raw.cursor()
+            cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER true)", archive)
+            cursor.close()
+        raw.commit()
+    finally:
+        raw.close()
+    _fsync(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+    logger.info("Archived usage partition", partition=name, path=path)
+    return path
+
+
+def _archive_rows_file(engine: Engine, cutoff: datetime, archive_dir: str, chunk_size: int, file_rows: int) -> int:
+    """
+    Archive up to file_rows rows older than cutoff into one file, then delete them
+
+    Rows are read in id-ordered chunks inside one transaction. The file is
+    written under a .tmp name and renamed once complete, and the delete
+    commits only after that, so a failure leaves either no archive and all
+    rows, or a complete archive and rows a later run archives again.
+    """
+    table = UsageRecord.__table__
+    archive = path = last_id = None
+    count = 0
+    with engine.begin() as conn:
+        try:
+            while count < file_rows:
+                query = (
+                    select(table)
+                    .where(table.c.created_at < cutoff)
+                    .order_by(table.c.id)
+                    .limit(min(chunk_size, file_rows - count))
+                )
+                if last_id is not None:
+                    query = query.where(table.c.id > last_id)
+                rows = conn.execute(query).all()
+                if not rows:
+                    break
+                if archive is None:
+                    # Named after the first archived id so files never collide
+                    path = _archive_path(archive_dir, f"{PARENT_TABLE}_before_{cutoff:%Y_%m}_from_{rows[0].id}")
+                    archive = gzip.open(path + ".tmp", "wt", newline="")
+                    writer = csv.writer(archive)
+                    writer.writerow([column.name for column in table.columns])
+                writer.writerows([tuple(row) for row in rows])
+                last_id = rows[-1].id
+                count += len(rows)
+        except BaseException:
+            if archive is not None:
+                archive.close()
+                os.remove(path + ".tmp")
+            raise
+        if archive is None:
+            return 0
+
+        archive.close()
+        _fsync(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        conn.execute(delete(table).where(table.c.created_at < cutoff, table.c.id <= last_id))
+
+    logger.info("Archived usage records", count=count, path=path)
+    return count
+
+
+def archive_rows(
+    engine: Engine,
+    cutoff: datetime,
+    archive_dir: str,
+    chunk_size: int = 10000,
+    file_rows: int = 1_000_000
+) -> int:
+    """Archive and delete rows older than cutoff, file_rows per file (SQLite / unpartitioned fallback)"""
+    archived = 0
+    while True:
+        count = _archive_rows_file(engine, cutoff, archive_dir, chunk_size, file_rows)
+        if not count:
+            return archived
+        archived += count
+
+
+def apply_retention(engine: Engine, retention_months: int, archive_dir: str, now: Optional[datetime] = None) -> int:
+    """Archive usage older than retention_months; returns partitions plus rows archived"""
+    if retention_months <= 0:
+        return 0
+    now = now or datetime.utcnow()
+    cutoff_year, cutoff_month = _add_months(now.year, now.month, -retention_months)
+    archived = 0
+
+    if is_partitioned(engine):
+        expired = [
+            name for name, year, month in list_partitions(engine)
+            if (year, month) < (cutoff_year, cutoff_month)
+        ]
+        for name in expired:
+            archive_partition(engine, name, archive_dir)
+        # Whatever is still older than the cutoff sits in the DEFAULT partition
+        archived += len(expired)
+
+    return archived + archive_rows(engine, datetime(cutoff_year, cutoff_month, 1), archive_dir)
+
+
+@contextmanager
+def _maintenance_lock(engine: Engine) -> Iterator[bool]:
+    """Yield whether this worker won the maintenance lock
+
+    Postgres uses a session advisory lock; SQLite, which only runs on one
+    host, uses a file lock next to the archives.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as lock_conn:
+            acquired = lock_conn.execute(
+                text("SELECT pg_try_advisory_lock(:id)"), {"id": MAINTENANCE_LOCK_ID}
+            ).scalar()
+            try:
+                yield bool(acquired)
+            finally:
+                if acquired:
+                    lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MAINTENANCE_LOCK_ID})
+        return
+
+    os.makedirs(settings.usage_archive_dir, exist_ok=True)
+    with open(os.path.join(settings.usage_archive_dir, ".maintenance.lock"), "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def maintain(engine: Engine) -> None:
+    """Create upcoming partitions and apply retention, once across all workers"""
+    if not inspect(engine).has_table(PARENT_TABLE):
+        return
+
+    with _maintenance_lock(engine) as acquired:
+        if not acquired:
+            return
+        if is_partitioned(engine):
+            ensure_partitions(engine, settings.usage_partition_months_ahead)
+        elif engine.dialect.name == "postgresql":
+            logger.warning("usage_records is not partitioned; using row-based retention")
+        apply_retention(engine, settings.usage_retention_months, settings.usage_archive_dir)
+
+
+async def maintenance_loop(engine: Engine, interval_hours: float) -> None:
+    """Run maintain() in a worker thread every interval_hours"""
+    while True:
+        try:
+            await asyncio.to_thread(maintain, engine)
+        except Exception as e:
+            logger.error("usage_records maintenance failed", error=str(e))
+        await asyncio.sleep(interval_hours * 3600)
+
+
+def main() -> None:
+    from app.core.database import get_engine, init_db
+
+    parser = argparse.ArgumentParser(description="usage_records partition maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    subcommands.add_parser("maintain", help="create upcoming partitions and apply retention")
+    parser.parse_args()
+
+    init_db()
+    maintain(get_engine())
+    print("usage_records maintenance complete")
+
+
+if __name__ == "__main__":
+    main()
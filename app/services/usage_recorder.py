@@ -0,0 +1,192 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+import structlog
+from sqlalchemy import insert
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import get_async_session_factory
+from app.models.database import UsageRecord
+from app.services.usage_rollups import apply_rollups
+
+logger = structlog.get_logger()
+
+
+class UsageRecorder:
+    """
+    Write-behind buffer for UsageRecord rows
+
+    Endpoints enqueue records without touching the database; a background
+    task bulk-inserts them every `batch_size` records or `flush_interval_ms`,
+    whichever comes first, and drains the queue on shutdown.
+
+    A flush that fails (database outage, deadlock) puts its rows back at the
+    front of the queue and is retried with exponential backoff, from
+    `flush_interval_ms` up to `max_backoff_ms`, while new records keep
+    queueing behind it.
+
+    Loss window: on a graceful shutdown nothing is lost unless the final
+    flush fails too. If the process is killed hard, records accepted in the
+    last `flush_interval_ms` are lost, or everything queued while the
+    database was failing. When the queue is full, new records are dropped
+    and counted rather than slowing down responses; failed rows that no
+    longer fit are counted as failed.
+    """
+
+    def __init__(self, batch_size: int, flush_interval_ms: int, max_queue: int, max_backoff_ms: int):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue = max_queue
+        self.max_backoff = max_backoff_ms / 1000
+        self._buffer: List[Dict] = []
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.requeued = 0
+        self.failed = 0
+
+    def record(
+        self,
+        user_id: int,
+        api_key_id: int,
+        captcha_type: str,
+        success: bool,
+        response_time_ms: int
+    ) -> None:
+        """Queue a usage record; never blocks the caller"""
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            logger.warning("Usage queue full, dropping record", user_id=user_id)
+            return
+
+        self._buffer.append({
+            "user_id": user_id,
+            "api_key_id": api_key_id,
+            "captcha_type": captcha_type,
+            "success": success,
+            "response_time_ms": response_time_ms,
+            "created_at": datetime.utcnow(),
+        })
+        self.recorded += 1
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def record_many(
+        self,
+        user_id: int,
+        api_key_id: int,
+        items: Sequence[Tuple[str, bool, int]]
+    ) -> None:
+        """Queue (captcha_type, success, response_time_ms) records from one batch request together"""
+        room = self.max_queue - len(self._buffer)
+        if len(items) > room:
+            self.dropped += len(items) - max(room, 0)
+            logger.warning("Usage queue full, dropping records", user_id=user_id, count=len(items) - max(room, 0))
+            items = items[:max(room, 0)]
+
+        created_at = datetime.utcnow()
+        self._buffer.extend(
+            {
+                "user_id": user_id,
+                "api_key_id": api_key_id,
+                "captcha_type": captcha_type,
+                "success": success,
+                "response_time_ms": response_time_ms,
+                "created_at": created_at,
+            }
+            for captcha_type, success, response_time_ms in items
+        )
+        self.recorded += len(items)
+        # Flush straight away so the batch lands in one insert
+        self._wakeup.set()
+
+    async def _insert(self, rows: List[Dict]) -> bool:
+        """Bulk-insert a batch and its rollup increments in a single transaction; requeue it on failure"""
+        try:
+            with metrics.stage("usage_write"):
+                async with get_async_session_factory()() as db:
+                    await db.execute(insert(UsageRecord), rows)
+                    await apply_rollups(db, rows)
+                    await db.commit()
+        except Exception as e:
+            room = max(self.max_queue - len(self._buffer), 0)
+            self._buffer[:0] = rows[:room]
+            self.requeued += min(len(rows), room)
+            self.failed += max(len(rows) - room, 0)
+            self._backoff = min(self._backoff * 2 or self.flush_interval, self.max_backoff)
+            self._retry_at = time.monotonic() + self._backoff
+            logger.error(
+                "Failed to flush usage records, will retry",
+                count=len(rows),
+                lost=max(len(rows) - room, 0),
+                retry_in_seconds=self._backoff,
+                error=str(e)
+            )
+            return False
+        self.flushed += len(rows)
+        self._backoff = 0.0
+        return True
+
+    async def flush(self) -> None:
+        """Write out everything buffered so far in batch_size chunks, stopping at the first failure"""
+        while self._buffer:
+            rows = self._buffer[:self.batch_size]
+            del self._buffer[:self.batch_size]
+            if not await self._insert(rows):
+                return
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if time.monotonic() < self._retry_at:
+                # Backing off after a failed flush; a full batch doesn't cut the wait short
+                continue
+            await self.flush()
+
+    async def start(self) -> None:
+        """Start the background flush task"""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush task and write out everything still buffered"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            self.failed += len(self._buffer)
+            logger.error("Usage records lost at shutdown", count=len(self._buffer))
+            self._buffer.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and record counters"""
+        return {
+            "queued": len(self._buffer),
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "requeued": self.requeued,
+            "failed": self.failed,
+        }
+
+
+usage_recorder = UsageRecorder(
+    batch_size=settings.usage_flush_batch_size,
+    flush_interval_ms=settings.usage_flush_interval_ms,
+    max_queue=settings.usage_queue_max_size,
+    max_backoff_ms=settings.usage_flush_max_backoff_ms,
+)
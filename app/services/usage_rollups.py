@@ -0,0 +1,162 @@
+"""
+Incremental usage rollups
+
+Every flushed batch of usage records is folded into hourly and daily
+UsageRollup rows with an upsert, so usage statistics read a handful of
+buckets instead of scanning usage_records.
+
+Rebuild rollups from raw records with:
+    python -m app.services.usage_rollups backfill [--chunk-size 10000]
+
+Run the backfill while ingestion is paused; records flushed during the
+rebuild may otherwise be counted twice.
+"""
+import argparse
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import structlog
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.models.database import UsageRecord, UsageRollup
+
+logger = structlog.get_logger()
+
+GRANULARITIES = ("hour", "day")
+
+# Upper bounds (inclusive) of the latency histogram columns; slower solves go to latency_gt_5000
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000)
+LATENCY_COLUMNS = [f"latency_le_{bound}" for bound in LATENCY_BUCKETS_MS] + ["latency_gt_5000"]
+COUNTER_COLUMNS = ["total_count", "success_count", "latency_sum_ms"] + LATENCY_COLUMNS
+
+BucketKey = Tuple[int, int, str, str, datetime]
+
+
+def _bucket_start(created_at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _latency_column(response_time_ms: int) -> str:
+    for bound, column in zip(LATENCY_BUCKETS_MS, LATENCY_COLUMNS):
+        if response_time_ms <= bound:
+            return column
+    return LATENCY_COLUMNS[-1]
+
+
+def rollup_deltas(rows: Iterable[dict]) -> List[dict]:
+    """Aggregate usage rows into per-bucket counter increments"""
+    buckets: Dict[BucketKey, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTER_COLUMNS, 0))
+    for row in rows:
+        latency = row["response_time_ms"] or 0
+        for granularity in GRANULARITIES:
+            key = (
+                row["user_id"],
+                row["api_key_id"],
+                row["captcha_type"],
+                granularity,
+                _bucket_start(row["created_at"], granularity),
+            )
+            counters = buckets[key]
+            counters["total_count"] += 1
+            counters["success_count"] += 1 if row["success"] else 0
+            counters["latency_sum_ms"] += latency
+            counters[_latency_column(latency)] += 1
+
+    return [
+        {
+            "user_id": user_id,
+            "api_key_id": api_key_id,
+            "captcha_type": captcha_type,
+            "granularity": granularity,
+            "bucket_start": bucket_start,
+            **counters,
+        }
+        for (user_id, api_key_id, captcha_type, granularity, bucket_start), counters in buckets.items()
+    ]
+
+
+def upsert_statement(dialect_name: str):
+    """INSERT ... ON CONFLICT that adds increments to existing buckets"""
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(UsageRollup)
+    table = UsageRollup.__table__
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "api_key_id", "captcha_type", "granularity", "bucket_start"],
+        set_={column: table.c[column] + stmt.excluded[column] for column in COUNTER_COLUMNS},
+    )
+
+
+async def apply_rollups(db: AsyncSession, rows: List[dict]) -> None:
+    """Fold a batch of usage rows into the rollup table (caller commits)"""
+    deltas = rollup_deltas(rows)
+    if deltas:
+        await db.execute(upsert_statement(db.bind.dialect.name), deltas)
+
+
+def backfill(db: Session, chunk_size: int = 10000, since: Optional[datetime] = None) -> int:
+    """Rebuild rollups from raw usage_records in id-ordered chunks"""
+    clear = delete(UsageRollup)
+    if since is not None:
+        since = _bucket_start(since, "day")
+        clear = clear.where(UsageRollup.bucket_start >= since)
+    db.execute(clear)
+    db.commit()
+
+    max_id = db.execute(select(func.max(UsageRecord.id))).scalar() or 0
+    statement = upsert_statement(db.bind.dialect.name)
+    last_id = 0
+    processed = 0
+    while last_id < max_id:
+        query = (
+            select(
+                UsageRecord.id,
+                UsageRecord.user_id,
+                UsageRecord.api_key_id,
+                UsageRecord.captcha_type,
+                UsageRecord.success,
+                UsageRecord.response_time_ms,
+                UsageRecord.created_at,
+            )
+            .where(UsageRecord.id > last_id, UsageRecord.id <= max_id)
+            .order_by(UsageRecord.id)
+            .limit(chunk_size)
+        )
+        if since is not None:
+            query = query.where(UsageRecord.created_at >= since)
+        rows = [dict(row._mapping) for row in db.execute(query)]
+        if not rows:
+            break
+
+        deltas = rollup_deltas(rows)
+        db.execute(statement, deltas)
+        db.commit()
+        last_id = rows[-1]["id"]
+        processed += len(rows)
+        logger.info("Backfilled usage rollups", processed=processed, last_id=last_id, max_id=max_id)
+
+    return processed
+
+
+def main() -> None:
+    from app.core.database import get_session_factory, init_db
+
+    parser = argparse.ArgumentParser(description="Usage rollup maintenance")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subcommands.add_parser("backfill", help="rebuild rollups from usage_records")
+    backfill_parser.add_argument("--chunk-size", type=int, default=10000)
+    backfill_parser.add_argument("--since", type=datetime.fromisoformat, default=None,
+                                 help="only rebuild buckets from this date (ISO format)")
+    args = parser.parse_args()
+
+    init_db()
+    with get_session_factory()() as db:
+        processed = backfill(db, chunk_size=args.chunk_size, since=args.since)
+    print(f"Rebuilt rollups from {processed} usage records")
+
+
+if __name__ == "__main__":
+    main()
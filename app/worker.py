@@ -0,0 +1,52 @@
+"""
+Standalone worker for ?mode=async solve tasks
+
+Runs the solve task workers without the HTTP API, pulling from the Redis
+queue shared with the API processes. Set TASK_WORKERS_IN_API=false on the
+API to leave all solving to these processes:
+
+    REDIS_ENABLED=true python -m app.worker
+"""
+import asyncio
+import signal
+import structlog
+from app.core.config import settings
+from app.core.database import dispose_engines, init_db
+from app.core.redis import close_redis, get_redis
+from app.api.v1.captcha import solve_tasks
+from app.services.capsolver_client import capsolver_client
+from app.services.image_downloader import image_downloader
+from app.services.quota_service import quota_service
+from app.services.usage_recorder import usage_recorder
+
+logger = structlog.get_logger()
+
+
+async def main() -> None:
+    if get_redis() is None:
+        raise SystemExit("A standalone worker needs REDIS_ENABLED=true to share the task queue")
+
+    init_db()
+    await usage_recorder.start()
+    await quota_service.start()
+    await solve_tasks.start(settings.task_workers)
+    logger.info("Solve task worker started", workers=settings.task_workers)
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+    await stopped.wait()
+
+    logger.info("Solve task worker stopping")
+    await solve_tasks.stop()
+    await quota_service.stop()
+    await usage_recorder.stop()
+    await image_downloader.aclose()
+    await capsolver_client.aclose()
+    await close_redis()
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,61 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-import capsolver
+import asyncio
+import hashlib
+import hmac
 import json
+import secrets
 from datetime import datetime
-import os
 
 from auth_api import router as auth_router
+from app.core.config import settings
+from app.services.capsolver_client import capsolver_client
+from app.services.task_queue import QueueFull, TaskQueue
 
-app = FastAPI()
+
+def _log_solution(task: dict, solution: dict) -> None:
+    # Save to local JSONL file
+    with open("solved_captchas.jsonl", "a") as f:
+        f.write(json.dumps({
+            "timestamp": datetime.utcnow().isoformat(),
+            "request": task,
+            "response": solution
+        }) + "\n")
+
+
+async def _solve_and_log(task: dict) -> dict:
+    # Polls CapSolver without blocking the event loop (CAPSOLVER_POLL_INTERVAL_SECONDS apart)
+    solution = await capsolver_client.solve(task)
+    await asyncio.to_thread(_log_solution, task, solution)
+    return solution
+
+
+async def _run_task(payload: dict, blob) -> dict:
+    return await _solve_and_log(payload)
+
+
+tasks = TaskQueue(
+    "capsolver",
+    handler=_run_task,
+    max_queue=settings.task_queue_max_size,
+    result_ttl_seconds=settings.task_result_ttl_seconds,
+    max_queue_bytes=settings.task_queue_max_bytes,
+    running_timeout_seconds=settings.capsolver_timeout_seconds,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await tasks.start(settings.task_workers)
+    yield
+    await tasks.stop()
+    await capsolver_client.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(auth_router)
 
 # Add CORS middleware
@@ -26,29 +73,58 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Set your API key from environment variable
-capsolver.api_key = os.getenv("CAPSOLVER_API_KEY", "YOUR_CAPSOLVER_API_KEY")
-
 class CaptchaRequest(BaseModel):
     type: str
     websiteURL: str
     websiteKey: str
 
+def _token_digest(token: str) -> str:
+    # Callers are anonymous here, so a task belongs to whoever holds the token handed out with it
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _task_view(task: dict) -> dict:
+    return {
+        "task_id": task["id"],
+        "status": task["status"],
+        "solution": task["result"],
+        "error": task["error"],
+    }
+
 @app.post("/solve")
-async def solve_captcha(req: CaptchaRequest):
+async def solve_captcha(req: CaptchaRequest, mode: str = Query("sync", pattern="^(sync|async)$")):
+    payload = {
+        "type": req.type,
+        "websiteURL": req.websiteURL,
+        "websiteKey": req.websiteKey,
+    }
+    if mode == "async":
+        token = secrets.token_urlsafe(24)
+        try:
+            task = await tasks.submit(payload, owner=_token_digest(token))
+        except QueueFull:
+            raise HTTPException(status_code=503, detail="Task queue is full, retry later")
+        return JSONResponse(status_code=202, content={**_task_view(task), "task_token": token},
+                            headers={"Location": f"/solve/tasks/{task['id']}"})
     try:
-        solution = capsolver.solve({
-            "type": req.type,
-            "websiteURL": req.websiteURL,
-            "websiteKey": req.websiteKey,
-        })
-        # Save to local JSONL file
-        with open("solved_captchas.jsonl", "a") as f:
-            f.write(json.dumps({
-                "timestamp": datetime.utcnow().isoformat(),
-                "request": req.dict(),
-                "response": solution
-            }) + "\n")
-        return solution
+        return await _solve_and_log(payload)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/solve/tasks/{task_id}")
+async def get_task(
+    task_id: str,
+    wait: float = Query(0, ge=0),
+    task_token: str = Header(..., alias="X-Task-Token")
+):
+    # Same answer for unknown and foreign tasks, so ids can't be probed
+    task = await tasks.get(task_id)
+    if task is None or not hmac.compare_digest(task["owner"], _token_digest(task_token)):
+        raise HTTPException(status_code=404, detail="Task not found")
+    wait = min(wait, settings.task_max_wait_seconds)
+    if wait:
+        task = await tasks.wait(task_id, wait) or task
+    return _task_view(task)
+
+@app.get("/solve/stats")
+async def task_stats():
+    return tasks.stats()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark for image_base64 decoding
+
+Compares the previous decode path (startswith + split + b64decode, then
+Image.open over a BytesIO) with the chunked decoder in
+app.services.image_buffer, which decodes into one preallocated buffer and
+lets Pillow read it through a memoryview. Each payload is a data URL
+holding a PNG of roughly the given size; the benchmark reports the best
+time per decode + header parse and the peak Python memory allocated.
+
+Usage:
+    python scripts/bench_base64_decode.py [--sizes 100 500 1000 5000] [--repeat 20]
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from PIL import Image
+
+from app.services.image_buffer import decode_base64, open_image
+
+
+def legacy_decode(data: str):
+    if data.startswith("data:image"):
+        data = data.split(",")[1]
+    raw = base64.b64decode(data)
+    return Image.open(io.BytesIO(raw)).size
+
+
+def buffer_decode(data: str):
+    return open_image(decode_base64(data)).size
+
+
+def make_payload(kilobytes: int) -> str:
+    """Data URL of a noise PNG, which barely compresses, so its size tracks its pixel count"""
+    side = int((kilobytes * 1024) ** 0.5)
+    image = Image.frombytes("L", (side, side), os.urandom(side * side))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def best_time(func, data: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(data)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func, data: str) -> int:
+    tracemalloc.start()
+    func(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(args):
+    print(f"{'payload':>10} {'encoded':>10} {'legacy ms':>10} {'buffer ms':>10} {'legacy peak':>12} {'buffer peak':>12}")
+    for kilobytes in args.sizes:
+        data = make_payload(kilobytes)
+        assert legacy_decode(data) == buffer_decode(data)
+        legacy_ms = best_time(legacy_decode, data, args.repeat) * 1000
+        buffer_ms = best_time(buffer_decode, data, args.repeat) * 1000
+        legacy_peak = peak_memory(legacy_decode, data)
+        buffer_peak = peak_memory(buffer_decode, data)
+        print(
+            f"{kilobytes:>8}KB {len(data) // 1024:>8}KB {legacy_ms:>10.2f} {buffer_ms:>10.2f} "
+            f"{legacy_peak // 1024:>10}KB {buffer_peak // 1024:>10}KB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 5000], help="payload sizes in KB")
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
@@ -0,0 +1,143 @@
+"""
+Benchmark for the CapSolver path in captcha_solver.py
+
+Starts a local stub of the CapSolver API (createTask / getTaskResult, with a
+fixed solve latency) and drives POST /solve against it at increasing
+concurrency levels. The async client polls on the event loop over one pooled
+connection set, so throughput should grow with concurrency; the --blocking
+baseline reproduces the old path, a synchronous create/poll loop run in a
+worker thread, which is capped by the default thread pool size.
+
+Usage:
+    python scripts/bench_capsolver.py [--requests 400] [--latency-ms 500] [--poll-ms 100] [--blocking]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+# captcha_solver writes users.db and solved_captchas.jsonl to the working directory
+os.chdir(tempfile.mkdtemp(prefix="bench_capsolver_"))
+
+import httpx
+import structlog
+import uvicorn
+from fastapi import FastAPI
+
+import captcha_solver
+from app.services.capsolver_client import capsolver_client
+
+TASK = {"type": "ReCaptchaV2TaskProxyLess", "websiteURL": "https://example.com", "websiteKey": "site-key"}
+
+
+def create_stub_api(latency: float) -> FastAPI:
+    """CapSolver-shaped API whose tasks become ready `latency` seconds after creation"""
+    stub = FastAPI()
+    created = {}
+
+    @stub.post("/createTask")
+    async def create_task(body: dict):
+        task_id = str(uuid.uuid4())
+        created[task_id] = time.monotonic()
+        return {"errorId": 0, "taskId": task_id, "status": "idle"}
+
+    @stub.post("/getTaskResult")
+    async def get_task_result(body: dict):
+        started = created.get(body.get("taskId"))
+        if started is None:
+            return {"errorId": 1, "errorCode": "ERROR_TASKID_INVALID", "errorDescription": "Task not found"}
+        if time.monotonic() - started < latency:
+            return {"errorId": 0, "status": "processing"}
+        del created[body["taskId"]]
+        return {"errorId": 0, "status": "ready", "solution": {"gRecaptchaResponse": "03AGdBq2"}}
+
+    return stub
+
+
+def start_stub_api(latency: float, port: int) -> uvicorn.Server:
+    """Serve the stub API from a background thread with its own event loop"""
+    server = uvicorn.Server(uvicorn.Config(
+        create_stub_api(latency), host="127.0.0.1", port=port, log_level="warning", backlog=4096
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def blocking_solve(base_url: str, poll_interval: float):
+    """The old path: a synchronous create/poll loop, run in a worker thread"""
+    session = httpx.Client(base_url=base_url)
+
+    def solve(task: dict) -> dict:
+        result = session.post("/createTask", json={"clientKey": "bench", "task": task}).json()
+        task_id = result["taskId"]
+        while result.get("status") != "ready":
+            time.sleep(poll_interval)
+            result = session.post("/getTaskResult", json={"clientKey": "bench", "taskId": task_id}).json()
+        return result["solution"]
+
+    async def solve_and_log(task: dict) -> dict:
+        solution = await asyncio.to_thread(solve, task)
+        captcha_solver._log_solution(task, solution)
+        return solution
+
+    return solve_and_log
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, total: int) -> float:
+    """Run `total` solves with at most `concurrency` in flight, return solves/sec"""
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with gate:
+            response = await client.post("/solve", json=TASK)
+            assert response.status_code == 200, response.text
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return total / (time.perf_counter() - start)
+
+
+async def main(args):
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    start_stub_api(args.latency_ms / 1000, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+    poll_interval = args.poll_ms / 1000
+    if args.blocking:
+        captcha_solver._solve_and_log = blocking_solve(base_url, poll_interval)
+    else:
+        capsolver_client.base_url = base_url
+        capsolver_client.poll_interval = poll_interval
+
+    transport = httpx.ASGITransport(app=captcha_solver.app)
+    print(
+        f"mode={'blocking' if args.blocking else 'async'} latency={args.latency_ms}ms "
+        f"poll={args.poll_ms}ms requests={args.requests}"
+    )
+    print(f"{'concurrency':>12} {'solves/sec':>12} {'speedup':>8}")
+    baseline = None
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        for concurrency in args.levels:
+            total = min(args.requests, max(concurrency * 4, 8))
+            throughput = await run_level(client, concurrency, total)
+            baseline = baseline or throughput
+            print(f"{concurrency:>12} {throughput:>12.1f} {throughput / baseline:>7.1f}x")
+    await capsolver_client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency-ms", type=int, default=500)
+    parser.add_argument("--poll-ms", type=int, default=100)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32, 100])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--blocking", action="store_true", help="simulate the old thread-per-solve polling loop")
+    asyncio.run(main(parser.parse_args()))
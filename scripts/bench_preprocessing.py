@@ -0,0 +1,163 @@
+"""
+Benchmark for the image preprocessing stage
+
+Runs every image in a corpus through GeminiService.solve_captcha twice: once
+with preprocessing disabled (original bytes sent upstream) and once with the
+configured pipeline. The Gemini model is replaced by a local fake whose
+latency is a fixed base plus the time to upload the request at a given
+bandwidth, so smaller payloads show up as lower end-to-end latency.
+
+Without --corpus a synthetic corpus is generated: noisy text CAPTCHAs as
+PNG and large camera-style JPEGs for the image/puzzle types.
+
+Usage:
+    python scripts/bench_preprocessing.py [--corpus DIR] [--upstream-mbps 20] [--base-latency-ms 150]
+
+Files in DIR may be grouped into text/, math/, image/ and puzzle/
+subdirectories to pick the captcha_type; loose files are treated as text.
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import structlog
+from PIL import Image, ImageDraw, ImageFilter
+
+import app.services.gemini_service as gemini_module
+from app.core.config import settings
+from app.services.gemini_service import GeminiService
+from app.services.image_preprocessor import ImagePreprocessor
+from app.services.solve_cache import solve_cache
+
+CAPTCHA_TYPES = ("text", "math", "image", "puzzle")
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class UploadBoundModel:
+    """Fake model whose latency grows with the size of the request"""
+
+    def __init__(self, base_latency: float, upstream_mbps: float):
+        self.base_latency = base_latency
+        self.bytes_per_second = upstream_mbps * 1_000_000 / 8
+        self.bytes_sent = 0
+
+    async def generate_content_async(self, contents):
+        size = sum(len(part["data"]) for part in contents if isinstance(part, dict))
+        self.bytes_sent += size
+        await asyncio.sleep(self.base_latency + size / self.bytes_per_second)
+        return _FakeResponse("AB12C")
+
+
+def _encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def synthetic_corpus(count: int, seed: int = 7):
+    """(captcha_type, name, bytes) samples resembling real traffic"""
+    rng = random.Random(seed)
+    samples = []
+    for i in range(count):
+        captcha_type = CAPTCHA_TYPES[i % len(CAPTCHA_TYPES)]
+        if captcha_type in ("text", "math"):
+            image = Image.new("RGB", (rng.choice([300, 600, 900]), rng.choice([100, 200])), "#f4efe6")
+            draw = ImageDraw.Draw(image)
+            for _ in range(400):
+                x, y = rng.randrange(image.width), rng.randrange(image.height)
+                draw.point((x, y), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+            label = "7 + 4 = ?" if captcha_type == "math" else "".join(rng.choices("ABCDEFGHJKLMNPQRSTUVWXYZ23456789", k=6))
+            draw.text((20, image.height // 3), label, fill=(40, 40, 120))
+            for _ in range(5):
+                draw.line([(rng.randrange(image.width), rng.randrange(image.height)) for _ in range(2)], fill=(90, 90, 90), width=2)
+            data = _encode(image, "PNG")
+        else:
+            width, height = rng.choice([(1600, 1200), (2400, 1800), (3000, 2000)])
+            noise = Image.effect_noise((width // 8, height // 8), 60).resize((width, height))
+            image = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+            image = image.filter(ImageFilter.GaussianBlur(2))
+            data = _encode(image, "JPEG", quality=95)
+        samples.append((captcha_type, f"synthetic_{i}", data))
+    return samples
+
+
+def load_corpus(directory: str):
+    samples = []
+    for root, _, files in os.walk(directory):
+        captcha_type = os.path.basename(root) if os.path.basename(root) in CAPTCHA_TYPES else "text"
+        for name in sorted(files):
+            with open(os.path.join(root, name), "rb") as f:
+                samples.append((captcha_type, name, f.read()))
+    return samples
+
+
+async def run(service: GeminiService, samples, preprocessor: ImagePreprocessor):
+    """Solve each sample once; returns (bytes sent upstream, latencies in ms)"""
+    gemini_module.image_preprocessor = preprocessor
+    model = service.model
+    model.bytes_sent = 0
+    latencies = []
+    for captcha_type, name, data in samples:
+        start = time.perf_counter()
+        result = await service.solve_captcha(image_data=data, captcha_type=captcha_type)
+        if not result.success:
+            raise SystemExit(f"solve failed for {name}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return model.bytes_sent, latencies
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def main(args):
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    solve_cache.enabled = False
+    samples = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    if not samples:
+        raise SystemExit("corpus is empty")
+
+    service = GeminiService()
+    service.model = UploadBoundModel(args.base_latency_ms / 1000, args.upstream_mbps)
+    configured = dict(
+        max_dimensions=settings.image_max_dimensions,
+        grayscale_types=settings.image_grayscale_types,
+        jpeg_quality=settings.image_jpeg_quality,
+    )
+
+    print(f"images={len(samples)} upstream={args.upstream_mbps}Mbps base_latency={args.base_latency_ms}ms")
+    print(f"{'pipeline':>10} {'bytes sent':>12} {'avg bytes':>10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    results = {}
+    for label, enabled in (("raw", False), ("preprocess", True)):
+        sent, latencies = await run(service, samples, ImagePreprocessor(enabled=enabled, **configured))
+        results[label] = (sent, statistics.mean(latencies))
+        print(
+            f"{label:>10} {sent:>12} {sent // len(samples):>10} "
+            f"{_percentile(latencies, 0.5):>8.1f} {_percentile(latencies, 0.95):>8.1f} {statistics.mean(latencies):>8.1f}"
+        )
+
+    raw_bytes, raw_latency = results["raw"]
+    new_bytes, new_latency = results["preprocess"]
+    print(f"bytes upstream: {new_bytes / raw_bytes:.1%} of raw; mean latency: {new_latency / raw_latency:.1%} of raw")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of sample CAPTCHA images")
+    parser.add_argument("--count", type=int, default=40, help="synthetic corpus size")
+    parser.add_argument("--upstream-mbps", type=float, default=20.0)
+    parser.add_argument("--base-latency-ms", type=float, default=150.0)
+    asyncio.run(main(parser.parse_args()))
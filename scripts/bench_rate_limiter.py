@@ -0,0 +1,80 @@
+"""
+Latency benchmark for the per-API-key rate limiter
+
+Measures p50/p99/max of a single limiter check for the in-process token
+bucket and for the Redis GCRA script. The Redis path runs against
+fakeredis (pip install "fakeredis[lua]") unless --redis-url points at a
+real server, so the numbers for fakeredis exclude network time but include
+script execution and client overhead.
+
+Usage:
+    python scripts/bench_rate_limiter.py [--iterations 20000] [--keys 1000] [--redis-url redis://localhost:6379/0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.services.rate_limiter import RedisRateLimiter, TokenBucketLimiter
+
+LIMITS = [(60, 60), (1000, 3600)]
+
+
+def _report(name: str, samples: list) -> None:
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99)] * 1000
+    print(f"{name:<22} p50={p50:.4f}ms p99={p99:.4f}ms max={samples[-1] * 1000:.4f}ms n={len(samples)}")
+
+
+def bench_local(iterations: int, keys: int) -> None:
+    limiter = TokenBucketLimiter()
+    samples = []
+    for _ in range(iterations):
+        key = str(random.randrange(keys))
+        start = time.perf_counter()
+        limiter.hit(key, LIMITS)
+        samples.append(time.perf_counter() - start)
+    _report("in-process bucket", samples)
+
+
+async def bench_redis(iterations: int, keys: int, redis_url: str) -> None:
+    if redis_url:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(redis_url)
+        name = "redis gcra"
+    else:
+        import fakeredis
+        client = fakeredis.FakeAsyncRedis()
+        name = "redis gcra (fake)"
+
+    limiter = RedisRateLimiter(client, prefix="bench-ratelimit")
+    samples = []
+    for _ in range(iterations):
+        key = str(random.randrange(keys))
+        start = time.perf_counter()
+        await limiter.hit(key, LIMITS)
+        samples.append(time.perf_counter() - start)
+    _report(name, samples)
+
+    # Sanity check: a fresh key admits exactly the per-minute limit
+    admitted = 0
+    for _ in range(LIMITS[0][0] + 10):
+        admitted += (await limiter.hit("bench-burst", LIMITS)).allowed
+    print(f"burst check: admitted {admitted} of {LIMITS[0][0] + 10} (limit {LIMITS[0][0]}/min)")
+    await client.aclose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--redis-url", default="")
+    args = parser.parse_args()
+
+    bench_local(args.iterations, args.keys)
+    asyncio.run(bench_redis(args.iterations, args.keys, args.redis_url))
@@ -0,0 +1,117 @@
+"""
+Load test for GeminiService.solve_captcha
+
+Replaces the Gemini model with a local fake that sleeps for a fixed upstream
+latency, then drives the service at increasing concurrency levels. With the
+async inference path throughput should grow roughly linearly with concurrency
+(up to GEMINI_MAX_CONCURRENCY); the --blocking baseline reproduces the old
+synchronous behaviour, where throughput stays flat at ~1/latency.
+
+Every request sends a distinct image so the result cache and request
+coalescing don't turn the run into a cache benchmark; pass --same-image to
+measure that path instead.
+
+Usage:
+    python scripts/load_test_solve.py [--requests 200] [--latency-ms 200] [--blocking] [--same-image]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import itertools
+import logging
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import structlog
+from PIL import Image
+
+from app.services.gemini_service import GeminiService
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModel:
+    """Stand-in for genai.GenerativeModel with a fixed upstream latency"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def generate_content(self, contents):
+        time.sleep(self.latency)
+        return _FakeResponse("AB12C")
+
+    async def generate_content_async(self, contents):
+        await asyncio.sleep(self.latency)
+        return _FakeResponse("AB12C")
+
+
+class BlockingFakeModel(FakeModel):
+    """Fake whose async method blocks the loop, like the old sync call did"""
+
+    async def generate_content_async(self, contents):
+        return self.generate_content(contents)
+
+
+def _sample_image_base64(seed: int = 0) -> str:
+    """A blank CAPTCHA-sized PNG with `seed` drawn into its top row, so each seed hashes differently"""
+    image = Image.new("RGB", (160, 60), "white")
+    for bit in range(seed.bit_length()):
+        if seed >> bit & 1:
+            image.putpixel((bit, 0), (0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+async def run_level(service: GeminiService, concurrency: int, images: List[str]) -> float:
+    """Solve each image with at most `concurrency` in flight, return solves/sec"""
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(image_base64: str):
+        async with gate:
+            result = await service.solve_captcha(image_base64=image_base64)
+            assert result.success
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(image_base64) for image_base64 in images))
+    return len(images) / (time.perf_counter() - start)
+
+
+async def main(args):
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    service = GeminiService()
+    latency = args.latency_ms / 1000
+    service.model = BlockingFakeModel(latency) if args.blocking else FakeModel(latency)
+    seeds = itertools.repeat(0) if args.same_image else itertools.count(1)
+
+    print(
+        f"mode={'blocking' if args.blocking else 'async'} latency={args.latency_ms}ms "
+        f"requests={args.requests} images={'same' if args.same_image else 'distinct'}"
+    )
+    print(f"{'concurrency':>12} {'solves/sec':>12} {'speedup':>8}")
+    baseline = None
+    for concurrency in args.levels:
+        total = min(args.requests, max(concurrency * 4, 8))
+        # Encode up front so image generation isn't timed
+        images = [_sample_image_base64(next(seeds)) for _ in range(total)]
+        throughput = await run_level(service, concurrency, images)
+        baseline = baseline or throughput
+        print(f"{concurrency:>12} {throughput:>12.1f} {throughput / baseline:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency-ms", type=int, default=200)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--blocking", action="store_true", help="simulate the old synchronous model call")
+    parser.add_argument("--same-image", action="store_true", help="send one image throughout to measure cache hits")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# The app reads these at import time; point it at a throwaway SQLite database
+_DATA_DIR = tempfile.mkdtemp(prefix="cap-solver-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DATA_DIR}/test.db"
+os.environ["USAGE_ARCHIVE_DIR"] = os.path.join(_DATA_DIR, "archives")
+os.environ["AUTH_DATABASE_URL"] = f"sqlite:///{_DATA_DIR}/users.db"
+os.environ["REDIS_ENABLED"] = "false"
+
+import fakeredis
+import pytest
+
+
+@pytest.fixture
+def fake_redis():
+    """In-memory Redis with Lua scripting, for the quota and rate limit scripts"""
+    return fakeredis.FakeAsyncRedis()
+
+
+@pytest.fixture(scope="session")
+def app_client():
+    """TestClient for the whole app, answering solves with the local stub backend"""
+    from fastapi.testclient import TestClient
+    from app.api.v1.captcha import gemini_service
+    from app.main import app
+    from app.services.solver_backends import StubBackend
+    from app.services.solver_router import SolverRouter
+
+    gemini_service.router = SolverRouter(
+        [StubBackend()],
+        alpha=0.3,
+        failure_threshold=5,
+        error_rate_threshold=0.5,
+        min_samples=10,
+        cooldown=30,
+        probe_interval=60,
+        hedge_budget=0.0,
+    )
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def api_key(app_client):
+    """A new user with one API key; returns (headers, user id, key id)"""
+    from app.core.database import get_session_factory
+    from app.services.auth_service import AuthService
+
+    auth_service = AuthService()
+    db = get_session_factory()()
+    try:
+        user = auth_service.create_user(db, f"{uuid.uuid4().hex}@example.com", "password1")
+        key, db_key = auth_service.create_api_key(db, user.id, "test")
+        return {"X-API-Key": key}, user.id, db_key.id
+    finally:
+        db.close()
@@ -0,0 +1,85 @@
+import asyncio
+from app.services import api_key_cache as cache_module
+from app.services.api_key_cache import APIKeyCache, CachedAPIKey, CachedUser
+from app.services.auth_service import AuthService
+
+PRINCIPAL = (CachedUser(id=1, email="a@example.com", is_active=True), CachedAPIKey(id=1, user_id=1, name="test"))
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_cache(monkeypatch) -> "tuple[APIKeyCache, Clock]":
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock.monotonic)
+    return APIKeyCache(ttl_seconds=30, negative_ttl_seconds=5, max_entries=2), clock
+
+
+def test_entries_expire_after_their_ttl(monkeypatch):
+    cache, clock = make_cache(monkeypatch)
+    cache.store("valid", PRINCIPAL)
+    cache.store("invalid", None)
+
+    clock.now += 4
+    assert cache.lookup("valid") == (True, PRINCIPAL)
+    assert cache.lookup("invalid") == (True, None)
+
+    # Unknown keys are remembered for less time than valid ones
+    clock.now += 2
+    assert cache.lookup("invalid") == (False, None)
+    assert cache.lookup("valid") == (True, PRINCIPAL)
+
+    clock.now += 25
+    assert cache.lookup("valid") == (False, None)
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_stored_entries_are_evicted(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    for key_hash in ("a", "b", "c"):
+        cache.store(key_hash, PRINCIPAL)
+    assert cache.lookup("a") == (False, None)
+    assert cache.lookup("c") == (True, PRINCIPAL)
+
+
+def test_revocation_reaches_other_processes(monkeypatch, fake_redis):
+    monkeypatch.setattr(cache_module, "get_redis", lambda: fake_redis)
+    here = APIKeyCache(ttl_seconds=30, negative_ttl_seconds=5, max_entries=10)
+    there = APIKeyCache(ttl_seconds=30, negative_ttl_seconds=5, max_entries=10)
+
+    async def run():
+        await there.start()
+        while (await fake_redis.pubsub_numsub(APIKeyCache.channel))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        here.store("revoked", PRINCIPAL)
+        there.store("revoked", PRINCIPAL)
+        there.store("kept", PRINCIPAL)
+
+        await here.invalidate_everywhere("revoked")
+        for _ in range(100):
+            if not there.lookup("revoked")[0]:
+                break
+            await asyncio.sleep(0.01)
+        await there.stop()
+
+    asyncio.run(run())
+    assert here.lookup("revoked") == (False, None)
+    assert there.lookup("revoked") == (False, None)
+    assert there.lookup("kept") == (True, PRINCIPAL)
+
+
+def test_revoked_key_is_refused_at_once(app_client, api_key):
+    headers, user_id, key_id = api_key
+    token = AuthService().create_access_token(data={"sub": str(user_id)})
+
+    # A lookup that passes auth caches the key
+    assert app_client.get("/api/v1/solve/tasks/unknown", headers=headers).status_code == 404
+
+    response = app_client.delete(f"/api/v1/auth/keys/{key_id}", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert app_client.get("/api/v1/solve/tasks/unknown", headers=headers).status_code == 401
@@ -0,0 +1,123 @@
+import asyncio
+import base64
+import io
+import json
+import pytest
+from PIL import Image
+from app.core.config import settings
+from app.services.batch_solver import BatchItem, run_batch
+from app.services.gemini_service import SolveResult
+from app.services.rate_limiter import rate_limiter
+
+
+def png_bytes(shade: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def png_base64(shade: int) -> str:
+    return base64.b64encode(png_bytes(shade)).decode()
+
+
+def batch(count: int, first_shade: int = 0) -> dict:
+    return {"items": [
+        {"image_base64": png_base64(first_shade + i), "captcha_type": "text"} for i in range(count)
+    ]}
+
+
+@pytest.fixture
+def limit_of_five(monkeypatch):
+    monkeypatch.setattr(rate_limiter, "limits", [(5, 60), (1000, 3600)])
+
+
+def test_batch_items_count_against_the_rate_limit(app_client, api_key, limit_of_five):
+    headers, _, _ = api_key
+
+    response = app_client.post("/api/v1/solve/batch", json=batch(3), headers=headers)
+    assert response.status_code == 200
+    assert response.headers["X-RateLimit-Remaining"] == "2"
+
+    # Larger than what is left: refused whole, nothing solved or reserved
+    response = app_client.post("/api/v1/solve/batch", json=batch(3, 10), headers=headers)
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+    assert "X-Quota-Remaining" not in response.headers
+
+    response = app_client.post("/api/v1/solve/batch", json=batch(2, 20), headers=headers)
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 2
+    assert response.headers["X-RateLimit-Remaining"] == "0"
+
+
+def test_results_keep_item_order_and_only_successes_are_billed(app_client, api_key):
+    headers, _, _ = api_key
+    items = [
+        {"image_base64": png_base64(40), "captcha_type": "text"},
+        {"captcha_type": "text"},
+        {"image_base64": png_base64(41), "captcha_type": "math"},
+        {"image_base64": "not base64!", "captcha_type": "text"},
+    ]
+
+    response = app_client.post("/api/v1/solve/batch", json={"items": items}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert [result["index"] for result in body["results"]] == [0, 1, 2, 3]
+    assert [result["success"] for result in body["results"]] == [True, False, True, False]
+    assert "image_url or image_base64" in body["results"][1]["error_message"]
+    assert (body["succeeded"], body["failed"]) == (2, 2)
+    reserved = int(response.headers["X-Quota-Remaining"])
+
+    # The two failed items were given back once the batch settled
+    response = app_client.post("/api/v1/solve/batch", json=batch(1, 42), headers=headers)
+    assert int(response.headers["X-Quota-Remaining"]) == reserved + 2 - 1
+
+
+def test_oversized_and_empty_batches_are_refused(app_client, api_key, monkeypatch):
+    headers, _, _ = api_key
+    monkeypatch.setattr(settings, "batch_max_items", 2)
+    assert app_client.post("/api/v1/solve/batch", json=batch(3), headers=headers).status_code == 413
+    assert app_client.post("/api/v1/solve/batch", json={"items": []}, headers=headers).status_code == 422
+
+
+def test_streamed_batch_sends_one_line_per_item(app_client, api_key):
+    headers, _, _ = api_key
+    response = app_client.post("/api/v1/solve/batch", params={"stream": "true"}, json=batch(3, 50), headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+    assert all(line["success"] for line in lines)
+
+
+def test_multipart_batch_solves_each_file(app_client, api_key):
+    headers, _, _ = api_key
+    files = [("file", (f"{shade}.png", png_bytes(shade), "image/png")) for shade in (60, 61)]
+    response = app_client.post(
+        "/api/v1/solve/batch", files=files, data={"captcha_type": ["text", "math"]}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 2
+
+    response = app_client.post(
+        "/api/v1/solve/batch", files=files, data={"captcha_type": ["text", "math", "text"]}, headers=headers
+    )
+    assert response.status_code == 400
+
+
+def test_batch_concurrency_is_bounded():
+    running = peak = 0
+
+    class Solver:
+        async def solve_captcha(self, **kwargs):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return SolveResult(True, kwargs["image_base64"], None, 10)
+
+    items = [BatchItem(captcha_type="text", image_base64=str(i)) for i in range(10)]
+    outcomes = asyncio.run(run_batch(Solver(), items, concurrency=3))
+    assert peak == 3
+    assert [outcome.result.solved_text for outcome in outcomes] == [str(i) for i in range(10)]
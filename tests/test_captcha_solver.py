@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+import captcha_solver
+
+REQUEST = {"type": "ReCaptchaV2TaskProxyLess", "websiteURL": "https://example.com", "websiteKey": "key"}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    async def solve(task):
+        return {"gRecaptchaResponse": "token"}
+
+    monkeypatch.setattr(captcha_solver, "_solve_and_log", solve)
+    with TestClient(captcha_solver.app) as client:
+        yield client
+
+
+def test_async_task_is_readable_only_with_its_token(client):
+    response = client.post("/solve", params={"mode": "async"}, json=REQUEST)
+    assert response.status_code == 202
+    task_id, token = response.json()["task_id"], response.json()["task_token"]
+    path = f"/solve/tasks/{task_id}"
+
+    assert client.get(path).status_code == 422
+    assert client.get(path, headers={"X-Task-Token": "guess"}).status_code == 404
+
+    response = client.get(path, params={"wait": 5}, headers={"X-Task-Token": token})
+    assert response.status_code == 200
+    assert response.json()["solution"] == {"gRecaptchaResponse": "token"}
+    assert "task_token" not in response.json()
+
+
+def test_another_callers_token_cannot_read_the_task(client):
+    mine = client.post("/solve", params={"mode": "async"}, json=REQUEST).json()
+    theirs = client.post("/solve", params={"mode": "async"}, json=REQUEST).json()
+    headers = {"X-Task-Token": theirs["task_token"]}
+
+    foreign = client.get(f"/solve/tasks/{mine['task_id']}", headers=headers)
+    unknown = client.get(f"/solve/tasks/{'0' * 32}", headers=headers)
+    assert foreign.status_code == unknown.status_code == 404
+    assert foreign.json() == unknown.json()
@@ -0,0 +1,52 @@
+import asyncio
+import base64
+import io
+from PIL import Image
+from app.services.gemini_service import GeminiService
+from app.services.solver_backends import StubBackend
+from app.services.solver_router import SolverRouter
+
+
+def png_base64(shade: int) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def make_service(latency_ms: int) -> GeminiService:
+    service = GeminiService()
+    service.router = SolverRouter(
+        [StubBackend(latency_ms=latency_ms)],
+        alpha=0.3,
+        failure_threshold=5,
+        error_rate_threshold=0.5,
+        min_samples=10,
+        cooldown=30,
+        probe_interval=60,
+        hedge_budget=0.0,
+    )
+    return service
+
+
+def test_coalesced_solve_outlives_the_leader_deadline():
+    service = make_service(latency_ms=300)
+    image = png_base64(17)
+
+    async def run():
+        leader = asyncio.ensure_future(service.solve_captcha(image_base64=image, timeout_ms=100))
+        await asyncio.sleep(0.01)
+        joiner = asyncio.ensure_future(service.solve_captcha(image_base64=image, timeout_ms=2000))
+        return await leader, await joiner
+
+    leader, joiner = asyncio.run(run())
+    assert service.coalescing_stats()["solves"]["coalesced"] == 1
+    assert not leader.success and "100 ms" in leader.error
+    assert joiner.success and joiner.solved_text
+
+
+def test_caller_gives_up_at_its_own_deadline():
+    service = make_service(latency_ms=500)
+
+    result = asyncio.run(service.solve_captcha(image_base64=png_base64(93), timeout_ms=100))
+    assert not result.success
+    assert result.processing_time_ms < 400
@@ -0,0 +1,62 @@
+import base64
+import binascii
+import io
+import os
+import pytest
+from PIL import Image
+from app.core.config import settings
+from app.services import gemini_service as gemini_module
+from app.services.gemini_service import GeminiService
+from app.services.image_buffer import DECODE_CHUNK_CHARS, decode_base64, decoded_size, open_image, payload_offset
+from app.services.image_validation import ImageTooLarge
+
+
+@pytest.mark.parametrize("size", [0, 1, 2, 3, DECODE_CHUNK_CHARS // 4 * 3 + 1, DECODE_CHUNK_CHARS * 2 + 5])
+def test_decodes_like_the_standard_library(size):
+    raw = os.urandom(size)
+    encoded = base64.b64encode(raw).decode()
+    assert decoded_size(encoded) == size
+    assert decode_base64(encoded) == raw
+
+
+def test_data_url_header_is_skipped():
+    raw = os.urandom(100)
+    url = "data:image/png;base64," + base64.b64encode(raw).decode()
+    assert payload_offset(url) == len("data:image/png;base64,")
+    assert decode_base64(url) == raw
+    with pytest.raises(ValueError):
+        payload_offset("data:" + "x" * 1000)
+
+
+def test_line_breaks_across_chunk_boundaries():
+    raw = os.urandom(DECODE_CHUNK_CHARS)
+    # 76-character MIME lines put newlines inside the fixed-size chunks, splitting quanta
+    encoded = base64.encodebytes(raw).decode()
+    assert decoded_size(encoded) >= len(raw)
+    decoded = decode_base64(encoded)
+    assert decoded == raw
+    assert len(decoded) == len(raw)
+
+
+def test_invalid_payload_is_refused():
+    with pytest.raises(binascii.Error):
+        decode_base64("abc")
+
+
+def test_pillow_reads_the_decoded_buffer_in_place():
+    buffer = io.BytesIO()
+    Image.new("RGB", (30, 10), (1, 2, 3)).save(buffer, format="PNG")
+    image = open_image(decode_base64(base64.b64encode(buffer.getvalue()).decode()))
+    assert image.size == (30, 10)
+    assert image.convert("RGB").getpixel((0, 0)) == (1, 2, 3)
+
+
+def test_oversized_payload_is_refused_before_decoding(monkeypatch):
+    monkeypatch.setattr(settings, "max_file_size", 1000)
+
+    def decode(*args):
+        raise AssertionError("decoded an oversized payload")
+
+    monkeypatch.setattr(gemini_module, "decode_base64", decode)
+    with pytest.raises(ImageTooLarge):
+        GeminiService()._decode_base64_image(base64.b64encode(os.urandom(1001)).decode())
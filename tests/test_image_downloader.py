@@ -0,0 +1,46 @@
+import asyncio
+import httpx
+from app.core.config import settings
+from app.services.image_downloader import ImageDownloader
+
+
+def make_downloader(handler) -> ImageDownloader:
+    downloader = ImageDownloader()
+    downloader._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return downloader
+
+
+def test_idle_hosts_are_forgotten():
+    async def handler(request):
+        return httpx.Response(200, content=b"image")
+
+    downloader = make_downloader(handler)
+
+    async def run():
+        await asyncio.gather(*(downloader.download(f"https://host{i}.example/a.png") for i in range(50)))
+
+    asyncio.run(run())
+    assert downloader._host_semaphores == {}
+    assert downloader._host_users == {}
+
+
+def test_per_host_concurrency_is_limited():
+    running = peak = 0
+
+    async def handler(request):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return httpx.Response(200, content=b"image")
+
+    downloader = make_downloader(handler)
+    limit = settings.download_max_connections_per_host
+
+    async def run():
+        await asyncio.gather(*(downloader.download("https://slow.example/a.png") for _ in range(limit * 3)))
+
+    asyncio.run(run())
+    assert peak == limit
+    assert downloader._host_semaphores == {}
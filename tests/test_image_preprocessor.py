@@ -0,0 +1,53 @@
+import io
+import random
+from PIL import Image
+from app.services.image_preprocessor import ImagePreprocessor
+
+
+def make_preprocessor(enabled: bool = True) -> ImagePreprocessor:
+    return ImagePreprocessor(
+        max_dimensions={"text": 400, "image": 800},
+        grayscale_types=["text"],
+        jpeg_quality=80,
+        enabled=enabled,
+    )
+
+
+def png_with_exif(image: Image.Image) -> bytes:
+    exif = Image.Exif()
+    exif[0x010E] = "secret description"  # ImageDescription
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", exif=exif)
+    return buffer.getvalue()
+
+
+def two_colour_noise() -> Image.Image:
+    """Palette image that compresses better than its 8-bit grayscale re-encode"""
+    rng = random.Random(1)
+    image = Image.new("RGB", (120, 40))
+    image.putdata([rng.choice([(255, 0, 0), (0, 0, 255)]) for _ in range(120 * 40)])
+    return image.quantize(2)
+
+
+def test_compact_source_is_still_converted_to_grayscale():
+    source = png_with_exif(two_colour_noise())
+    prepared = make_preprocessor().process(source, "text")
+
+    assert prepared.data != source
+    image = Image.open(io.BytesIO(prepared.data))
+    assert image.mode == "L"
+    assert not image.getexif()
+
+
+def test_compact_source_is_sent_without_metadata():
+    source = png_with_exif(Image.new("RGB", (60, 20), (200, 10, 10)))
+    prepared = make_preprocessor().process(source, "image")
+
+    assert prepared.mime_type == "image/jpeg"
+    assert not Image.open(io.BytesIO(prepared.data)).getexif()
+
+
+def test_fingerprint_changes_with_settings():
+    assert make_preprocessor().fingerprint() != make_preprocessor(enabled=False).fingerprint()
+    other = ImagePreprocessor({"text": 200}, ["text"], 80)
+    assert other.fingerprint() != make_preprocessor().fingerprint()
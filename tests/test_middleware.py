@@ -0,0 +1,48 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import BaseModel
+from app.core.middleware import MaxBodySizeMiddleware
+
+LIMIT = 1000
+
+
+class Payload(BaseModel):
+    image_base64: str
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(MaxBodySizeMiddleware, max_bytes=LIMIT)
+
+    @app.post("/json")
+    async def json_route(payload: Payload):
+        return {"length": len(payload.image_base64)}
+
+    return TestClient(app)
+
+
+def chunked(size: int):
+    """A JSON body sent in chunks with no Content-Length"""
+    yield b'{"image_base64": "'
+    for _ in range(size // 100):
+        yield b"A" * 100
+    yield b'"}'
+
+
+def test_body_within_limit_passes():
+    response = make_client().post("/json", json={"image_base64": "A" * 100})
+    assert response.status_code == 200
+    assert response.json() == {"length": 100}
+
+
+def test_declared_oversized_body_is_rejected():
+    response = make_client().post("/json", json={"image_base64": "A" * (LIMIT * 2)})
+    assert response.status_code == 413
+
+
+def test_chunked_oversized_json_body_is_rejected_with_413():
+    response = make_client().post(
+        "/json", content=chunked(LIMIT * 5), headers={"content-type": "application/json"}
+    )
+    assert response.status_code == 413
+    assert "exceeds maximum size" in response.json()["detail"]
@@ -0,0 +1,170 @@
+import asyncio
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, select, text
+from app.models.database import Base, Subscription, User
+from app.services import quota_service as quota_module
+from app.services.quota_service import QuotaExceeded, QuotaPlan, QuotaService, dedupe_subscriptions
+
+PLAN = QuotaPlan(
+    subscription_id=1,
+    plan_type="free",
+    status="active",
+    solves_limit=3,
+    solves_used=0,
+    period_start=datetime(2026, 10, 1),
+    period_end=datetime(2099, 11, 1),
+)
+
+
+@pytest.fixture
+def service(monkeypatch, fake_redis):
+    monkeypatch.setattr(quota_module, "get_redis", lambda: fake_redis)
+    service = QuotaService(plan_ttl_seconds=60, reconcile_interval_seconds=60)
+
+    async def get_plan(user_id):
+        return PLAN
+
+    monkeypatch.setattr(service, "get_plan", get_plan)
+    return service
+
+
+def test_reserve_stops_at_limit(service):
+    async def run():
+        used = [(await service.reserve(1))[1] for _ in range(3)]
+        with pytest.raises(QuotaExceeded):
+            await service.reserve(1)
+        return used
+
+    assert asyncio.run(run()) == [1, 2, 3]
+    assert service.denied == 1
+
+
+def test_release_frees_a_reservation_at_the_limit(service):
+    async def run():
+        for _ in range(3):
+            await service.reserve(1)
+        await service.release(PLAN)
+        _, used = await service.reserve(1)
+        return used
+
+    assert asyncio.run(run()) == 3
+
+
+def test_batch_reservation_is_all_or_nothing(service):
+    async def run():
+        await service.reserve(1, 2)
+        with pytest.raises(QuotaExceeded):
+            await service.reserve(1, 2)
+        return await service.current_usage(PLAN)
+
+    assert asyncio.run(run()) == 2
+
+
+def test_release_never_goes_below_zero(service):
+    async def run():
+        await service.reserve(1)
+        await service.release(PLAN, 5)
+        return await service.current_usage(PLAN)
+
+    assert asyncio.run(run()) == 0
+
+
+def test_counter_is_seeded_from_database_usage(service, monkeypatch):
+    async def get_plan(user_id):
+        return PLAN._replace(solves_used=2)
+
+    monkeypatch.setattr(service, "get_plan", get_plan)
+
+    async def run():
+        _, used = await service.reserve(1)
+        with pytest.raises(QuotaExceeded):
+            await service.reserve(1)
+        return used
+
+    assert asyncio.run(run()) == 3
+
+
+@pytest.fixture
+def leased(monkeypatch, app_client, api_key):
+    """Service without Redis against the app's database, counting sessions opened"""
+    monkeypatch.setattr(quota_module.settings, "free_tier_limit", 7)
+    monkeypatch.setattr(quota_module, "get_redis", lambda: None)
+    sessions = []
+    session_factory = quota_module.get_async_session_factory()
+
+    def counting_factory():
+        sessions.append(1)
+        return session_factory()
+
+    monkeypatch.setattr(quota_module, "get_async_session_factory", lambda: counting_factory)
+    service = QuotaService(plan_ttl_seconds=60, reconcile_interval_seconds=60, lease_size=5)
+    _, user_id, _ = api_key
+    return service, user_id, sessions, app_client.portal.call
+
+
+def test_leased_reservations_skip_the_database(leased):
+    service, user_id, sessions, call = leased
+
+    async def run():
+        await service.get_plan(user_id)
+        del sessions[:]
+        used = [(await service.reserve(user_id))[1] for _ in range(5)]
+        await service.release(await service.get_plan(user_id))
+        return used
+
+    assert call(run) == [1, 2, 3, 4, 5]
+    # One lease for five reservations, and the release stayed in memory
+    assert len(sessions) == 1
+
+
+def test_leases_shrink_to_fit_the_limit(leased):
+    service, user_id, _, call = leased
+
+    async def run():
+        used = [(await service.reserve(user_id))[1] for _ in range(7)]
+        with pytest.raises(QuotaExceeded):
+            await service.reserve(user_id)
+        return used
+
+    assert call(run) == [1, 2, 3, 4, 5, 6, 7]
+
+
+def test_reconcile_returns_unused_leases(leased):
+    service, user_id, _, call = leased
+
+    async def run():
+        plan, _ = await service.reserve(user_id, 2)
+        await service.reconcile()
+        fresh = QuotaService(plan_ttl_seconds=60, reconcile_interval_seconds=60, lease_size=5)
+        return await fresh.current_usage(plan)
+
+    assert call(run) == 2
+    assert service.stats()["leased_free"] == 0
+
+
+def test_dedupe_expires_only_surplus_free_subscriptions():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # As left behind by the old first-request race, before the unique index existed
+        conn.execute(text("DROP INDEX uq_subscriptions_user_active"))
+        conn.execute(User.__table__.insert(), [{"id": i, "email": f"u{i}@example.com"} for i in (1, 2, 3)])
+        conn.execute(Subscription.__table__.insert(), [
+            {"id": 1, "user_id": 1, "plan_type": "free", "status": "active"},
+            {"id": 2, "user_id": 1, "plan_type": "free", "status": "active"},
+            {"id": 3, "user_id": 2, "plan_type": "free", "status": "active"},
+            {"id": 4, "user_id": 2, "plan_type": "pro", "status": "active"},
+            {"id": 5, "user_id": 3, "plan_type": "basic", "status": "active"},
+            {"id": 6, "user_id": 3, "plan_type": "pro", "status": "active"},
+        ])
+
+    assert dedupe_subscriptions(engine, dry_run=True) == ([1, 3], [3])
+    expired, review = dedupe_subscriptions(engine)
+    assert (expired, review) == ([1, 3], [3])
+    with engine.connect() as conn:
+        active = conn.execute(
+            select(Subscription.id).where(Subscription.status == "active").order_by(Subscription.id)
+        ).scalars().all()
+    # Both paid plans of user 3 are left for a person to sort out
+    assert active == [2, 4, 5, 6]
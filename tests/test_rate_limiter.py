@@ -0,0 +1,77 @@
+import asyncio
+import time
+from app.services.rate_limiter import RedisRateLimiter, TokenBucketLimiter
+
+LIMITS = [(5, 60), (100, 3600)]
+
+
+def test_gcra_allows_burst_then_rejects(fake_redis):
+    limiter = RedisRateLimiter(fake_redis)
+
+    async def run():
+        return [await limiter.hit("key", LIMITS) for _ in range(6)]
+
+    results = asyncio.run(run())
+    assert [result.allowed for result in results] == [True] * 5 + [False]
+    assert [result.remaining for result in results[:5]] == [4, 3, 2, 1, 0]
+    # One request is re-admitted every period / limit seconds
+    denied = results[-1]
+    assert denied.limit == 5
+    assert 11 < denied.retry_after <= 12
+    assert denied.headers()["Retry-After"] == "12"
+
+
+def test_gcra_denied_requests_do_not_consume_quota(fake_redis):
+    limiter = RedisRateLimiter(fake_redis)
+
+    async def run():
+        for _ in range(20):
+            await limiter.hit("key", LIMITS)
+        return float(await fake_redis.get("ratelimit:key:3600"))
+
+    # The hourly window only advanced by the five admitted requests, 36 s each
+    assert abs(asyncio.run(run()) - time.time() - 5 * 36) < 2
+
+
+def test_gcra_keys_are_independent(fake_redis):
+    limiter = RedisRateLimiter(fake_redis)
+
+    async def run():
+        for _ in range(5):
+            await limiter.hit("a", LIMITS)
+        return (await limiter.hit("a", LIMITS)).allowed, (await limiter.hit("b", LIMITS)).allowed
+
+    assert asyncio.run(run()) == (False, True)
+
+
+def test_token_bucket_allows_burst_then_rejects():
+    limiter = TokenBucketLimiter()
+    results = [limiter.hit("key", LIMITS) for _ in range(6)]
+    assert [result.allowed for result in results] == [True] * 5 + [False]
+    assert results[-1].headers()["Retry-After"] == "12"
+
+
+def test_gcra_cost_is_all_or_nothing(fake_redis):
+    limiter = RedisRateLimiter(fake_redis)
+
+    async def run():
+        first = await limiter.hit("key", LIMITS, cost=3)
+        too_many = await limiter.hit("key", LIMITS, cost=3)
+        rest = await limiter.hit("key", LIMITS, cost=2)
+        return first, too_many, rest
+
+    first, too_many, rest = asyncio.run(run())
+    assert (first.allowed, first.remaining) == (True, 2)
+    assert not too_many.allowed
+    # One more slot frees up every 12 s
+    assert 11 < too_many.retry_after <= 12
+    assert (rest.allowed, rest.remaining) == (True, 0)
+
+
+def test_token_bucket_cost_is_all_or_nothing():
+    limiter = TokenBucketLimiter()
+    assert limiter.hit("key", LIMITS, cost=3).remaining == 2
+    denied = limiter.hit("key", LIMITS, cost=3)
+    assert not denied.allowed
+    assert denied.headers()["Retry-After"] == "12"
+    assert limiter.hit("key", LIMITS, cost=2).allowed
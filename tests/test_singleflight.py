@@ -0,0 +1,144 @@
+import asyncio
+import base64
+import io
+import pytest
+from PIL import Image
+from app.services import gemini_service as gemini_module
+from app.services.gemini_service import GeminiService
+from app.services.singleflight import SingleFlight
+from app.services.solve_cache import SolveCache
+from app.services.solver_backends import StubBackend
+from app.services.solver_router import SolverRouter
+
+
+def png_bytes(shade: int) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        super().__init__(latency_ms=50)
+        self.calls = 0
+
+    async def solve(self, image, captcha_type):
+        self.calls += 1
+        return await super().solve(image, captcha_type)
+
+
+class CountingDownloader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.downloads = 0
+
+    async def download(self, url: str) -> bytes:
+        self.downloads += 1
+        await asyncio.sleep(0.05)
+        return self.data
+
+
+def test_concurrent_calls_share_one_run():
+    flights = SingleFlight()
+    runs = []
+
+    def work(key):
+        async def solve():
+            runs.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+        return solve
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", work("key")) for _ in range(5)), flights.do("other", work("other")))
+
+    assert asyncio.run(run()) == ["KEY"] * 5 + ["OTHER"]
+    assert runs == ["key", "other"]
+    assert flights.stats() == {"started": 2, "coalesced": 4, "in_flight": 0}
+
+
+def test_failure_is_shared_then_forgotten():
+    flights = SingleFlight()
+    attempts = 0
+
+    async def work():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise RuntimeError("upstream error")
+        return "ok"
+
+    async def run():
+        failed = await asyncio.gather(*(flights.do("key", work) for _ in range(3)), return_exceptions=True)
+        return failed, await flights.do("key", work)
+
+    failed, retried = asyncio.run(run())
+    assert all(isinstance(error, RuntimeError) for error in failed)
+    assert retried == "ok"
+    assert attempts == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_others():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        leaver = asyncio.ensure_future(flights.do("key", work))
+        stayer = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        leaver.cancel()
+        return await stayer
+
+    assert asyncio.run(run()) == "done"
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """A solve pipeline with an empty cache, a counting backend and a counting downloader"""
+    monkeypatch.setattr(gemini_module, "solve_cache", SolveCache(max_entries=100, ttl_seconds=60))
+    downloader = CountingDownloader(png_bytes(77))
+    monkeypatch.setattr(gemini_module, "image_downloader", downloader)
+    backend = CountingBackend()
+    service = GeminiService()
+    service.router = SolverRouter(
+        [backend],
+        alpha=0.3,
+        failure_threshold=5,
+        error_rate_threshold=0.5,
+        min_samples=10,
+        cooldown=30,
+        probe_interval=60,
+        hedge_budget=0.0,
+    )
+    return service, backend, downloader
+
+
+def test_identical_solves_share_one_download_and_model_call(service):
+    service, backend, downloader = service
+
+    async def run():
+        return await asyncio.gather(*(
+            service.solve_captcha(image_url="https://captcha.example/a.png") for _ in range(5)
+        ))
+
+    results = asyncio.run(run())
+    assert all(result.success for result in results)
+    assert len({result.solved_text for result in results}) == 1
+    assert downloader.downloads == 1
+    assert backend.calls == 1
+    assert service.coalescing_stats()["solves"]["coalesced"] == 4
+
+
+def test_different_images_are_not_coalesced(service):
+    service, backend, _ = service
+    images = [base64.b64encode(png_bytes(shade)).decode() for shade in (1, 2, 3)]
+
+    async def run():
+        return await asyncio.gather(*(service.solve_captcha(image_base64=image) for image in images))
+
+    assert all(result.success for result in asyncio.run(run()))
+    assert backend.calls == 3
@@ -0,0 +1,125 @@
+import asyncio
+import base64
+import io
+import pytest
+from PIL import Image
+from app.services import gemini_service as gemini_module
+from app.services import solve_cache as cache_module
+from app.services.gemini_service import GeminiService
+from app.services.solve_cache import SolveCache
+from app.services.solver_backends import StubBackend
+from app.services.solver_router import SolverRouter
+
+ANSWER = {"solved_text": "7YGK4", "confidence": None}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    async def solve(self, image, captcha_type):
+        self.calls += 1
+        return await super().solve(image, captcha_type)
+
+
+def png_base64(shade: int) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """A solve pipeline with its own empty cache and a backend that counts calls"""
+    monkeypatch.setattr(gemini_module, "solve_cache", SolveCache(max_entries=100, ttl_seconds=60))
+    backend = CountingBackend()
+    service = GeminiService()
+    service.router = SolverRouter(
+        [backend],
+        alpha=0.3,
+        failure_threshold=5,
+        error_rate_threshold=0.5,
+        min_samples=10,
+        cooldown=30,
+        probe_interval=60,
+        hedge_budget=0.0,
+    )
+    return service, backend
+
+
+def test_keys_depend_on_image_type_and_prompt():
+    key = SolveCache.make_key(b"image", "text", "1")
+    assert key == SolveCache.make_key(bytearray(b"image"), "text", "1")
+    assert key != SolveCache.make_key(b"other", "text", "1")
+    assert key != SolveCache.make_key(b"image", "math", "1")
+    assert key != SolveCache.make_key(b"image", "text", "2")
+
+
+def test_entries_expire_and_least_recently_used_are_evicted(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock.monotonic)
+    cache = SolveCache(max_entries=2, ttl_seconds=60)
+
+    async def run():
+        await cache.set("a", ANSWER)
+        await cache.set("b", ANSWER)
+        await cache.get("a")
+        await cache.set("c", ANSWER)
+        evicted = await cache.get("b")
+        clock.now += 61
+        return evicted, await cache.get("a")
+
+    assert asyncio.run(run()) == (None, None)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_results_are_shared_through_redis(monkeypatch, fake_redis):
+    monkeypatch.setattr(cache_module, "get_redis", lambda: fake_redis)
+    here = SolveCache(max_entries=10, ttl_seconds=60)
+    there = SolveCache(max_entries=10, ttl_seconds=60)
+
+    async def run():
+        await here.set("key", ANSWER)
+        return await there.get("key"), await fake_redis.ttl("key")
+
+    value, ttl = asyncio.run(run())
+    assert value == ANSWER
+    assert 0 < ttl <= 60
+    assert there.stats()["redis_hits"] == 1
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SolveCache(max_entries=10, ttl_seconds=60, enabled=False)
+
+    async def run():
+        await cache.set("key", ANSWER)
+        return await cache.get("key")
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_repeated_image_is_answered_from_the_cache(service):
+    service, backend = service
+    image = png_base64(41)
+
+    async def run():
+        first = await service.solve_captcha(image_base64=image)
+        second = await service.solve_captcha(image_base64=image)
+        other_type = await service.solve_captcha(image_base64=image, captcha_type="math")
+        return first, second, other_type
+
+    first, second, other_type = asyncio.run(run())
+    assert not first.cached and second.cached
+    assert second.solved_text == first.solved_text
+    assert not other_type.cached
+    assert backend.calls == 2
@@ -0,0 +1,175 @@
+import asyncio
+import time
+import pytest
+from app.services.image_preprocessor import PreparedImage
+from app.services.solver_backends import SolverBackend, StubBackend
+from app.services.solver_router import HEDGE_BURST, NoBackendAvailable, SolverRouter
+
+IMAGE = PreparedImage(b"captcha", "image/png", 160, 60)
+COOLDOWN = 0.05
+
+
+class FlakyBackend(SolverBackend):
+    """Fails while `failing` is set; counts calls"""
+
+    name = "flaky"
+
+    def __init__(self):
+        self.failing = False
+        self.calls = 0
+
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        self.calls += 1
+        if self.failing:
+            raise RuntimeError("upstream error")
+        return "FLAKY"
+
+
+class TailBackend(StubBackend):
+    """Answers at once, except for the next `slow` calls, which stall"""
+
+    name = "tail"
+
+    def __init__(self, stall: float):
+        super().__init__()
+        self.stall = stall
+        self.slow = 0
+
+    async def solve(self, image: PreparedImage, captcha_type: str) -> str:
+        if self.slow:
+            self.slow -= 1
+            await asyncio.sleep(self.stall)
+        return await super().solve(image, captcha_type)
+
+
+def make_router(backends, hedge_budget=0.0) -> SolverRouter:
+    return SolverRouter(
+        backends,
+        alpha=0.3,
+        failure_threshold=2,
+        error_rate_threshold=0.5,
+        min_samples=10,
+        cooldown=COOLDOWN,
+        probe_interval=60,
+        hedge_budget=hedge_budget,
+    )
+
+
+def state(router: SolverRouter, name: str) -> str:
+    return router.stats()["backends"][f"{name}:text"]["state"]
+
+
+def flaky_first_router():
+    """Router where the flaky backend has proven faster than the stub, so it is tried first"""
+    flaky = FlakyBackend()
+    router = make_router([flaky, StubBackend(latency_ms=5)])
+
+    async def warm_up():
+        for _ in range(3):
+            await router.solve(IMAGE, "text")
+
+    asyncio.run(warm_up())
+    flaky.failing = True
+    return flaky, router
+
+
+def test_failover_opens_circuit_and_skips_backend():
+    flaky, router = flaky_first_router()
+
+    async def run():
+        for _ in range(2):
+            assert (await router.solve(IMAGE, "text"))[1] == "stub"
+        assert state(router, "flaky") == "open"
+        assert (await router.solve(IMAGE, "text"))[1] == "stub"
+
+    asyncio.run(run())
+    assert flaky.calls == 5
+    assert router.failovers == 2
+
+
+def test_half_open_probe_closes_circuit_on_success():
+    flaky, router = flaky_first_router()
+
+    async def run():
+        for _ in range(2):
+            await router.solve(IMAGE, "text")
+        await asyncio.sleep(COOLDOWN * 1.5)
+        assert state(router, "flaky") == "half_open"
+        flaky.failing = False
+        return await router.solve(IMAGE, "text")
+
+    assert asyncio.run(run()) == ("FLAKY", "flaky")
+    assert state(router, "flaky") == "closed"
+
+
+def test_failed_half_open_probe_reopens_circuit():
+    flaky, router = flaky_first_router()
+
+    async def run():
+        for _ in range(2):
+            await router.solve(IMAGE, "text")
+        await asyncio.sleep(COOLDOWN * 1.5)
+        assert (await router.solve(IMAGE, "text"))[1] == "stub"
+        assert state(router, "flaky") == "open"
+        # Re-opened for a full cooldown, so the next request doesn't probe again
+        await router.solve(IMAGE, "text")
+
+    asyncio.run(run())
+    assert flaky.calls == 6
+
+
+def test_no_backend_for_open_circuits():
+    flaky = FlakyBackend()
+    router = make_router([flaky])
+    flaky.failing = True
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await router.solve(IMAGE, "text")
+        with pytest.raises(NoBackendAvailable):
+            await router.solve(IMAGE, "text")
+
+    asyncio.run(run())
+
+
+def test_hedge_answers_when_primary_stalls():
+    tail = TailBackend(stall=5.0)
+    router = make_router([tail], hedge_budget=1.0)
+
+    async def run():
+        for _ in range(100):
+            await router.solve(IMAGE, "text")
+        tail.slow = 1
+        started = time.perf_counter()
+        await router.solve(IMAGE, "text")
+        return time.perf_counter() - started
+
+    assert asyncio.run(run()) < 1.0
+    assert router.hedged == 1
+    assert router.hedge_wins == 1
+
+
+def test_hedge_budget_limits_hedged_fraction():
+    tail = TailBackend(stall=0.02)
+    router = make_router([tail], hedge_budget=0.25)
+
+    async def run():
+        for _ in range(100):
+            await router.solve(IMAGE, "text")
+        for _ in range(12):
+            tail.slow = 1
+            await router.solve(IMAGE, "text")
+
+    asyncio.run(run())
+    # HEDGE_BURST banked tokens plus 0.25 earned per solve, less what the cap and the last solves leave unspent
+    assert router.hedged == 7
+    assert router.hedged <= HEDGE_BURST + 0.25 * 12
+
+
+def test_backend_without_solve_cannot_be_instantiated():
+    class Incomplete(SolverBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
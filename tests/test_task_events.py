@@ -0,0 +1,127 @@
+import asyncio
+import json
+import pytest
+from app.api.v1 import events as events_module
+from app.core.config import settings
+from app.services import task_events as task_events_module
+from app.services.api_key_cache import CachedAPIKey, CachedUser
+from app.services.task_events import TaskEventBroker
+from app.services.task_queue import TaskQueue
+
+PRINCIPAL = (CachedUser(1, "a@example.com", True), CachedAPIKey(1, 1, "test"))
+
+
+class ClosedSession:
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = TaskEventBroker("test", max_pending=2)
+    monkeypatch.setattr(events_module, "solve_task_events", broker)
+    return broker
+
+
+def subscribers(broker: TaskEventBroker) -> int:
+    return broker.stats()["subscribers"]
+
+
+def test_response_that_is_never_sent_does_not_subscribe(broker):
+    async def run():
+        await events_module.stream_task_events(PRINCIPAL, ClosedSession())
+
+    asyncio.run(run())
+    assert subscribers(broker) == 0
+
+
+def test_stream_unsubscribes_when_the_body_is_dropped(broker):
+    async def run():
+        response = await events_module.stream_task_events(PRINCIPAL, ClosedSession())
+        body = response.body_iterator
+        assert await body.__anext__() == "retry: 3000\n\n"
+        opened = subscribers(broker)
+        await body.aclose()
+        return opened
+
+    assert asyncio.run(run()) == 1
+    assert subscribers(broker) == 0
+
+
+def test_slow_subscriber_is_told_what_it_missed(broker):
+    async def run():
+        response = await events_module.stream_task_events(PRINCIPAL, ClosedSession())
+        body = response.body_iterator
+        await body.__anext__()
+        for i in range(3):
+            await broker.publish({"id": f"t{i}", "owner": 1, "status": "completed"})
+        # Someone else's task never reaches this stream
+        await broker.publish({"id": "other", "owner": 2, "status": "completed"})
+        lagged = await body.__anext__()
+        await body.aclose()
+        return lagged
+
+    assert asyncio.run(run()) == 'event: lagged\ndata: {"task_ids": ["t2"]}\n\n'
+    assert broker.stats()["delivered"] == 2
+    assert broker.stats()["dropped"] == 1
+
+
+
+def test_finished_task_is_streamed_to_its_owner(broker):
+    async def handler(payload, blob):
+        return {"success": True, "solved_text": "7YGK4", "processing_time_ms": 5}
+
+    queue = TaskQueue("test", handler, max_queue=10, result_ttl_seconds=60, events=broker)
+
+    async def run():
+        response = await events_module.stream_task_events(PRINCIPAL, ClosedSession())
+        body = response.body_iterator
+        await body.__anext__()
+        await queue.start(1)
+        task = await queue.submit({}, owner=1)
+        event = await asyncio.wait_for(body.__anext__(), 5)
+        await body.aclose()
+        await queue.stop()
+        return task, event
+
+    task, event = asyncio.run(run())
+    kind, event_id, data = event.strip().split("\n")
+    assert kind == "event: task"
+    assert event_id == f"id: {task['id']}"
+    body = json.loads(data[len("data: "):])
+    assert body["status"] == "completed"
+    assert body["result"]["solved_text"] == "7YGK4"
+
+
+def test_idle_stream_sends_keepalives(broker, monkeypatch):
+    monkeypatch.setattr(settings, "task_stream_heartbeat_seconds", 0.01)
+
+    async def run():
+        response = await events_module.stream_task_events(PRINCIPAL, ClosedSession())
+        body = response.body_iterator
+        await body.__anext__()
+        keepalive = await body.__anext__()
+        await body.aclose()
+        return keepalive
+
+    assert asyncio.run(run()) == ": keepalive\n\n"
+
+
+def test_events_reach_subscribers_on_other_processes(monkeypatch, fake_redis):
+    monkeypatch.setattr(task_events_module, "get_redis", lambda: fake_redis)
+    publisher = TaskEventBroker("shared", max_pending=10)
+    listener = TaskEventBroker("shared", max_pending=10)
+
+    async def run():
+        await listener.start()
+        while (await fake_redis.pubsub_numsub(listener.channel))[0][1] == 0:
+            await asyncio.sleep(0.01)
+        subscription = listener.subscribe(1)
+        await publisher.publish({"id": "t1", "owner": 1, "status": "completed"})
+        task = await asyncio.wait_for(subscription.queue.get(), 5)
+        await listener.stop()
+        return task
+
+    assert asyncio.run(run())["id"] == "t1"
+    assert publisher.stats()["delivered"] == 0
+    assert listener.stats()["delivered"] == 1
@@ -0,0 +1,151 @@
+import asyncio
+import base64
+import io
+import time
+import pytest
+from PIL import Image
+from app.api.v1.captcha import solve_tasks
+from app.core.database import get_session_factory
+from app.services.auth_service import AuthService
+from app.services import task_queue as queue_module
+from app.services.task_queue import COMPLETED, FAILED, RUNNING, MemoryTaskBackend, QueueFull, TaskQueue, _new_task
+
+
+def png_base64(shade: int) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_memory_queue_is_bounded_by_bytes():
+    backend = MemoryTaskBackend(max_queue=100, result_ttl_seconds=60, max_queue_bytes=1000)
+
+    async def run():
+        await backend.push(_new_task(1), {}, b"x" * 600)
+        with pytest.raises(QueueFull):
+            await backend.push(_new_task(1), {"image_base64": "A" * 500}, None)
+        await backend.pop()
+        await backend.push(_new_task(1), {}, b"x" * 600)
+        return backend.queued_bytes()
+
+    assert asyncio.run(run()) == 600
+
+
+def test_stuck_running_task_does_not_block_expiry():
+    backend = MemoryTaskBackend(max_queue=100, result_ttl_seconds=60, running_timeout_seconds=120)
+    long_ago = time.time() - 3600
+    stuck = {**_new_task(1), "status": RUNNING, "started_at": long_ago}
+    running = {**_new_task(1), "status": RUNNING, "started_at": time.time()}
+    finished = {**_new_task(1), "status": COMPLETED, "started_at": long_ago, "finished_at": long_ago}
+
+    async def run():
+        for task in (stuck, running, finished):
+            await backend.save(task)
+        backend._expire()
+        return [await backend.get(task["id"]) for task in (stuck, running, finished)]
+
+    stuck_now, running_now, finished_now = asyncio.run(run())
+    assert stuck_now["status"] == FAILED and stuck_now["error"] == "Task timed out"
+    assert running_now["status"] == RUNNING
+    assert finished_now is None
+
+
+def test_tasks_run_and_can_be_awaited():
+    async def handler(payload, blob):
+        return {"echo": payload["value"], "blob": len(blob)}
+
+    queue = TaskQueue("test", handler, max_queue=10, result_ttl_seconds=60)
+
+    async def run():
+        await queue.start(1)
+        task = await queue.submit({"value": "hi"}, blob=b"abc", owner=1)
+        finished = await queue.wait(task["id"], 5)
+        await queue.stop()
+        return finished
+
+    finished = asyncio.run(run())
+    assert finished["status"] == COMPLETED
+    assert finished["result"] == {"echo": "hi", "blob": 3}
+    assert queue.stats()["completed"] == 1
+
+
+def test_full_queue_answers_503(app_client, api_key, monkeypatch):
+    headers, _, _ = api_key
+    monkeypatch.setattr(solve_tasks._get_backend(), "max_queue_bytes", 10)
+    response = app_client.post(
+        "/api/v1/solve/url", params={"mode": "async"}, json={"image_base64": "A" * 100}, headers=headers
+    )
+    assert response.status_code == 503
+
+
+def test_handler_errors_fail_the_task():
+    async def handler(payload, blob):
+        raise RuntimeError("upstream error")
+
+    queue = TaskQueue("test", handler, max_queue=10, result_ttl_seconds=60)
+
+    async def run():
+        await queue.start(1)
+        task = await queue.submit({}, owner=1)
+        finished = await queue.wait(task["id"], 5)
+        await queue.stop()
+        return finished
+
+    finished = asyncio.run(run())
+    assert finished["status"] == FAILED
+    assert finished["error"] == "upstream error"
+    assert queue.stats()["failed"] == 1
+
+
+def test_redis_queue_is_shared_between_processes(monkeypatch, fake_redis):
+    monkeypatch.setattr(queue_module, "get_redis", lambda: fake_redis)
+
+    async def handler(payload, blob):
+        return {"echo": payload["value"], "blob": blob.decode()}
+
+    api = TaskQueue("shared", handler, max_queue=2, result_ttl_seconds=60, poll_interval_seconds=0.05)
+    worker = TaskQueue("shared", handler, max_queue=2, result_ttl_seconds=60)
+
+    async def run():
+        task = await api.submit({"value": "hi"}, blob=b"abc", owner=1)
+        await api.submit({"value": "second"}, owner=1)
+        with pytest.raises(QueueFull):
+            await api.submit({"value": "third"}, owner=1)
+
+        await worker.start(1)
+        finished = await api.wait(task["id"], 5)
+        await worker.stop()
+        leftovers = await fake_redis.keys(f"tasks:shared:payload:{task['id']}")
+        return finished, leftovers
+
+    finished, leftovers = asyncio.run(run())
+    assert finished["status"] == COMPLETED
+    assert finished["result"] == {"echo": "hi", "blob": "abc"}
+    assert leftovers == []
+    assert api.stats()["rejected"] == 1
+
+
+def test_async_solve_is_polled_by_its_owner_only(app_client, api_key):
+    headers, _, _ = api_key
+    response = app_client.post(
+        "/api/v1/solve/url", params={"mode": "async"}, json={"image_base64": png_base64(70)}, headers=headers
+    )
+    assert response.status_code == 202
+    task_id = response.json()["task_id"]
+    assert response.headers["Location"] == f"/api/v1/solve/tasks/{task_id}"
+
+    response = app_client.get(f"/api/v1/solve/tasks/{task_id}", params={"wait": 5}, headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "completed"
+    assert body["result"]["success"] and body["result"]["solved_text"]
+
+    auth_service = AuthService()
+    db = get_session_factory()()
+    try:
+        other = auth_service.create_user(db, f"other-{task_id}@example.com", "password1")
+        other_key, _ = auth_service.create_api_key(db, other.id, "test")
+    finally:
+        db.close()
+    response = app_client.get(f"/api/v1/solve/tasks/{task_id}", headers={"X-API-Key": other_key})
+    assert response.status_code == 404
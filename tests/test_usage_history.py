@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+from datetime import datetime
+import pytest
+from app.core.database import get_session_factory
+from app.models.database import UsageRecord
+from app.services.auth_service import AuthService
+from app.services.usage_history import HistoryFilters, decode_cursor, encode_cursor, export_history
+
+# Two records share each timestamp, so pages must break ties by id
+TIMES = [datetime(2026, 3, 1, 12, minute) for minute in (0, 0, 5, 5, 10, 10, 15)]
+
+
+@pytest.fixture
+def history(api_key):
+    """Seven records for the test user, one for somebody else; returns (auth headers, ids newest first)"""
+    _, user_id, key_id = api_key
+    db = get_session_factory()()
+    try:
+        records = [
+            UsageRecord(user_id=user_id, api_key_id=key_id, captcha_type="math" if i % 3 == 0 else "text",
+                        success=i % 2 == 0, response_time_ms=100 + i, created_at=created_at)
+            for i, created_at in enumerate(TIMES)
+        ]
+        db.add_all(records + [UsageRecord(user_id=user_id + 1000, api_key_id=key_id, captcha_type="text",
+                                          success=True, response_time_ms=1, created_at=TIMES[0])])
+        db.commit()
+        newest_first = [record.id for record in sorted(records, key=lambda r: (r.created_at, r.id), reverse=True)]
+    finally:
+        db.close()
+    token = AuthService().create_access_token(data={"sub": str(user_id)})
+    return {"Authorization": f"Bearer {token}"}, user_id, newest_first
+
+
+def pages(app_client, headers, **params):
+    ids, cursor = [], None
+    while True:
+        query = dict(params, **({"cursor": cursor} if cursor else {}))
+        response = app_client.get("/api/v1/usage/history", params=query, headers=headers)
+        assert response.status_code == 200
+        body = response.json()
+        ids.append([record["id"] for record in body["records"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 15, 123456)
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+def test_pages_cover_every_record_once_newest_first(app_client, history):
+    headers, _, newest_first = history
+    assert pages(app_client, headers, limit=2) == [newest_first[0:2], newest_first[2:4], newest_first[4:6], newest_first[6:]]
+    assert pages(app_client, headers, limit=7) == [newest_first]
+
+
+def test_filters_apply_across_pages(app_client, history):
+    headers, _, newest_first = history
+    failed = [record_id for i, record_id in enumerate(reversed(newest_first)) if i % 2 == 1][::-1]
+    assert sum(pages(app_client, headers, limit=2, success="false"), []) == failed
+    since = sum(pages(app_client, headers, limit=2, start="2026-03-01T12:05:00"), [])
+    assert since == newest_first[:5]
+
+
+def test_malformed_cursor_is_refused(app_client, history):
+    headers, _, _ = history
+    response = app_client.get("/api/v1/usage/history", params={"cursor": "not-a-cursor"}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_export_streams_every_record(app_client, history):
+    headers, _, newest_first = history
+
+    response = app_client.get("/api/v1/usage/history/export", headers=headers)
+    assert response.status_code == 200
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == newest_first
+
+    response = app_client.get("/api/v1/usage/history/export", params={"format": "csv"}, headers=headers)
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [int(row["id"]) for row in rows] == newest_first
+    assert rows[-1]["created_at"] == TIMES[0].isoformat()
+
+
+def test_export_continues_past_chunk_boundaries(app_client, history):
+    _, user_id, newest_first = history
+
+    async def collect():
+        return [chunk async for chunk in export_history(user_id, HistoryFilters(), "ndjson", chunk_size=3)]
+
+    chunks = app_client.portal.call(collect)
+    assert [len(chunk.splitlines()) for chunk in chunks] == [3, 3, 1]
+    assert [json.loads(line)["id"] for chunk in chunks for line in chunk.splitlines()] == newest_first
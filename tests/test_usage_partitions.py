@@ -0,0 +1,96 @@
+import csv
+import gzip
+import os
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, func, select
+from app.models.database import Base, UsageRecord
+from app.services import usage_partitions
+from app.services.usage_partitions import apply_retention, archive_rows
+
+CUTOFF = datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/usage.db")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(UsageRecord.__table__.insert(), [
+            {"user_id": 1, "api_key_id": 1, "captcha_type": "text", "success": True,
+             "response_time_ms": 10, "created_at": datetime(2025, month, 1)}
+            for month in (1, 2, 3, 4, 5)
+        ] + [
+            {"user_id": 1, "api_key_id": 1, "captcha_type": "text", "success": True,
+             "response_time_ms": 10, "created_at": datetime(2026, 2, 1)}
+        ])
+    return engine
+
+
+def remaining(engine) -> int:
+    with engine.connect() as conn:
+        return conn.execute(select(func.count()).select_from(UsageRecord.__table__)).scalar()
+
+
+def read_archives(directory) -> list:
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        with gzip.open(os.path.join(directory, name), "rt", newline="") as archive:
+            rows.extend(list(csv.reader(archive))[1:])
+    return rows
+
+
+def test_old_rows_are_archived_then_deleted(engine, tmp_path):
+    archive_dir = tmp_path / "archives"
+    assert archive_rows(engine, CUTOFF, str(archive_dir), chunk_size=2) == 5
+    assert remaining(engine) == 1
+    assert os.listdir(archive_dir) == ["usage_records_before_2026_01_from_1.csv.gz"]
+    assert [row[0] for row in read_archives(archive_dir)] == ["1", "2", "3", "4", "5"]
+
+
+def test_large_runs_are_split_across_files(engine, tmp_path):
+    archive_dir = tmp_path / "archives"
+    assert archive_rows(engine, CUTOFF, str(archive_dir), chunk_size=1, file_rows=2) == 5
+    assert len(os.listdir(archive_dir)) == 3
+    assert len(read_archives(archive_dir)) == 5
+
+
+def test_failure_mid_file_keeps_rows_and_leaves_no_archive(engine, tmp_path, monkeypatch):
+    archive_dir = tmp_path / "archives"
+    real_writer = csv.writer
+
+    class FailingWriter:
+        def __init__(self, archive):
+            self.writer = real_writer(archive)
+            self.chunks = 0
+
+        def writerow(self, row):
+            self.writer.writerow(row)
+
+        def writerows(self, rows):
+            self.chunks += 1
+            if self.chunks == 2:
+                raise OSError("disk full")
+            self.writer.writerows(rows)
+
+    monkeypatch.setattr(usage_partitions.csv, "writer", FailingWriter)
+    with pytest.raises(OSError):
+        archive_rows(engine, CUTOFF, str(archive_dir), chunk_size=2)
+    assert remaining(engine) == 6
+    assert os.listdir(archive_dir) == []
+
+
+def test_retention_on_sqlite_archives_rows(engine, tmp_path):
+    archived = apply_retention(engine, 12, str(tmp_path / "archives"), now=datetime(2026, 6, 15))
+    # The cutoff is June 2025, so January to May 2025 go
+    assert archived == 5
+    assert remaining(engine) == 1
+
+
+def test_sqlite_maintenance_runs_in_one_worker_at_a_time(engine, tmp_path, monkeypatch):
+    monkeypatch.setattr(usage_partitions.settings, "usage_archive_dir", str(tmp_path / "archives"))
+    with usage_partitions._maintenance_lock(engine) as first:
+        with usage_partitions._maintenance_lock(engine) as second:
+            assert (first, second) == (True, False)
+    with usage_partitions._maintenance_lock(engine) as again:
+        assert again
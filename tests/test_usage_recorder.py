@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+from app.services import usage_recorder as recorder_module
+from app.services.usage_recorder import UsageRecorder
+
+
+class FakeSession:
+    """Stands in for an AsyncSession; inserts land in `database.rows` unless it is down"""
+
+    def __init__(self, database):
+        self.database = database
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement, rows):
+        if self.database.on_execute:
+            self.database.on_execute()
+        if self.database.down:
+            raise ConnectionError("database unavailable")
+        self.database.rows.extend(rows)
+
+    async def commit(self):
+        pass
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.rows = []
+        self.down = False
+        self.on_execute = None
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+
+    async def apply_rollups(db, rows):
+        pass
+
+    monkeypatch.setattr(recorder_module, "get_async_session_factory", lambda: lambda: FakeSession(database))
+    monkeypatch.setattr(recorder_module, "apply_rollups", apply_rollups)
+    return database
+
+
+def record(recorder: UsageRecorder, count: int) -> None:
+    for _ in range(count):
+        recorder.record(user_id=1, api_key_id=1, captcha_type="text", success=True, response_time_ms=10)
+
+
+def test_failed_flush_is_requeued_and_retried(database):
+    recorder = UsageRecorder(batch_size=10, flush_interval_ms=1000, max_queue=100, max_backoff_ms=30000)
+    record(recorder, 3)
+    database.down = True
+    asyncio.run(recorder.flush())
+    assert recorder.stats()["queued"] == 3
+    assert recorder.requeued == 3 and recorder.failed == 0
+
+    database.down = False
+    asyncio.run(recorder.flush())
+    assert len(database.rows) == 3
+    assert recorder.stats()["queued"] == 0
+
+
+def test_requeue_is_bounded_by_max_queue(database):
+    recorder = UsageRecorder(batch_size=10, flush_interval_ms=1000, max_queue=4, max_backoff_ms=30000)
+    record(recorder, 3)
+    database.down = True
+    # Three more records arrive while the failing insert is in flight
+    database.on_execute = lambda: record(recorder, 3)
+    asyncio.run(recorder.flush())
+    assert recorder.stats()["queued"] == 4
+    assert recorder.requeued == 1 and recorder.failed == 2
+
+
+def test_backoff_doubles_up_to_the_cap(database):
+    recorder = UsageRecorder(batch_size=10, flush_interval_ms=1000, max_queue=100, max_backoff_ms=3000)
+    record(recorder, 1)
+    database.down = True
+    backoffs = []
+    for _ in range(4):
+        asyncio.run(recorder.flush())
+        backoffs.append(recorder._backoff)
+    assert backoffs == [1.0, 2.0, 3.0, 3.0]
+
+    database.down = False
+    asyncio.run(recorder.flush())
+    assert recorder._backoff == 0.0
@@ -0,0 +1,80 @@
+import base64
+import io
+from datetime import datetime
+from PIL import Image
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app.models.database import Base, UsageRecord, UsageRollup
+from app.services.auth_service import AuthService
+from app.services.usage_recorder import usage_recorder
+from app.services.usage_rollups import backfill, rollup_deltas
+
+
+def usage(created_at: datetime, success: bool = True, response_time_ms: int = 200, captcha_type: str = "text") -> dict:
+    return {"user_id": 1, "api_key_id": 1, "captcha_type": captcha_type, "success": success,
+            "response_time_ms": response_time_ms, "created_at": created_at}
+
+
+def png_base64(shade: int) -> str:
+    buffer = io.BytesIO()
+    Image.new("RGB", (160, 60), (shade, shade, shade)).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def by_bucket(deltas) -> dict:
+    return {(delta["granularity"], delta["bucket_start"], delta["captcha_type"]): delta for delta in deltas}
+
+
+def test_rows_are_counted_into_hour_and_day_buckets():
+    deltas = by_bucket(rollup_deltas([
+        usage(datetime(2026, 3, 1, 9, 15), response_time_ms=80),
+        usage(datetime(2026, 3, 1, 9, 45), success=False, response_time_ms=6000),
+        usage(datetime(2026, 3, 1, 14, 5), response_time_ms=300),
+        usage(datetime(2026, 3, 1, 14, 6), captcha_type="math"),
+    ]))
+
+    nine = deltas[("hour", datetime(2026, 3, 1, 9), "text")]
+    assert (nine["total_count"], nine["success_count"], nine["latency_sum_ms"]) == (2, 1, 6080)
+    assert nine["latency_le_100"] == nine["latency_gt_5000"] == 1
+    day = deltas[("day", datetime(2026, 3, 1), "text")]
+    assert (day["total_count"], day["success_count"], day["latency_le_500"]) == (3, 2, 1)
+    assert deltas[("day", datetime(2026, 3, 1), "math")]["total_count"] == 1
+    assert len(deltas) == 5
+
+
+def test_backfill_rebuilds_rollups_from_records():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    rows = [usage(datetime(2026, 3, day, hour)) for day in (1, 2) for hour in (8, 9, 10)]
+    with Session(engine) as db:
+        db.execute(UsageRecord.__table__.insert(), rows)
+        db.commit()
+
+        assert backfill(db, chunk_size=4) == 6
+        # A second run replaces the buckets instead of adding to them
+        assert backfill(db, chunk_size=4) == 6
+        days = db.execute(
+            select(UsageRollup.bucket_start, UsageRollup.total_count)
+            .where(UsageRollup.granularity == "day")
+            .order_by(UsageRollup.bucket_start)
+        ).all()
+        hours = db.execute(select(UsageRollup).where(UsageRollup.granularity == "hour")).all()
+    assert days == [(datetime(2026, 3, 1), 3), (datetime(2026, 3, 2), 3)]
+    assert len(hours) == 6
+
+
+def test_stats_are_served_from_rollups(app_client, api_key):
+    headers, user_id, _ = api_key
+    token = AuthService().create_access_token(data={"sub": str(user_id)})
+    for shade in (101, 102, 103):
+        response = app_client.post(
+            "/api/v1/solve/", data={"image_base64": png_base64(shade), "captcha_type": "text"}, headers=headers
+        )
+        assert response.status_code == 200
+    app_client.portal.call(usage_recorder.flush)
+
+    response = app_client.get("/api/v1/usage/stats", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    stats = response.json()
+    assert (stats["total_solves"], stats["successful_solves"], stats["failed_solves"]) == (3, 3, 0)
+    assert stats["solves_this_month"] == 3